@@ -0,0 +1,22 @@
+"""
+Миграция 000: Базовая схема
+
+Создает отсутствующие таблицы по моделям. На существующей базе ничего не
+меняет, на новой - создает схему целиком (последующие миграции пропускают
+уже существующие колонки и индексы).
+"""
+from services.schema_migrations import create_all
+
+
+def upgrade():
+    """
+    Создает таблицы, которых еще нет в базе
+    """
+    return [create_all()]
+
+
+def downgrade():
+    """
+    Базовую схему не удаляем
+    """
+    return []
@@ -1,23 +1,22 @@
-"""add_content_html_to_news_items
-
-Revision ID: 002
-Revises: 001
-Create Date: 2025-07-26 21:00:00.000000
-
 """
-from alembic import op
-import sqlalchemy as sa
+Миграция 002: HTML-версия текста новости
+"""
+from services.schema_migrations import add_column, drop_column
 
-# revision identifiers
-revision = '002'
-down_revision = '001'
-branch_labels = None
-depends_on = None
 
 def upgrade():
-    # Добавляем колонку content_html в таблицу news_items
-    op.add_column('news_items', sa.Column('content_html', sa.Text(), nullable=True))
+    """
+    Добавляет колонку content_html в таблицу news_items
+    """
+    return [
+        add_column('news_items', 'content_html', 'TEXT'),
+    ]
+
 
 def downgrade():
-    # Удаляем колонку content_html
-    op.drop_column('news_items', 'content_html') 
\ No newline at end of file
+    """
+    Удаляет колонку content_html
+    """
+    return [
+        drop_column('news_items', 'content_html'),
+    ]
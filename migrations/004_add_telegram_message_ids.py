@@ -0,0 +1,22 @@
+"""
+Миграция 004: Хранение всех ID сообщений поста (альбомы публикуются через sendMediaGroup)
+"""
+from services.schema_migrations import add_column, drop_column
+
+
+def upgrade():
+    """
+    Добавляет колонку со списком ID сообщений, из которых состоит пост в канале
+    """
+    return [
+        add_column('news_items', 'telegram_message_ids', 'JSON'),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет добавленное поле
+    """
+    return [
+        drop_column('news_items', 'telegram_message_ids'),
+    ]
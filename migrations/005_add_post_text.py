@@ -0,0 +1,24 @@
+"""
+Миграция 005: Готовый текст поста для канала и причина отбраковки
+"""
+from services.schema_migrations import add_column, drop_column
+
+
+def upgrade():
+    """
+    Добавляет колонки с заранее отрендеренным текстом поста
+    """
+    return [
+        add_column('news_items', 'post_text', 'TEXT'),
+        add_column('news_items', 'post_render_error', 'VARCHAR(255)'),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет добавленные поля
+    """
+    return [
+        drop_column('news_items', 'post_text'),
+        drop_column('news_items', 'post_render_error'),
+    ]
@@ -0,0 +1,22 @@
+"""
+Миграция 006: Канал, в который опубликована новость (публикация в несколько каналов)
+"""
+from services.schema_migrations import add_column, drop_column
+
+
+def upgrade():
+    """
+    Добавляет колонку с ID канала публикации
+    """
+    return [
+        add_column('news_items', 'telegram_chat_id', 'VARCHAR(255)'),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет добавленное поле
+    """
+    return [
+        drop_column('news_items', 'telegram_chat_id'),
+    ]
@@ -0,0 +1,31 @@
+"""
+Миграция 007: Индексы ленты и очереди публикации, заполнение пустых значений
+
+Индексы строятся через CREATE INDEX CONCURRENTLY (запись в news_items не
+блокируется), пустые views_count и is_published_to_channel заполняются
+пакетами: строки с NULL не попадали в очередь публикации, а счетчик просмотров
+не увеличивался в SQL-выражениях.
+"""
+from services.schema_migrations import create_index, drop_index, backfill
+
+
+def upgrade():
+    """
+    Добавляет индексы и заполняет старые строки
+    """
+    return [
+        create_index('ix_news_items_category_publish_date', 'news_items', ['category', 'publish_date']),
+        create_index('ix_news_items_unpublished', 'news_items', ['is_published_to_channel', 'publish_date']),
+        backfill('news_items', 'views_count = 0', where='views_count IS NULL'),
+        backfill('news_items', 'is_published_to_channel = FALSE', where='is_published_to_channel IS NULL'),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет индексы (заполненные значения остаются)
+    """
+    return [
+        drop_index('ix_news_items_unpublished'),
+        drop_index('ix_news_items_category_publish_date'),
+    ]
@@ -0,0 +1,54 @@
+"""
+Миграция 008: Вынос текста новости в таблицу news_bodies (этап expand)
+
+content и content_html занимают большую часть строки news_items, хотя лента их
+не показывает. Текст переносится в news_bodies (один к одному по news_id) и
+читается только карточкой новости и публикацией, а для ленты в news_items
+остается короткий анонс summary. Копирование и заполнение анонса идут пакетами
+по ID.
+
+Колонки в news_items пока остаются (без NOT NULL): во время раскатки воркеры
+прошлой версии читают и пишут текст там, а новая версия пишет текст в оба места
+(NEWS_BODY_DUAL_WRITE). Колонки удаляет миграция 011 после раскатки.
+"""
+from db import make_summary
+from services.schema_migrations import add_column, drop_column, drop_not_null, backfill, backfill_with, copy_rows
+
+BODY_SQL = "(SELECT b.content FROM news_bodies b WHERE b.news_id = news_items.id)"
+
+
+def upgrade():
+    """
+    Создает news_bodies, копирует тексты и заполняет анонсы
+    """
+    return [
+        "CREATE TABLE IF NOT EXISTS news_bodies ("
+        "news_id INTEGER PRIMARY KEY REFERENCES news_items (id) ON DELETE CASCADE, "
+        "content TEXT NOT NULL, "
+        "content_html TEXT)",
+        add_column('news_items', 'summary', 'VARCHAR(300)'),
+        # Новая версия вставляет новость без текста и дописывает его после news_bodies
+        drop_not_null('news_items', 'content', 'TEXT'),
+        copy_rows('news_items', 'news_bodies', ['content', 'content_html'], target_key='news_id'),
+        # Анонс той же функцией, что и при сохранении новости
+        backfill_with('news_items', 'summary', BODY_SQL, make_summary, where='summary IS NULL'),
+    ]
+
+
+def downgrade():
+    """
+    Возвращает тексты в news_items и удаляет news_bodies
+    """
+    return [
+        # Колонки могло удалить прежнее издание этой миграции
+        add_column('news_items', 'content', 'TEXT'),
+        add_column('news_items', 'content_html', 'TEXT'),
+        backfill(
+            'news_items',
+            "content = COALESCE((SELECT b.content FROM news_bodies b WHERE b.news_id = news_items.id), ''), "
+            "content_html = (SELECT b.content_html FROM news_bodies b WHERE b.news_id = news_items.id)",
+            where='content IS NULL'
+        ),
+        drop_column('news_items', 'summary'),
+        "DROP TABLE IF EXISTS news_bodies",
+    ]
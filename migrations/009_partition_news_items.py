@@ -0,0 +1,36 @@
+"""
+Миграция 009: Помесячное секционирование news_items на PostgreSQL
+
+Выполняется только при PARTITIONING_ENABLED=true на PostgreSQL, иначе
+откладывается и не записывается в schema_version: после включения флага ее
+применит следующий upgrade. Таблица копируется пакетами и подменяется под
+короткой блокировкой - см. services/partitioning.py.
+"""
+from config import PARTITIONING_ENABLED
+from services.partitioning import PartitionNewsItems, UnpartitionNewsItems
+
+
+def deferred(engine):
+    if engine.dialect.name != "postgresql":
+        return "news_items is partitioned only on PostgreSQL"
+    if not PARTITIONING_ENABLED:
+        return "PARTITIONING_ENABLED is off"
+    return None
+
+
+def upgrade():
+    """
+    Переводит news_items в секционированную по publish_date таблицу
+    """
+    return [
+        PartitionNewsItems(),
+    ]
+
+
+def downgrade():
+    """
+    Собирает секции обратно в одну таблицу
+    """
+    return [
+        UnpartitionNewsItems(),
+    ]
@@ -0,0 +1,34 @@
+"""
+Миграция 010: Курсор изменений ленты и записи об удаленных новостях
+
+/api/news/changes отдает новости, измененные после курсора, диапазонным
+сканированием индекса (updated_at, id), а удаления - из news_tombstones,
+куда их пишут архивация и отключение секций. Пустой updated_at у старых строк
+заполняется датой создания, чтобы они попадали в диапазон.
+"""
+from services.schema_migrations import create_index, drop_index, backfill
+
+
+def upgrade():
+    """
+    Создает news_tombstones и индекс по updated_at
+    """
+    return [
+        "CREATE TABLE IF NOT EXISTS news_tombstones ("
+        "news_id INTEGER PRIMARY KEY, "
+        "category VARCHAR(100), "
+        "deleted_at TIMESTAMP NOT NULL)",
+        create_index('ix_news_tombstones_deleted_at', 'news_tombstones', ['deleted_at', 'news_id'], concurrently=False),
+        backfill('news_items', 'updated_at = COALESCE(created_at, publish_date)', where='updated_at IS NULL'),
+        create_index('ix_news_items_updated_at', 'news_items', ['updated_at', 'id']),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет индекс и news_tombstones
+    """
+    return [
+        drop_index('ix_news_items_updated_at'),
+        "DROP TABLE IF EXISTS news_tombstones",
+    ]
@@ -0,0 +1,50 @@
+"""
+Миграция 011: Удаление колонок текста из news_items (этап contract миграции 008)
+
+Применяется, когда воркеров прошлой версии не осталось и на всех воркерах
+NEWS_BODY_DUAL_WRITE=false (иначе они продолжат писать в удаляемые колонки) -
+до этого миграция откладывается. Сначала докопируются тексты и анонсы новостей,
+сохраненных воркерами прошлой версии после миграции 008, затем колонки
+удаляются в одной транзакции.
+"""
+from sqlalchemy import inspect
+
+from config import NEWS_BODY_DUAL_WRITE
+from db import make_summary, LEGACY_BODY_COLUMNS
+from services.schema_migrations import add_column, drop_column, backfill, backfill_with, copy_rows
+
+BODY_SQL = "(SELECT b.content FROM news_bodies b WHERE b.news_id = news_items.id)"
+
+
+def deferred(engine):
+    columns = {column['name'] for column in inspect(engine).get_columns('news_items')}
+    # Одна content_html (миграция 002 на новой базе) - не схема прошлой версии, ждать нечего
+    if NEWS_BODY_DUAL_WRITE and set(LEGACY_BODY_COLUMNS) <= columns:
+        return "NEWS_BODY_DUAL_WRITE is on: set it to false on all workers after the rollout, then migrate"
+    return None
+
+
+def upgrade():
+    """
+    Докопирует тексты в news_bodies и удаляет content, content_html из news_items
+    """
+    return [
+        copy_rows('news_items', 'news_bodies', ['content', 'content_html'], target_key='news_id'),
+        backfill_with('news_items', 'summary', BODY_SQL, make_summary, where='summary IS NULL'),
+        drop_column('news_items', *LEGACY_BODY_COLUMNS),
+    ]
+
+
+def downgrade():
+    """
+    Возвращает колонки текста в news_items (заполняются из news_bodies)
+    """
+    return [
+        add_column('news_items', 'content', 'TEXT'),
+        add_column('news_items', 'content_html', 'TEXT'),
+        backfill(
+            'news_items',
+            "content = (SELECT b.content FROM news_bodies b WHERE b.news_id = news_items.id), "
+            "content_html = (SELECT b.content_html FROM news_bodies b WHERE b.news_id = news_items.id)"
+        ),
+    ]
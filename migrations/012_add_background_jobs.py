@@ -0,0 +1,41 @@
+"""
+Миграция 012: Таблица фоновых задач
+
+Задачи реестра (services.jobs) хранятся в background_jobs, чтобы статус
+/telegram/jobs/{id} отдавал любой воркер, а одинаковые запросы объединялись
+между процессами. Уникальный active_key заполнен только у выполняющейся задачи.
+"""
+from services.schema_migrations import create_index
+
+
+def upgrade():
+    """
+    Создает background_jobs
+    """
+    return [
+        "CREATE TABLE IF NOT EXISTS background_jobs ("
+        "id VARCHAR(32) PRIMARY KEY, "
+        "kind VARCHAR(50) NOT NULL, "
+        "key VARCHAR(255) NOT NULL, "
+        "active_key VARCHAR(255), "
+        "status VARCHAR(20) NOT NULL, "
+        "requests INTEGER NOT NULL DEFAULT 1, "
+        "queued INTEGER NOT NULL DEFAULT 0, "
+        "sent INTEGER NOT NULL DEFAULT 0, "
+        "failed INTEGER NOT NULL DEFAULT 0, "
+        "result JSON, "
+        "error TEXT, "
+        "created_at TIMESTAMP NOT NULL, "
+        "started_at TIMESTAMP, "
+        "finished_at TIMESTAMP, "
+        "heartbeat_at TIMESTAMP)",
+        create_index('ix_background_jobs_active_key', 'background_jobs', ['active_key'], unique=True, concurrently=False),
+        create_index('ix_background_jobs_created_at', 'background_jobs', ['created_at'], concurrently=False),
+    ]
+
+
+def downgrade():
+    """
+    Удаляет background_jobs
+    """
+    return ["DROP TABLE IF EXISTS background_jobs"]
@@ -0,0 +1,24 @@
+"""
+Миграция 013: Индекс общей ленты по publish_date DESC
+
+Лента без фильтра категории сортируется только по publish_date. На
+секционированной таблице (миграция 009) индекс создается на родителе и
+наследуется всеми секциями, включая создаваемые позже, - тогда ORDER BY
+publish_date DESC LIMIT читается упорядоченным обходом секций с остановкой на
+первых строках, а не сортировкой всех секций.
+"""
+from services.schema_migrations import create_index, drop_index
+
+
+def upgrade():
+    """
+    Добавляет индекс по publish_date DESC
+    """
+    return [create_index('ix_news_items_publish_date', 'news_items', ['publish_date DESC'])]
+
+
+def downgrade():
+    """
+    Удаляет индекс
+    """
+    return [drop_index('ix_news_items_publish_date')]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Архивация и восстановление старых новостей
+
+Примеры:
+    python scripts/archive_news.py archive --dry-run     # сколько новостей уйдет в архив
+    python scripts/archive_news.py archive
+    python scripts/archive_news.py restore --category crypto --from 2025-01-01 --to 2025-02-01
+    python scripts/archive_news.py restore archive/news_nft_20250801-030000.jsonl.gz
+    python scripts/archive_news.py list
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+# Добавляем путь к серверу для импорта модулей
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from services.retention import retention_manager
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация старых новостей")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="Заархивировать новости старше срока хранения")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Только посчитать")
+
+    restore_parser = subparsers.add_parser("restore", help="Вернуть новости из архива")
+    restore_parser.add_argument("files", nargs="*", help="Файлы архива (по умолчанию - все)")
+    restore_parser.add_argument("--category", help="Только эта категория")
+    restore_parser.add_argument("--from", dest="date_from", type=datetime.fromisoformat, help="Дата публикации от")
+    restore_parser.add_argument("--to", dest="date_to", type=datetime.fromisoformat, help="Дата публикации до")
+
+    subparsers.add_parser("list", help="Показать файлы архива")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        report = retention_manager.archive_expired(dry_run=args.dry_run)
+        for category, count in report.items():
+            print(f"{category}: {count}")
+    elif args.command == "restore":
+        report = retention_manager.restore(args.files, args.category, args.date_from, args.date_to)
+        print(f"Восстановлено: {report['restored']}, уже в базе: {report['existing']}, "
+              f"без источника: {report['missing_source']}")
+    else:
+        for path in retention_manager.archive_files():
+            print(f"{path}  {os.path.getsize(path) // 1024} КБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк маршрутов чтения API (/api/news/, /api/news/{id}, /api/stats/)
+
+Запускает uvicorn с роутером новостей из указанного каталога сервера и
+отправляет запросы из --clients параллельных клиентов. Выводит запросы в
+секунду и задержки p50/p95/p99. Для сравнения "до/после" запустите его для
+двух версий сервера, например:
+
+    git worktree add /tmp/server-before HEAD~1
+    python scripts/benchmark_api.py --server-dir /tmp/server-before/server
+    python scripts/benchmark_api.py
+
+По умолчанию работает с копией news.db (схема обновляется миграциями);
+--database-url - бенчмарк на PostgreSQL (база должна быть смигрирована).
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def create_app():
+    """Приложение только с роутером новостей (без фоновых задач main.py)"""
+    from fastapi import FastAPI
+    from api.news import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_sqlite(source_db: str, work_dir: str) -> str:
+    path = os.path.join(work_dir, "news.db")
+    shutil.copy(source_db, path)
+    url = f"sqlite:///{path}"
+    # Схема копии приводится к текущей версии миграциями основного дерева
+    subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, "migrate.py"), "upgrade"],
+        env={**os.environ, "DATABASE_URL": url}, check=True, capture_output=True
+    )
+    return url
+
+
+def start_server(server_dir: str, database_url: str, port: int, log_path: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "PYTHONPATH": os.pathsep.join([server_dir, SCRIPTS_DIR]),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmark_api:create_app", "--factory",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=server_dir, env=env, stdout=subprocess.DEVNULL, stderr=open(log_path, "wb")
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/stats/", timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            with open(log_path, encoding="utf-8", errors="replace") as log:
+                raise SystemExit(f"Сервер не запустился:\n{log.read()[-4000:]}")
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit("Сервер не ответил за 30 секунд")
+
+
+async def run_load(base_url: str, clients: int, total: int, news_ids, categories) -> dict:
+    paths = []
+    for index in range(total):
+        kind = index % 4
+        if kind == 0:
+            paths.append("/api/news/?limit=20&page=1")
+        elif kind == 1:
+            paths.append(f"/api/news/?category={random.choice(categories)}&limit=20&page=1")
+        elif kind == 2:
+            paths.append(f"/api/news/{random.choice(news_ids)}")
+        else:
+            paths.append("/api/stats/")
+
+    latencies = []
+    errors = 0
+    queue = iter(paths)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for path in queue:
+            started_at = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started_at)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк маршрутов чтения API")
+    parser.add_argument("--server-dir", default=os.path.join(ROOT_DIR, "server"), help="Каталог сервера")
+    parser.add_argument("--db", default=os.path.join(ROOT_DIR, "news.db"), help="Исходная SQLite база (копируется)")
+    parser.add_argument("--database-url", help="Готовая база (например PostgreSQL) вместо копии SQLite")
+    parser.add_argument("--clients", type=int, default=200, help="Параллельных клиентов")
+    parser.add_argument("--requests", type=int, default=4000, help="Всего запросов")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="api_bench_")
+    database_url = args.database_url or prepare_sqlite(args.db, work_dir)
+
+    port = free_port()
+    # Лог сервера - в файл: непрочитанный pipe остановил бы сервер при заполнении буфера
+    server = start_server(os.path.abspath(args.server_dir), database_url, port, os.path.join(work_dir, "server.log"))
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        first_page = httpx.get(f"{base_url}/api/news/?limit=100", timeout=30).json()["data"]
+        news_ids = [item["id"] for item in first_page] or [1]
+        categories = sorted({item["category"] for item in first_page}) or ["general"]
+
+        # Прогрев соединений и кэшей
+        asyncio.run(run_load(base_url, 10, 100, news_ids, categories))
+        stats = asyncio.run(run_load(base_url, args.clients, args.requests, news_ids, categories))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Сервер: {args.server_dir}, клиентов: {args.clients}, запросов: {args.requests}")
+    print(f"  {stats['rps']:.0f} запросов/с, p50 {stats['p50']:.0f} мс, p95 {stats['p95']:.0f} мс, "
+          f"p99 {stats['p99']:.0f} мс, ошибок: {stats['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рассылки подписчикам против фейкового Bot API
+
+Поднимает локальный HTTP-сервер, имитирующий sendMessage (с задержкой,
+заблокировавшими бота чатами и ответами 429), создает подписки во временной
+SQLite базе и измеряет скорость FanoutEngine.deliver.
+
+Пример: python scripts/benchmark_fanout.py --chats 20000 --latency 50 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+# База для бенчмарка - временная SQLite, задается до импорта модулей сервера
+_db_dir = tempfile.mkdtemp(prefix="fanout_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from aiohttp import web
+
+from db import create_tables, get_db_session, ChatSubscription
+from services.fanout import FanoutEngine
+
+
+def build_fake_api(latency: float, blocked_ratio: float, flood_ratio: float):
+    """Фейковый Bot API: sendMessage с задержкой и типичными ошибками"""
+    stats = {"requests": 0, "blocked": 0, "flood": 0}
+    rng = random.Random(42)
+
+    async def send_message(request):
+        payload = await request.json()
+        stats["requests"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+
+        chat_id = payload["chat_id"]
+        if chat_id % 1000 < blocked_ratio * 1000:
+            stats["blocked"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 403,
+                "description": "Forbidden: bot was blocked by the user"
+            })
+        if rng.random() < flood_ratio:
+            stats["flood"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+        return web.json_response({"ok": True, "result": {"message_id": stats["requests"], "chat": {"id": chat_id}}})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", send_message)
+    return app, stats
+
+
+def seed_subscriptions(chats: int, category: str):
+    db = get_db_session()
+    try:
+        db.bulk_insert_mappings(ChatSubscription, [
+            {"chat_id": 100000 + i, "category": category if i % 5 else "all"}
+            for i in range(chats)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(args):
+    app, stats = build_fake_api(args.latency / 1000, args.blocked, args.flood)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    engine = FanoutEngine(
+        mode="instant",
+        concurrency=args.concurrency,
+        rate=args.rate,
+        page_size=args.page_size,
+        api_url=f"http://127.0.0.1:{port}",
+        token="bench"
+    )
+
+    items = [
+        {"id": i, "title": f"Benchmark news {i}", "link": f"https://example.com/{i}", "category": "nft"}
+        for i in range(3)
+    ]
+
+    started_at = time.monotonic()
+    report = await engine.deliver(items)
+    elapsed = time.monotonic() - started_at
+
+    await runner.cleanup()
+
+    sent = sum(category["sent"] for category in report.values())
+    print(f"Чатов: {args.chats}, concurrency: {args.concurrency}, rate: {args.rate or 'без ограничения'}/s, "
+          f"задержка API: {args.latency} мс")
+    for category, result in report.items():
+        print(f"  {category}: {result}")
+    print(f"Запросов к API: {stats['requests']} (403: {stats['blocked']}, 429: {stats['flood']})")
+    print(f"Отправлено {sent} сообщений за {elapsed:.2f} с - {sent / elapsed:.0f} msg/s")
+    print(f"Отписано заблокировавших чатов: {engine.unsubscribed} подписок")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки подписчикам")
+    parser.add_argument("--chats", type=int, default=20000, help="Количество подписанных чатов")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных отправителей")
+    parser.add_argument("--rate", type=float, default=0, help="Лимит сообщений в секунду (0 - без ограничения)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Подписчиков на страницу")
+    parser.add_argument("--latency", type=float, default=20, help="Задержка ответа фейкового API, мс")
+    parser.add_argument("--blocked", type=float, default=0.01, help="Доля чатов, заблокировавших бота")
+    parser.add_argument("--flood", type=float, default=0.001, help="Доля ответов 429")
+    args = parser.parse_args()
+
+    create_tables()
+    seed_subscriptions(args.chats, "nft")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конкурентного чтения и записи SQLite с разными PRAGMA
+
+Копирует news.db во временный каталог и для каждого профиля (стандартный
+журнал DELETE и настроенный WAL из конфигурации) запускает читателей,
+выполняющих запросы API, и писателя, который обновляет views_count и
+добавляет новости с коммитом на каждую операцию. Выводит число операций в
+секунду и количество ошибок "database is locked".
+
+Пример: python scripts/benchmark_sqlite.py --readers 8 --duration 10
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Модули сервера не должны подключаться к рабочей базе - движки бенчмарк создает сам
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from db import SQLITE_PRAGMAS, set_sqlite_pragmas, make_summary
+from services import schema_migrations
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Поведение SQLite без настройки: журнал отката, полная синхронизация, без ожидания блокировки
+DEFAULT_PRAGMAS = {
+    'busy_timeout': '0',
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+BENCH_CONTENT = "bench " * 100
+
+READ_QUERIES = [
+    # Лента новостей категории (GET /api/news)
+    "SELECT id, title, category, publish_date FROM news_items WHERE category = :category "
+    "ORDER BY publish_date DESC LIMIT 20",
+    # Счетчики для статистики бота
+    "SELECT category, COUNT(*) FROM news_items GROUP BY category",
+    # Карточка новости
+    "SELECT * FROM news_items WHERE id = :news_id",
+]
+
+
+def is_locked_error(error: OperationalError) -> bool:
+    # Остальные OperationalError (нет таблицы, ошибка диска) - поломка бенчмарка, а не конкуренция
+    return "database is locked" in str(error.orig)
+
+
+def make_engine(path: str, pragmas: dict):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 0})
+    event.listen(engine, "connect", lambda dbapi_connection, record: set_sqlite_pragmas(dbapi_connection, pragmas))
+    return engine
+
+
+def run_profile(source_db: str, pragmas: dict, readers: int, duration: float) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="sqlite_bench_")
+    path = os.path.join(work_dir, "news.db")
+    shutil.copy(source_db, path)
+    # Схема копии - как у рабочей базы после деплоя (текст новости в news_bodies)
+    migration_engine = create_engine(f"sqlite:///{path}")
+    schema_migrations.upgrade(migration_engine)
+    migration_engine.dispose()
+    engine = make_engine(path, pragmas)
+
+    with engine.connect() as connection:
+        news_ids = [row[0] for row in connection.execute(text("SELECT id FROM news_items LIMIT 500"))]
+        source_id = connection.execute(text("SELECT id FROM news_sources LIMIT 1")).scalar()
+    if not news_ids or source_id is None:
+        raise SystemExit("В базе нет новостей или источников для бенчмарка")
+
+    stats = {"reads": 0, "writes": 0, "read_locked": 0, "write_locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def reader(index: int):
+        reads = locked = 0
+        step = index
+        while time.monotonic() < deadline:
+            step += 1
+            query = READ_QUERIES[step % len(READ_QUERIES)]
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text(query), {
+                        "category": ("nft", "crypto", "gifts", "tech")[step % 4],
+                        "news_id": news_ids[step % len(news_ids)]
+                    }).fetchall()
+                reads += 1
+            except OperationalError as e:
+                if not is_locked_error(e):
+                    raise
+                locked += 1
+        with lock:
+            stats["reads"] += reads
+            stats["read_locked"] += locked
+
+    def writer():
+        writes = locked = 0
+        step = 0
+        while time.monotonic() < deadline:
+            step += 1
+            try:
+                with engine.begin() as connection:
+                    if step % 10:
+                        # Просмотр новости (views_count коммитится на каждый запрос)
+                        connection.execute(
+                            text("UPDATE news_items SET views_count = views_count + 1 WHERE id = :news_id"),
+                            {"news_id": news_ids[step % len(news_ids)]}
+                        )
+                    else:
+                        # Сохранение новости парсером: строка ленты с анонсом и текст в news_bodies
+                        news_id = connection.execute(text(
+                            "INSERT INTO news_items (source_id, title, summary, link, category, publish_date, views_count) "
+                            "VALUES (:source_id, :title, :summary, :link, 'nft', :now, 0)"
+                        ), {
+                            "source_id": source_id,
+                            "title": f"bench {time.monotonic_ns()}",
+                            "summary": make_summary(BENCH_CONTENT),
+                            "link": f"https://example.com/bench/{step}",
+                            "now": datetime.utcnow()
+                        }).lastrowid
+                        connection.execute(
+                            text("INSERT INTO news_bodies (news_id, content) VALUES (:news_id, :content)"),
+                            {"news_id": news_id, "content": BENCH_CONTENT}
+                        )
+                writes += 1
+            except OperationalError as e:
+                if not is_locked_error(e):
+                    raise
+                locked += 1
+        with lock:
+            stats["writes"] += writes
+            stats["write_locked"] += locked
+
+    errors = []
+
+    def guarded(target, *args):
+        # Исключение в потоке не доходит до main - сохраняем и поднимаем после join
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=guarded, args=(reader, i)) for i in range(readers)]
+    threads.append(threading.Thread(target=guarded, args=(writer,)))
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started_at
+    if errors:
+        engine.dispose()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise errors[0]
+
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+    engine.dispose()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats["elapsed"] = elapsed
+    stats["journal_mode"] = journal_mode
+    return stats
+
+
+def print_stats(name: str, stats: dict):
+    elapsed = stats["elapsed"]
+    print(f"{name} (journal_mode={stats['journal_mode']}):")
+    print(f"  чтение: {stats['reads'] / elapsed:.0f} запросов/с, заблокировано: {stats['read_locked']}")
+    print(f"  запись: {stats['writes'] / elapsed:.0f} коммитов/с, заблокировано: {stats['write_locked']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк PRAGMA SQLite на копии news.db")
+    parser.add_argument("--db", default=os.path.join(ROOT_DIR, "news.db"), help="Исходная база (копируется)")
+    parser.add_argument("--readers", type=int, default=4, help="Потоков-читателей")
+    parser.add_argument("--duration", type=float, default=5, help="Длительность каждого профиля, с")
+    args = parser.parse_args()
+
+    print(f"База: {args.db}, читателей: {args.readers}, писатель: 1, {args.duration} с на профиль")
+    print_stats("Без настройки", run_profile(args.db, DEFAULT_PRAGMAS, args.readers, args.duration))
+    print_stats("Профиль из конфигурации", run_profile(args.db, SQLITE_PRAGMAS, args.readers, args.duration))
+
+
+if __name__ == "__main__":
+    main()
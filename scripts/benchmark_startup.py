@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта сервера: импорт main и первый запрос к API
+
+Каждый прогон - новый процесс Python (как новый воркер): замеряется время
+импорта main.py, подготовки базы из lifespan (init_db), первого запроса
+GET /api/news/ (через ASGI, без webhook и фоновых задач lifespan) и полное
+время процесса. Дополнительно выводится, создан ли движок базы уже при
+импорте. Для сравнения "до/после":
+
+    git worktree add /tmp/server-before HEAD~1
+    python scripts/benchmark_startup.py --server-dir /tmp/server-before/server
+    python scripts/benchmark_startup.py
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark_api import ROOT_DIR, prepare_sqlite
+
+# Выполняется в дочернем процессе; результат - последняя строка stdout
+CHILD_CODE = """
+import asyncio, json, sys, time
+import httpx
+started_at = time.perf_counter()
+import main
+imported_at = time.perf_counter()
+engine_at_import = "engine" in vars(sys.modules["db"])
+
+async def startup():
+    # Подготовка базы из lifespan (без webhook и фоновых задач) и первый запрос - в одном event loop
+    result = main.init_db()
+    if asyncio.iscoroutine(result):
+        await result
+    initialized_at = time.perf_counter()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        status = (await client.get("/api/news/?limit=20")).status_code
+    return initialized_at, status
+
+initialized_at, status = asyncio.run(startup())
+finished_at = time.perf_counter()
+print(json.dumps({
+    "import": imported_at - started_at,
+    "init_db": initialized_at - imported_at,
+    "first_request": finished_at - initialized_at,
+    "status": status,
+    "engine_at_import": engine_at_import,
+}))
+"""
+
+
+def run_once(server_dir: str, database_url: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": server_dir}
+    started_at = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE], cwd=server_dir, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started_at
+    if result.returncode != 0:
+        raise SystemExit(f"Процесс завершился с ошибкой:\n{result.stderr[-4000:]}")
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats["process"] = elapsed
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта сервера")
+    parser.add_argument("--server-dir", default=os.path.join(ROOT_DIR, "server"), help="Каталог сервера")
+    parser.add_argument("--db", default=os.path.join(ROOT_DIR, "news.db"), help="Исходная SQLite база (копируется)")
+    parser.add_argument("--database-url", help="Готовая база (например PostgreSQL) вместо копии SQLite")
+    parser.add_argument("--runs", type=int, default=5, help="Количество прогонов")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="startup_bench_")
+    try:
+        database_url = args.database_url or prepare_sqlite(args.db, work_dir)
+        server_dir = os.path.abspath(args.server_dir)
+        # Первый прогон прогревает кэш файловой системы и байт-код, в итог не входит
+        run_once(server_dir, database_url)
+        runs = [run_once(server_dir, database_url) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Сервер: {args.server_dir}, прогонов: {args.runs}")
+    for key, title in (
+        ("import", "импорт main"), ("init_db", "init_db"),
+        ("first_request", "первый запрос"), ("process", "процесс целиком")
+    ):
+        values = [run[key] * 1000 for run in runs]
+        print(f"  {title}: медиана {statistics.median(values):.0f} мс, мин {min(values):.0f} мс, макс {max(values):.0f} мс")
+    print(f"  статус первого запроса: {sorted({run['status'] for run in runs})}")
+    print(f"  движок создан при импорте: {'да' if any(run['engine_at_import'] for run in runs) else 'нет'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,18 @@
 
 import sys
 import os
-from sqlalchemy import create_engine, text
-from datetime import datetime
+from sqlalchemy import text
 
 # Добавляем путь к серверу
-sys.path.append(os.path.join(os.path.dirname(__file__), 'server'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
 
-from server.config import DATABASE_URL
+from db import get_db_session
+from services.retention import delete_news
+# Подписка на NEWS_DELETED: общий кэш (CACHE_BACKEND=redis) сбрасывается и из скрипта
+import services.cache  # noqa: F401
+
+# Сколько новостей удалять за одну транзакцию
+BATCH_SIZE = 500
 
 def clear_old_news():
     """Очищаем старые новости и оставляем только @nextgen_NFT"""
@@ -19,10 +24,9 @@ def clear_old_news():
     print("🧹 Очистка старых новостей...")
     
     try:
-        # Создаем подключение к базе данных
-        engine = create_engine(DATABASE_URL)
-        
-        with engine.connect() as connection:
+        # Сессия сервера: удаление идет тем же путем, что и архивация
+        connection = get_db_session()
+        try:
             # Получаем информацию о количестве новостей
             result = connection.execute(text("SELECT COUNT(*) FROM news_items"))
             total_count = result.scalar()
@@ -37,15 +41,24 @@ def clear_old_news():
             nextgen_count = result.scalar()
             print(f"📊 Новостей от @nextgen_NFT: {nextgen_count}")
             
-            # Удаляем все новости кроме @nextgen_NFT
-            result = connection.execute(text("""
-                DELETE FROM news_items 
-                WHERE source_id NOT IN (
-                    SELECT id FROM news_sources WHERE name = 'NextGen NFT'
-                )
-            """))
-            deleted_count = result.rowcount
-            print(f"🗑️ Удалено новостей: {deleted_count}")
+            # Удаляем все новости кроме @nextgen_NFT небольшими пакетами,
+            # чтобы не блокировать таблицу одним большим DELETE. Каждый пакет
+            # оставляет записи об удалении (news_tombstones) и оповещает ленты
+            deleted_count = 0
+            while True:
+                ids = [row[0] for row in connection.execute(text("""
+                    SELECT id FROM news_items 
+                    WHERE source_id NOT IN (
+                        SELECT id FROM news_sources WHERE name = 'NextGen NFT'
+                    )
+                    ORDER BY id
+                    LIMIT :batch_size
+                """), {"batch_size": BATCH_SIZE})]
+                if not ids:
+                    break
+                delete_news(connection, ids)
+                deleted_count += len(ids)
+                print(f"🗑️ Удалено новостей: {deleted_count}")
             
             # Удаляем неиспользуемые источники
             result = connection.execute(text("""
@@ -75,6 +88,8 @@ def clear_old_news():
             
             connection.commit()
             print(f"\n✅ Очистка завершена успешно!")
+        finally:
+            connection.close()
             
     except Exception as e:
         print(f"❌ Ошибка при очистке: {e}")
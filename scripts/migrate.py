@@ -1,73 +1,51 @@
 #!/usr/bin/env python3
 """
-Скрипт для применения миграций базы данных
+Применение миграций базы данных (запускается при деплое перед стартом приложения)
+
+Примеры:
+    python scripts/migrate.py upgrade          # все неприменные миграции
+    python scripts/migrate.py upgrade 005      # до версии 005 включительно
+    python scripts/migrate.py downgrade 004    # откатить миграции новее 004
+    python scripts/migrate.py status
 """
+import argparse
+import logging
 import os
 import sys
-import asyncio
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine
-import logging
 
 # Добавляем путь к серверу для импорта модулей
-sys.path.append(os.path.join(os.path.dirname(__file__), 'server'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
 
-from server.config import DATABASE_URL
+from db import engine
+from services import schema_migrations
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def apply_migration():
-    """Применяет миграцию для добавления новых полей"""
-
-    # Заменяем postgresql:// на postgresql+asyncpg://
-    async_url = DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://')
-    engine = create_async_engine(async_url)
-
-    try:
-        async with engine.begin() as conn:
-            logger.info("Подключение к базе данных...")
-
-            # Проверяем, существуют ли уже поля
-            result = await conn.execute(text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'news_items' 
-                AND column_name IN ('image_url', 'video_url', 'reading_time', 'views_count', 'author', 'subtitle', 'content_html')
-            """))
-
-            existing_columns = [row[0] for row in result.fetchall()]
-            logger.info(f"Существующие новые поля: {existing_columns}")
-
-            # Добавляем поля, которых еще нет
-            fields_to_add = [
-                ('image_url', 'VARCHAR(1000)'),
-                ('video_url', 'VARCHAR(1000)'),
-                ('reading_time', 'INTEGER'),
-                ('views_count', 'INTEGER'),
-                ('author', 'VARCHAR(200)'),
-                ('subtitle', 'VARCHAR(500)'),
-                ('content_html', 'TEXT')
-            ]
-
-            for field_name, field_type in fields_to_add:
-                if field_name not in existing_columns:
-                    logger.info(f"Добавляем поле {field_name}...")
-                    await conn.execute(text(f"""
-                        ALTER TABLE news_items 
-                        ADD COLUMN {field_name} {field_type}
-                    """))
-                    logger.info(f"Поле {field_name} добавлено успешно")
-                else:
-                    logger.info(f"Поле {field_name} уже существует")
 
-            logger.info("Миграция применена успешно!")
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subparsers.add_parser("upgrade", help="Применить миграции")
+    upgrade_parser.add_argument("target", nargs="?", help="Последняя применяемая версия")
+    downgrade_parser = subparsers.add_parser("downgrade", help="Откатить миграции новее указанной версии")
+    downgrade_parser.add_argument("target", help="Версия, до которой откатить")
+    subparsers.add_parser("status", help="Показать примененные миграции")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = schema_migrations.upgrade(engine, args.target)
+        logger.info(f"Применены миграции: {applied}" if applied else "Схема базы актуальна")
+    elif args.command == "downgrade":
+        reverted = schema_migrations.downgrade(engine, args.target)
+        logger.info(f"Откачены миграции: {reverted}" if reverted else "Нечего откатывать")
+    else:
+        for migration in schema_migrations.status(engine):
+            applied_at = migration["applied_at"] or (
+                f"отложена: {migration['deferred']}" if migration["deferred"] else "не применена"
+            )
+            print(f"{migration['version']}  {migration['name']:<32} {applied_at}")
 
-    except Exception as e:
-        logger.error(f"Ошибка при применении миграции: {e}")
-        raise
-    finally:
-        await engine.dispose()
 
 if __name__ == "__main__":
-    asyncio.run(apply_migration())
+    main()
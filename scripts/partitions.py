@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Секционирование news_items по месяцам (только PostgreSQL)
+
+Примеры:
+    python scripts/partitions.py enable      # перевести news_items в секционированную таблицу
+    python scripts/partitions.py maintain    # создать будущие секции, отключить устаревшие
+    python scripts/partitions.py status
+    python scripts/partitions.py disable     # собрать секции обратно в одну таблицу
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Добавляем путь к серверу для импорта модулей
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from sqlalchemy import text
+
+from db import engine
+from services import partitioning
+from services.partitioning import partition_manager
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Секционирование news_items по месяцам")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("enable", help="Секционировать news_items")
+    subparsers.add_parser("disable", help="Собрать секции в одну таблицу")
+    subparsers.add_parser("maintain", help="Создать будущие и отключить устаревшие секции")
+    subparsers.add_parser("status", help="Показать секции")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("Секционирование поддерживается только на PostgreSQL")
+
+    if args.command == "enable":
+        done = partitioning.partition_table(engine)
+        print("news_items секционирована" if done else "news_items уже секционирована")
+    elif args.command == "disable":
+        done = partitioning.unpartition_table(engine)
+        print("news_items - снова одна таблица" if done else "news_items не секционирована")
+    elif args.command == "maintain":
+        report = partition_manager.maintain()
+        print(f"Создано: {report['created']}, отключено: {report['detached']}")
+    else:
+        with engine.connect() as connection:
+            if not partitioning.is_partitioned(connection):
+                print("news_items не секционирована")
+                return
+            for name, lower, upper in partitioning.list_partitions(connection):
+                rows = connection.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"), {"name": name}
+                ).scalar()
+                print(f"{name}  {lower:%Y-%m-%d} .. {upper:%Y-%m-%d}  ~{max(rows or 0, 0)} строк")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+#!/bin/bash
+# Инициализация основной базы в docker-compose: разрешает потоковую репликацию
+# (pg_basebackup и подключение реплик из профиля replicas)
+set -e
+
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
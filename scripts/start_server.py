@@ -60,8 +60,7 @@ def test_api():
                 print(f"\n📝 Первая новость:")
                 print(f"   Заголовок: {first_news['title']}")
                 print(f"   Категория: {first_news['category']}")
-                print(f"   Длина текста: {len(first_news['content'])} символов")
-                print(f"   HTML контент: {len(first_news['content_html'])} символов")
+                print(f"   Анонс: {len(first_news['content'])} символов")
                 print(f"   Время чтения: {first_news['reading_time']} мин")
                 print(f"   Просмотры: {first_news['views_count']}")
                 
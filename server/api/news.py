@@ -1,26 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, joinedload
+from sqlalchemy import desc, func, select, update
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
+import asyncio
 import logging
 
-from db import get_db, NewsItem, NewsSource, recreate_engine, recreate_models
-from models import NewsResponse, NewsItemResponse, MediaItem, NewsSourceResponse
-from services.auto_publisher import auto_publisher  # Импортируем сервис автопубликации
+from config import FEED_CACHE_TTL, SOURCE_CACHE_TTL
+from db import get_async_db, NewsItem, NewsSource
+from services import changes
+from services.cache import cache, NEWS_TAG, SOURCES_TAG
+from services.hot_set import hot_set
+from services.news_stream import news_stream, parse_categories
+from services.read_replicas import read_router
+from models import NewsResponse, NewsItemResponse, MediaItem, NewsSourceResponse, feed_item_response
+from services.auto_publisher import publishing_manager  # Импортируем сервис автопубликации
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+async def load_sources(db: AsyncSession, source_ids: Iterable[int]) -> Dict[int, NewsSourceResponse]:
+    """Источники по id: из общего кэша, недостающие - одним запросом к базе"""
+    source_ids = set(source_ids)
+    if not source_ids:
+        return {}
+
+    cached = await cache.aget_many([f"source:{source_id}" for source_id in source_ids])
+    sources = {value["id"]: NewsSourceResponse(**value) for value in cached.values()}
+
+    missing = source_ids - sources.keys()
+    if missing:
+        rows = (await db.execute(select(NewsSource).where(NewsSource.id.in_(missing)))).scalars().all()
+        for row in rows:
+            source = NewsSourceResponse.from_orm(row)
+            sources[source.id] = source
+            await cache.aset(f"source:{source.id}", source.model_dump(), SOURCE_CACHE_TTL, tags=(SOURCES_TAG,))
+    return sources
+
+
 @router.get("/news/", response_model=NewsResponse)
 async def get_news(
         category: Optional[str] = Query(None, description="Фильтр по категории"),
         limit: int = Query(50, description="Количество новостей", le=100),
         offset: int = Query(0, description="Смещение для пагинации"),
-        page: int = Query(1, description="Номер страницы"),
-        db: Session = Depends(get_db)
+        page: int = Query(1, description="Номер страницы")
 ):
     """Получить список новостей с фильтрацией"""
     try:
@@ -29,148 +57,171 @@ async def get_news(
         
         logger.info(f"Запрос новостей: category={category}, limit={limit}, page={page}, offset={calculated_offset}")
 
-        # Принудительно обновляем метаданные и модели
-        recreate_engine()
-        NewsItem, NewsSource = recreate_models()
+        # Первые страницы - готовым JSON из памяти воркера, без базы
+        hot_page = hot_set.feed_page(category, calculated_offset, limit, page)
+        if hot_page is not None:
+            return Response(content=hot_page, media_type="application/json")
+
+        # Остальные - из общего кэша (сбрасывается при появлении новостей); одновременные
+        # промахи по одной странице ждут одно вычисление
+        cache_key = f"feed:{category or 'all'}:{calculated_offset}:{limit}:{page}"
+
+        async def compute():
+            # Общее вычисление переживает отмену запроса, который его начал, -
+            # поэтому сессия своя, а не зависимость этого запроса
+            async with read_router.async_session() as db:
+                # Фильтр по категории
+                filters = []
+                if category and category != "all":
+                    filters.append(NewsItem.category == category)
+
+                # Базовый запрос: только узкая строка news_items (текст новости - в news_bodies)
+                query = (
+                    select(NewsItem)
+                    .options(defer(NewsItem.post_text))
+                    .where(*filters)
+                    .order_by(desc(NewsItem.publish_date))  # Сортировка по дате публикации
+                )
+
+                # Пагинация
+                total = (await db.execute(select(func.count()).select_from(NewsItem).where(*filters))).scalar()
+                news_items = (await db.execute(query.offset(calculated_offset).limit(limit))).scalars().all()
+
+                logger.info(f"Найдено {len(news_items)} новостей из {total} общих")
+
+                # Источники всех новостей страницы
+                sources = await load_sources(db, (item.source_id for item in news_items if item.source_id is not None))
+
+                # Преобразование в response модель
+                news_data = []
+                for item in news_items:
+                    try:
+                        news_data.append(feed_item_response(item, sources.get(item.source_id)))
+                    except Exception as e:
+                        logger.warning(f"Ошибка при обработке новости {item.id}: {e}")
+                        continue
 
-        # Базовый запрос
-        query = db.query(NewsItem)
+                return NewsResponse(
+                    data=news_data,
+                    total=total,
+                    page=page,
+                    pages=(total + limit - 1) // limit
+                ).model_dump()
 
-        # Фильтр по категории
-        if category and category != "all":
-            query = query.filter(NewsItem.category == category)
+        return NewsResponse(**await cache.aget_or_set(cache_key, compute, FEED_CACHE_TTL, tags=(NEWS_TAG,)))
 
-        # Сортировка по дате публикации
-        query = query.order_by(desc(NewsItem.publish_date))
+    except Exception as e:
+        logger.error(f"Ошибка при получении новостей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении новостей: {str(e)}")
 
-        # Пагинация
-        total = query.count()
-        news_items = query.offset(calculated_offset).limit(limit).all()
 
-        logger.info(f"Найдено {len(news_items)} новостей из {total} общих")
+@router.get("/news/stream")
+async def stream_news(
+        category: Optional[str] = Query(None, description="Категории через запятую (пусто - все)"),
+        last_event_id: Optional[int] = Query(None, description="Продолжить после этого ID (если нельзя передать заголовок)"),
+        last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID")
+):
+    """Новые новости в реальном времени (Server-Sent Events); EventSource сам передает Last-Event-ID при переподключении"""
+    subscriber = news_stream.connect(parse_categories(category))
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Слишком много подключений к потоку новостей")
+
+    return StreamingResponse(
+        news_stream.sse(subscriber, last_event_id_header if last_event_id_header is not None else last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Соединение освобождается и при разрыве до начала потока
+        background=BackgroundTask(news_stream.disconnect, subscriber)
+    )
+
+
+@router.get("/news/changes")
+async def get_news_changes(
+        since: Optional[str] = Query(None, description="Токен из предыдущего ответа (без него - только токен)"),
+        category: Optional[str] = Query(None, description="Фильтр по категории"),
+        limit: int = Query(200, description="Максимум новостей и удалений в ответе", ge=1, le=1000),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Изменения ленты после токена: новые новости целиком, измененные - фрагментами, ID удаленных.
+    При has_more запрос повторяется с next сразу; при reset ленту нужно загрузить заново
+    """
+    # Читаем с основной базы: отставание реплики больше окна CHANGES_SETTLE_SECONDS потеряло бы изменения
+    try:
+        cursor, next_cursor, items, deleted, has_more, reset = await changes.load_changes(db, since, category, limit)
+    except changes.InvalidToken:
+        raise HTTPException(status_code=400, detail="Некорректный токен изменений")
 
-        # Соберем source_id для всех новостей
-        source_ids = [item.source_id for item in news_items if item.source_id is not None]
-        sources = {}
-        if source_ids:
-            sources_list = db.query(NewsSource).filter(NewsSource.id.in_(source_ids)).all()
-            sources = {source.id: source for source in sources_list}
+    try:
+        inserted = [item for item in items if changes.is_new(item, cursor)]
+        sources = await load_sources(db, (item.source_id for item in inserted if item.source_id is not None))
+        return {
+            "inserted": [feed_item_response(item, sources.get(item.source_id)).model_dump(mode="json") for item in inserted],
+            "updated": [changes.change_fragment(item) for item in items if not changes.is_new(item, cursor)],
+            "deleted": deleted,
+            "next": next_cursor.encode(),
+            "has_more": has_more,
+            "reset": reset
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при получении изменений ленты: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении изменений ленты: {str(e)}")
 
-        # Преобразование в response модель
-        news_data = []
-        for item in news_items:
-            try:
-                                # Получаем медиа из JSON поля
-                media_list = []
-                if item.media:
-                    try:
-                        # Добавляем отладочную информацию
-                        logger.info(f"Processing media for item {item.id}: {type(item.media)} - {item.media}")
-                        
-                        # Если media это строка JSON, парсим её
-                        if isinstance(item.media, str):
-                            import json
-                            media_data = json.loads(item.media)
-                        else:
-                            media_data = item.media
-                        
-                        # Проверяем, является ли media_data списком или одним объектом
-                        if isinstance(media_data, list):
-                            media_list = [MediaItem(**media) for media in media_data]
-                        else:
-                            # Если это один объект, оборачиваем в список
-                            media_list = [MediaItem(**media_data)]
-                            
-                        logger.info(f"Successfully parsed media for {item.id}: {len(media_list)} items")
-                    except Exception as e:
-                        logger.warning(f"Error parsing media for {item.id}: {e}")
-                        logger.warning(f"Media data: {item.media}")
-                        # Пробуем создать медиа из image_url и video_url как fallback
-                        if item.image_url:
-                            media_list = [MediaItem(
-                                type='photo',
-                                url=item.image_url,
-                                thumbnail=item.image_url
-                            )]
-                            logger.info(f"Created fallback photo media for {item.id}")
-                        elif item.video_url:
-                            media_list = [MediaItem(
-                                type='video',
-                                url=item.video_url,
-                                thumbnail=item.image_url
-                            )]
-                            logger.info(f"Created fallback video media for {item.id}")
-                else:
-                    # Если медиа нет, пробуем создать из image_url и video_url
-                    if item.image_url:
-                        media_list = [MediaItem(
-                            type='photo',
-                            url=item.image_url,
-                            thumbnail=item.image_url
-                        )]
-                        logger.info(f"Created photo media from image_url for {item.id}")
-                    elif item.video_url:
-                        media_list = [MediaItem(
-                            type='video',
-                            url=item.video_url,
-                            thumbnail=item.image_url
-                        )]
-                        logger.info(f"Created video media from video_url for {item.id}")
-
-                # Получаем источник
-                source = sources.get(item.source_id)
-                source_name = source.name if source else None
-                source_url = source.url if source else None
-
-                # Отладочная информация
-                logger.info(f"Processing item {item.id}: content_html exists = {item.content_html is not None}, length = {len(item.content_html) if item.content_html else 0}")
-                
-                news_data.append(NewsItemResponse(
-                    id=item.id,
-                    title=item.title or "",
-                    content=item.content or "",  # Plain text
-                    content_html=item.content_html,  # HTML контент (может быть None)
-                    link=item.link or "",
-                    publish_date=item.publish_date.isoformat() if item.publish_date else datetime.now().isoformat(),
-                    category=item.category or "general",
-                    media=media_list,
-                    reading_time=item.reading_time,
-                    views_count=item.views_count or 0,
-                    author=item.author,
-                    source_name=source_name,
-                    source_url=source_url,
-                    source=NewsSourceResponse.from_orm(source) if source else None
-                ))
-            except Exception as e:
-                logger.warning(f"Ошибка при обработке новости {item.id}: {e}")
-                continue
-
-        return NewsResponse(
-            data=news_data,
-            total=total,
-            page=page,
-            pages=(total + limit - 1) // limit
-        )
 
-    except Exception as e:
-        logger.error(f"Ошибка при получении новостей: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка при получении новостей: {str(e)}")
+@router.websocket("/news/ws")
+async def news_websocket(
+        websocket: WebSocket,
+        category: Optional[str] = None,
+        last_event_id: Optional[int] = None
+):
+    """Новые новости в реальном времени через WebSocket (сообщения news, ping и reset в JSON)"""
+    subscriber = news_stream.connect(parse_categories(category))
+    if subscriber is None:
+        await websocket.close(code=1013)
+        return
+
+    async def send_messages():
+        async for message in news_stream.messages(subscriber, last_event_id):
+            await websocket.send_text(message)
+        await websocket.close()
+
+    async def wait_disconnect():
+        # Сообщения клиента не используются; отключение освобождает соединение сразу, а не на следующем пинге
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    try:
+        await websocket.accept()
+        tasks = [asyncio.create_task(send_messages()), asyncio.create_task(wait_disconnect())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.warning(f"Ошибка потока новостей WebSocket: {task.exception()}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        news_stream.disconnect(subscriber)
 
 
 @router.get("/news/{news_id}", response_model=NewsItemResponse)
 async def get_news_item(
         news_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Получить конкретную новость по ID"""
     try:
-        news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
+        news_item = (await db.execute(
+            select(NewsItem).options(joinedload(NewsItem.body)).where(NewsItem.id == news_id)
+        )).scalars().first()
 
         if not news_item:
             raise HTTPException(status_code=404, detail="Новость не найдена")
 
         # Получаем источник
-        source = db.query(NewsSource).get(news_item.source_id) if news_item.source_id else None
+        source = (await load_sources(db, [news_item.source_id])).get(news_item.source_id) if news_item.source_id else None
 
         # Получаем медиа
         media_list = []
@@ -229,11 +280,17 @@ async def get_news_item(
                 )]
                 logger.info(f"Created video media from video_url for {news_item.id}")
 
-        # Увеличиваем счетчик просмотров
-        if news_item.views_count is None:
-            news_item.views_count = 0
-        news_item.views_count += 1
-        db.commit()
+        # Увеличиваем счетчик просмотров атомарным UPDATE в отдельной транзакции:
+        # параллельные просмотры не теряются, а SQLite не повышает читающую транзакцию до записи
+        await db.commit()
+        views_count = (await db.execute(
+            update(NewsItem)
+            .where(NewsItem.id == news_id)
+            .values(views_count=func.coalesce(NewsItem.views_count, 0) + 1)
+            .returning(NewsItem.views_count)
+            .execution_options(synchronize_session=False)
+        )).scalar()
+        await db.commit()
 
         return NewsItemResponse(
             id=news_item.id,
@@ -245,11 +302,11 @@ async def get_news_item(
             category=news_item.category or "general",
             media=media_list,
             reading_time=news_item.reading_time,
-            views_count=news_item.views_count,
+            views_count=views_count,
             author=news_item.author,
             source_name=source.name if source else None,
             source_url=source.url if source else None,
-            source=NewsSourceResponse.from_orm(source) if source else None
+            source=source
         )
 
     except HTTPException:
@@ -262,12 +319,12 @@ async def get_news_item(
 @router.post("/news/{news_id}/publish")
 async def publish_news_to_channel(
         news_id: int,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Публикует новость в Telegram канал"""
     try:
         # Получаем новость
-        news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
+        news_item = (await db.execute(select(NewsItem).where(NewsItem.id == news_id))).scalar_one_or_none()
         if not news_item:
             raise HTTPException(status_code=404, detail="Новость не найдена")
         
@@ -279,8 +336,9 @@ async def publish_news_to_channel(
                 "published_at": news_item.published_to_channel_at.isoformat() if news_item.published_to_channel_at else None
             }
         
-        # Публикуем в канал
-        message_id = await auto_publisher.publish_news_to_channel(news_item)
+        # Публикуем в канал, соответствующий маршруту новости
+        db.expunge(news_item)
+        message_id = await publishing_manager.publish_news(news_item)
         
         if message_id:
             return {
@@ -299,36 +357,40 @@ async def publish_news_to_channel(
 
 
 @router.get("/categories/")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories():
     """Получить список доступных категорий"""
     try:
-        categories = db.query(NewsItem.category).distinct().all()
-        return {"categories": [cat[0] for cat in categories if cat[0]]}
+        async def compute():
+            async with read_router.async_session() as db:
+                categories = (await db.execute(select(NewsItem.category).distinct())).all()
+            return {"categories": [cat[0] for cat in categories if cat[0]]}
+
+        return await cache.aget_or_set("categories", compute, FEED_CACHE_TTL, tags=(NEWS_TAG,))
     except Exception as e:
         logger.error(f"Ошибка при получении категорий: {e}")
         raise HTTPException(status_code=500, detail="Ошибка при получении категорий")
 
 
 @router.get("/stats/")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats():
     """Получить статистику новостей"""
     try:
-        total_news = db.query(NewsItem).count()
-
-        # Статистика по категориям
-        categories_stats = {}
-        categories = db.query(NewsItem.category).distinct().all()
+        async def compute():
+            # Статистика по категориям - одним запросом с группировкой
+            async with read_router.async_session() as db:
+                rows = (await db.execute(
+                    select(NewsItem.category, func.count()).group_by(NewsItem.category)
+                )).all()
+            categories_stats = {category: count for category, count in rows if category}
+            total_news = sum(count for _, count in rows)
 
-        for cat in categories:
-            if cat[0]:
-                count = db.query(NewsItem).filter(NewsItem.category == cat[0]).count()
-                categories_stats[cat[0]] = count
+            return {
+                "total_news": total_news,
+                "categories": categories_stats,
+                "last_updated": datetime.now().isoformat()
+            }
 
-        return {
-            "total_news": total_news,
-            "categories": categories_stats,
-            "last_updated": datetime.now().isoformat()
-        }
+        return await cache.aget_or_set("stats", compute, FEED_CACHE_TTL, tags=(NEWS_TAG,))
 
     except Exception as e:
         logger.error(f"Ошибка при получении статистики: {e}")
@@ -3,17 +3,24 @@
 API endpoints для Telegram Bot
 """
 
+import asyncio
 import logging
 import requests
+from datetime import datetime
 from typing import Dict, Any, List, Optional
-from fastapi import APIRouter, HTTPException, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from bot import bot
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db_session, NewsItem, NewsSource
-from services.auto_publisher import auto_publisher
-from config import TOKEN, CHANNEL_ID, WEBHOOK_URL
+from db import get_async_db, NewsItem, NewsSource
+from services.auto_publisher import auto_publisher, publishing_manager
+from services.update_queue import UpdateQueue, QUEUE_FULL
+from services.unpublisher import bulk_unpublish
+from services.jobs import job_registry
+from config import TOKEN, CHANNEL_ID, WEBHOOK_URL, AUTO_PUBLISH_ENABLED
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/telegram", tags=["telegram"])
@@ -23,35 +30,70 @@ class TelegramUpdate(BaseModel):
     message: Dict[str, Any] = None
     callback_query: Dict[str, Any] = None
 
+class BulkUnpublishRequest(BaseModel):
+    news_ids: Optional[List[int]] = None
+    source_id: Optional[int] = None
+    category: Optional[str] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+async def process_update(data: Dict[str, Any]):
+    """Обработка одного обновления (выполняется воркерами очереди)"""
+    # Обрабатываем сообщения
+    if "message" in data:
+        message = data["message"]
+        chat_id = message["chat"]["id"]
+        text = message.get("text", "")
+        
+        if text.startswith("/"):
+            # Обрабатываем команды (блокирующие вызовы бота уводим из event loop)
+            command = text.split()[0]
+            args = text.split()[1:] if len(text.split()) > 1 else []
+            await asyncio.to_thread(bot.handle_command, chat_id, command, args)
+        else:
+            # Обычное сообщение
+            await asyncio.to_thread(bot.send_message, chat_id, "Привет! Используйте /help для списка команд.")
+    
+    # Обрабатываем callback queries
+    elif "callback_query" in data:
+        callback_query = data["callback_query"]
+        chat_id = callback_query["message"]["chat"]["id"]
+        data_text = callback_query["data"]
+        
+        await handle_callback_query(chat_id, data_text)
+
+
+# Очередь обновлений: webhook отвечает сразу, обработка идет в воркерах
+update_queue = UpdateQueue(process_update)
+update_queue.register_metrics()
+
+
+async def start_update_workers():
+    """Запуск воркеров очереди обновлений"""
+    bot.loop = asyncio.get_running_loop()
+    await update_queue.start()
+
+
+async def stop_update_workers():
+    """Остановка воркеров очереди обновлений"""
+    await update_queue.stop()
+
+
 @router.post("/webhook")
 async def webhook_handler(request: Request):
-    """Обработчик webhook от Telegram"""
+    """Обработчик webhook от Telegram: ставит обновление в очередь и сразу отвечает"""
     try:
         data = await request.json()
-        logger.info(f"Получен webhook: {data}")
+        logger.debug(f"Получен webhook update_id={data.get('update_id')}")
         
-        # Обрабатываем сообщения
-        if "message" in data:
-            message = data["message"]
-            chat_id = message["chat"]["id"]
-            text = message.get("text", "")
-            
-            if text.startswith("/"):
-                # Обрабатываем команды
-                command = text.split()[0]
-                args = text.split()[1:] if len(text.split()) > 1 else []
-                bot.handle_command(chat_id, command, args)
-            else:
-                # Обычное сообщение
-                bot.send_message(chat_id, "Привет! Используйте /help для списка команд.")
+        if not update_queue.running:
+            await start_update_workers()
         
-        # Обрабатываем callback queries
-        elif "callback_query" in data:
-            callback_query = data["callback_query"]
-            chat_id = callback_query["message"]["chat"]["id"]
-            data_text = callback_query["data"]
-            
-            await handle_callback_query(chat_id, data_text)
+        status = update_queue.enqueue(data)
+        if status == QUEUE_FULL:
+            # Не подтверждаем обновление - Telegram доставит его повторно позже
+            logger.warning(f"Очередь обновлений переполнена, update_id={data.get('update_id')} отклонен")
+            return JSONResponse(status_code=503, content={"status": "busy"})
         
         return {"status": "ok"}
         
@@ -107,19 +149,17 @@ async def handle_callback_query(chat_id: int, data: str):
         
         # Обработка различных типов callback data
         if data == "news":
-            text = bot.get_news_summary(5)
-            bot.send_message(chat_id, text)
+            text = await asyncio.to_thread(bot.get_news_summary, 5)
         elif data == "nft":
-            text = bot.get_news_summary(5, category="nft")
-            bot.send_message(chat_id, text)
+            text = await asyncio.to_thread(bot.get_news_summary, 5, "nft")
         elif data == "crypto":
-            text = bot.get_news_summary(5, category="crypto")
-            bot.send_message(chat_id, text)
+            text = await asyncio.to_thread(bot.get_news_summary, 5, "crypto")
         elif data == "stats":
-            text = bot.get_stats()
-            bot.send_message(chat_id, text)
+            text = await asyncio.to_thread(bot.get_stats)
         else:
-            bot.send_message(chat_id, "Неизвестная команда")
+            text = "Неизвестная команда"
+        
+        await asyncio.to_thread(bot.send_message, chat_id, text)
             
     except Exception as e:
         logger.error(f"Ошибка обработки callback query: {e}")
@@ -180,33 +220,49 @@ async def send_news_to_chat(chat_id: int, news_id: int = None):
         } 
 
 @router.post("/publish-now")
-async def publish_news_now(background_tasks: BackgroundTasks):
+async def publish_news_now():
     """
-    Принудительно публикует неопубликованные новости в канал
+    Принудительно публикует неопубликованные новости во все каналы
+    Пока публикация идет, повторные запросы получают ту же задачу
     """
     try:
-        # Запускаем публикацию в фоновом режиме (force=True для ручной публикации)
-        background_tasks.add_task(auto_publisher.publish_batch, force=True)
+        job, created = await publishing_manager.submit_publish_job()
         
         return {
-            "message": "Publishing started in background",
-            "status": "started"
+            "message": "Publishing started in background" if created else "Publishing already in progress",
+            "status": "started" if created else "in_progress",
+            "job_id": job.id,
+            "job_url": f"/telegram/jobs/{job.id}"
         }
     except Exception as e:
         logger.error(f"Error starting manual publish: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Статус и прогресс фоновой задачи
+    """
+    job = await job_registry.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
 @router.get("/publish-status")
-async def get_publish_status(db: Session = Depends(get_db_session)):
+async def get_publish_status(db: AsyncSession = Depends(get_async_db)):
     """
     Получает статус автоматической публикации
     """
     try:
-        # Подсчитываем статистику
-        total_news = db.query(NewsItem).count()
-        published_news = db.query(NewsItem).filter(NewsItem.is_published_to_channel == True).count()
-        unpublished_news = db.query(NewsItem).filter(NewsItem.is_published_to_channel == False).count()
+        # Подсчитываем статистику одним запросом
+        counts = dict((await db.execute(
+            select(NewsItem.is_published_to_channel, func.count()).group_by(NewsItem.is_published_to_channel)
+        )).all())
+        total_news = sum(counts.values())
+        published_news = counts.get(True, 0)
+        unpublished_news = counts.get(False, 0)
         
         return {
             "auto_publish_enabled": AUTO_PUBLISH_ENABLED,
@@ -219,8 +275,12 @@ async def get_publish_status(db: Session = Depends(get_db_session)):
             "settings": {
                 "interval_seconds": auto_publisher.interval,
                 "batch_limit": auto_publisher.limit,
+                "mode": auto_publisher.mode,
+                "digest_size": auto_publisher.digest_size,
                 "signature": auto_publisher.signature
-            }
+            },
+            # Курсоры каналов читаются синхронной сессией - вне event loop
+            "channels": await asyncio.to_thread(publishing_manager.get_status)
         }
     except Exception as e:
         logger.error(f"Error getting publish status: {e}")
@@ -231,25 +291,37 @@ async def get_publish_status(db: Session = Depends(get_db_session)):
 async def get_published_news(
     limit: int = 10,
     offset: int = 0,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Получает список опубликованных новостей
     """
     try:
-        published_news = db.query(NewsItem).filter(
-            NewsItem.is_published_to_channel == True
-        ).order_by(NewsItem.published_to_channel_at.desc()).offset(offset).limit(limit).all()
+        published_news = (await db.execute(
+            select(NewsItem).where(
+                NewsItem.is_published_to_channel == True
+            ).order_by(NewsItem.published_to_channel_at.desc()).offset(offset).limit(limit)
+        )).scalars().all()
+        
+        # Источники всех новостей - одним запросом
+        source_ids = {news.source_id for news in published_news}
+        sources = {}
+        if source_ids:
+            sources = {
+                source.id: source
+                for source in (await db.execute(select(NewsSource).where(NewsSource.id.in_(source_ids)))).scalars()
+            }
         
         result = []
         for news in published_news:
-            source = db.query(NewsSource).filter(NewsSource.id == news.source_id).first()
+            source = sources.get(news.source_id)
             result.append({
                 "id": news.id,
                 "title": news.title,
                 "category": news.category,
                 "published_at": news.published_to_channel_at.isoformat() if news.published_to_channel_at else None,
                 "telegram_message_id": news.telegram_message_id,
+                "telegram_message_ids": auto_publisher.get_published_message_ids(news),
                 "source_name": source.name if source else None,
                 "link": news.link
             })
@@ -264,13 +336,13 @@ async def get_published_news(
 
 
 @router.post("/publish-specific/{news_id}")
-async def publish_specific_news(news_id: int, db: Session = Depends(get_db_session)):
+async def publish_specific_news(news_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Публикует конкретную новость в канал
     """
     try:
         # Получаем новость
-        news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
+        news_item = (await db.execute(select(NewsItem).where(NewsItem.id == news_id))).scalar_one_or_none()
         if not news_item:
             raise HTTPException(status_code=404, detail="News not found")
         
@@ -282,8 +354,9 @@ async def publish_specific_news(news_id: int, db: Session = Depends(get_db_sessi
                 "published_at": news_item.published_to_channel_at.isoformat() if news_item.published_to_channel_at else None
             }
         
-        # Публикуем
-        message_id = await auto_publisher.publish_news_to_channel(news_item)
+        # Публикуем в канал, соответствующий маршруту новости
+        db.expunge(news_item)
+        message_id = await publishing_manager.publish_news(news_item)
         
         if message_id:
             return {
@@ -293,6 +366,8 @@ async def publish_specific_news(news_id: int, db: Session = Depends(get_db_sessi
             }
         else:
             raise HTTPException(status_code=500, detail="Failed to publish news")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error publishing specific news: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -327,47 +402,32 @@ async def test_bot():
 
 
 @router.delete("/unpublish/{news_id}")
-async def unpublish_news(news_id: int, db: Session = Depends(get_db_session)):
+async def unpublish_news(news_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Отменяет публикацию новости (удаляет из канала)
     """
     try:
         # Получаем новость
-        news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
+        news_item = (await db.execute(select(NewsItem).where(NewsItem.id == news_id))).scalar_one_or_none()
         if not news_item:
             raise HTTPException(status_code=404, detail="News not found")
         
-        if not news_item.is_published_to_channel or not news_item.telegram_message_id:
+        message_ids = auto_publisher.get_published_message_ids(news_item)
+        if not news_item.is_published_to_channel or not message_ids:
             raise HTTPException(status_code=400, detail="News is not published")
         
-        # Удаляем сообщение из канала
-        import requests
-        response = requests.post(
-            f"https://api.telegram.org/bot{auto_publisher.token}/deleteMessage",
-            data={
-                'chat_id': auto_publisher.channel_id,
-                'message_id': news_item.telegram_message_id
-            },
-            timeout=30
-        )
+        # Удаляем из канала все сообщения поста (альбом состоит из нескольких);
+        # дайджест содержит несколько новостей с общими сообщениями - снимаются все
+        report = await asyncio.to_thread(bulk_unpublish, news_ids=[news_id])
+        if report['failed_message_ids']:
+            raise HTTPException(status_code=500, detail=f"Failed to delete messages: {report['failed_message_ids']}")
         
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('ok'):
-                # Обновляем статус в базе данных
-                news_item.is_published_to_channel = False
-                news_item.published_to_channel_at = None
-                news_item.telegram_message_id = None
-                db.commit()
-                
-                return {
-                    "message": "News unpublished successfully",
-                    "news_id": news_id
-                }
-            else:
-                raise HTTPException(status_code=500, detail=f"Telegram API error: {result}")
-        else:
-            raise HTTPException(status_code=500, detail=f"HTTP error {response.status_code}")
+        return {
+            "message": "News unpublished successfully",
+            "news_id": news_id,
+            "unpublished_news_ids": report['unpublished_news_ids'],
+            "deleted_message_ids": message_ids
+        }
             
     except HTTPException:
         raise
@@ -376,6 +436,31 @@ async def unpublish_news(news_id: int, db: Session = Depends(get_db_session)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/unpublish")
+async def unpublish_news_bulk(request: BulkUnpublishRequest):
+    """
+    Массово снимает новости с публикации по списку ID, источнику, категории или периоду
+    """
+    try:
+        report = await asyncio.to_thread(
+            bulk_unpublish,
+            news_ids=request.news_ids,
+            source_id=request.source_id,
+            category=request.category,
+            date_from=request.date_from,
+            date_to=request.date_to
+        )
+        return {
+            "message": "Bulk unpublish finished",
+            **report
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in bulk unpublish: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/channel-info")
 async def get_channel_info():
     """
@@ -6,17 +6,32 @@ Telegram Bot для новостного агрегатора
 import logging
 import requests
 from typing import List, Dict, Any, Optional
+from sqlalchemy import func
 from config import TOKEN, WEBHOOK_URL
 from db import get_db_session, NewsItem, NewsSource
 from parsers.telegram_news_service import TelegramNewsService
+from services.media_registry import media_registry
+from services.render_cache import render_cache
+from services.read_replicas import get_read_db_session
+from services.hot_set import hot_set
+from services import subscriptions
 
 logger = logging.getLogger(__name__)
 
+CATEGORY_EMOJI = {
+    'gifts': '🎁',
+    'crypto': '💰',
+    'nft': '🖼️',
+    'tech': '💻',
+    'community': '👥'
+}
+
 class TelegramBot:
     def __init__(self):
         self.token = TOKEN
         self.webhook_url = WEBHOOK_URL
         self.news_service = TelegramNewsService()
+        self.loop = None  # Event loop приложения (команды обрабатываются в потоках воркеров)
         
     def send_message(self, chat_id: int, text: str, parse_mode: str = "HTML"):
         """Отправка сообщения в чат"""
@@ -50,11 +65,12 @@ class TelegramBot:
                 self.send_message(chat_id, "❌ Новость не найдена")
                 return
             
-            # Формируем текст новости
+            # Формируем текст новости (полный текст - из news_bodies)
+            content = news_item.content or ""
             text = f"""
 📰 <b>{news_item.title}</b>
 
-{news_item.content[:500]}{'...' if len(news_item.content) > 500 else ''}
+{content[:500]}{'...' if len(content) > 500 else ''}
 
 📅 Дата: {news_item.publish_date.strftime('%d.%m.%Y %H:%M')}
 🏷️ Категория: {news_item.category}
@@ -78,24 +94,41 @@ class TelegramBot:
             if 'db' in locals():
                 db.close()
     
+    def _send_media(self, chat_id: int, media: Dict[str, str], caption: str = "") -> bool:
+        """Отправка фото или видео с повторным использованием file_id"""
+        method = "sendPhoto" if media["type"] == "photo" else "sendVideo"
+        url = f"https://api.telegram.org/bot{self.token}/{method}"
+        media_value = media_registry.resolve(media)
+        
+        data = {
+            "chat_id": chat_id,
+            media["type"]: media_value,
+            "caption": caption,
+            "parse_mode": "HTML"
+        }
+        
+        response = requests.post(url, data=data, timeout=10)
+        if response.status_code != 200 and media_value != media["url"]:
+            # Сохраненный file_id больше не принимается - отправляем по исходному URL
+            media_registry.forget(media["url"])
+            data[media["type"]] = media["url"]
+            response = requests.post(url, data=data, timeout=10)
+        
+        if response.status_code == 200:
+            result = response.json().get("result") or {}
+            media_registry.remember_from_message(media, result)
+            return True
+        
+        logger.error(f"Ошибка отправки {media['type']}: {response.text}")
+        return False
+    
     def send_photo(self, chat_id: int, photo_url: str, caption: str = ""):
         """Отправка фото"""
         try:
-            url = f"https://api.telegram.org/bot{self.token}/sendPhoto"
-            data = {
-                "chat_id": chat_id,
-                "photo": photo_url,
-                "caption": caption,
-                "parse_mode": "HTML"
-            }
-            
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
+            if self._send_media(chat_id, {"type": "photo", "url": photo_url}, caption):
                 logger.info(f"Фото отправлено в чат {chat_id}")
                 return True
-            else:
-                logger.error(f"Ошибка отправки фото: {response.text}")
-                return False
+            return False
                 
         except Exception as e:
             logger.error(f"Ошибка отправки фото: {e}")
@@ -104,21 +137,10 @@ class TelegramBot:
     def send_video(self, chat_id: int, video_url: str, caption: str = ""):
         """Отправка видео"""
         try:
-            url = f"https://api.telegram.org/bot{self.token}/sendVideo"
-            data = {
-                "chat_id": chat_id,
-                "video": video_url,
-                "caption": caption,
-                "parse_mode": "HTML"
-            }
-            
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
+            if self._send_media(chat_id, {"type": "video", "url": video_url}, caption):
                 logger.info(f"Видео отправлено в чат {chat_id}")
                 return True
-            else:
-                logger.error(f"Ошибка отправки видео: {response.text}")
-                return False
+            return False
                 
         except Exception as e:
             logger.error(f"Ошибка отправки видео: {e}")
@@ -145,6 +167,12 @@ class TelegramBot:
                 self.send_help_message(chat_id)
             elif command == "/publish":
                 self.publish_to_channel(chat_id)
+            elif command == "/subscribe":
+                self.handle_subscribe(chat_id, args)
+            elif command == "/unsubscribe":
+                self.handle_unsubscribe(chat_id, args)
+            elif command == "/subscriptions":
+                self.send_subscriptions(chat_id)
             else:
                 self.send_message(chat_id, "❓ Неизвестная команда. Используйте /help для списка команд.")
                 
@@ -152,6 +180,40 @@ class TelegramBot:
             logger.error(f"Ошибка обработки команды {command}: {e}")
             self.send_message(chat_id, "❌ Произошла ошибка при обработке команды")
     
+    def handle_subscribe(self, chat_id: int, args: List[str]):
+        """Подписка чата на новости категории"""
+        category = args[0].lower() if args else ""
+        if category not in subscriptions.SUBSCRIPTION_CATEGORIES:
+            self.send_message(
+                chat_id,
+                "🔔 Использование: /subscribe &lt;категория&gt;\n"
+                f"Доступные категории: {', '.join(subscriptions.SUBSCRIPTION_CATEGORIES)}"
+            )
+            return
+        
+        if subscriptions.subscribe(chat_id, category):
+            self.send_message(chat_id, f"✅ Вы подписались на новости: {category}")
+        else:
+            self.send_message(chat_id, f"ℹ️ Подписка на {category} уже оформлена")
+    
+    def handle_unsubscribe(self, chat_id: int, args: List[str]):
+        """Отписка чата от категории (без аргумента или 'all' - от всех)"""
+        category = args[0].lower() if args else None
+        removed = subscriptions.unsubscribe(chat_id, None if category in (None, "all") else category)
+        
+        if removed:
+            self.send_message(chat_id, "✅ Подписка отменена")
+        else:
+            self.send_message(chat_id, "ℹ️ Активных подписок не найдено")
+    
+    def send_subscriptions(self, chat_id: int):
+        """Список подписок чата"""
+        categories = subscriptions.get_chat_subscriptions(chat_id)
+        if categories:
+            self.send_message(chat_id, f"🔔 Ваши подписки: {', '.join(categories)}")
+        else:
+            self.send_message(chat_id, "🔕 Подписок нет. Используйте /subscribe &lt;категория&gt;")
+    
     def send_start_message(self, chat_id: int):
         """Отправка приветственного сообщения"""
         text = """
@@ -170,6 +232,8 @@ class TelegramBot:
 /gifts - Подарки и акции
 /tech - Технологии
 /stats - Статистика
+/subscribe - Подписаться на категорию
+/unsubscribe - Отменить подписку
 /publish - Опубликовать в канал
 /help - Помощь
 
@@ -188,6 +252,9 @@ class TelegramBot:
 /gifts - Подарки, акции и промокоды
 /tech - Новости технологий и IT
 /stats - Статистика новостей
+/subscribe &lt;категория&gt; - Получать новые новости категории (all - все)
+/unsubscribe [категория] - Отменить подписку
+/subscriptions - Ваши подписки
 /publish - Опубликовать новости в канал
 /help - Показать эту справку
 
@@ -200,38 +267,7 @@ class TelegramBot:
     
     def send_news_summary(self, chat_id: int, limit: int = 5, category: str = None):
         """Отправка сводки новостей"""
-        try:
-            db = get_db_session()
-            
-            query = db.query(NewsItem)
-            if category and category != "all":
-                query = query.filter(NewsItem.category == category)
-            
-            news_items = query.order_by(NewsItem.publish_date.desc()).limit(limit).all()
-            
-            if not news_items:
-                self.send_message(chat_id, "📭 Новостей пока нет")
-                return
-            
-            text = f"📰 <b>Последние новости"
-            if category:
-                text += f" ({category})"
-            text += ":</b>\n\n"
-            
-            for i, news in enumerate(news_items, 1):
-                text += f"{i}. <b>{news.title}</b>\n"
-                text += f"📅 {news.publish_date.strftime('%d.%m %H:%M')}\n"
-                text += f"🏷️ {news.category}\n"
-                text += f"🔗 <a href='{news.link}'>Читать</a>\n\n"
-            
-            self.send_message(chat_id, text)
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки сводки новостей: {e}")
-            self.send_message(chat_id, "❌ Ошибка получения новостей")
-        finally:
-            if 'db' in locals():
-                db.close()
+        self.send_message(chat_id, self.get_news_summary(limit, category))
     
     def send_news_by_category(self, chat_id: int, category: str, limit: int = 5):
         """Отправка новостей по категории"""
@@ -239,134 +275,109 @@ class TelegramBot:
     
     def send_stats(self, chat_id: int):
         """Отправка статистики"""
-        try:
-            db = get_db_session()
-            
-            total_news = db.query(NewsItem).count()
-            
-            # Статистика по категориям
-            categories_stats = {}
-            categories = db.query(NewsItem.category).distinct().all()
-            
-            for cat in categories:
-                if cat[0]:
-                    count = db.query(NewsItem).filter(NewsItem.category == cat[0]).count()
-                    categories_stats[cat[0]] = count
-            
-            text = "📊 <b>Статистика новостей:</b>\n\n"
-            text += f"📰 Всего новостей: {total_news}\n\n"
-            
-            for category, count in categories_stats.items():
-                emoji = {
-                    'gifts': '🎁',
-                    'crypto': '💰',
-                    'nft': '🖼️',
-                    'tech': '💻',
-                    'community': '👥'
-                }.get(category, '📢')
-                text += f"{emoji} {category}: {count}\n"
-            
-            self.send_message(chat_id, text)
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки статистики: {e}")
-            self.send_message(chat_id, "❌ Ошибка получения статистики")
-        finally:
-            if 'db' in locals():
-                db.close()
+        self.send_message(chat_id, self.get_stats())
     
     def get_news_summary(self, limit: int = 5, category: str = None) -> str:
-        """Получение сводки новостей в виде текста"""
+        """Получение сводки новостей в виде текста (из кэша готовых ответов)"""
         try:
-            db = get_db_session()
-            
-            query = db.query(NewsItem)
-            if category and category != "all":
-                query = query.filter(NewsItem.category == category)
-            
-            news_items = query.order_by(NewsItem.publish_date.desc()).limit(limit).all()
-            
-            if not news_items:
-                return "📭 Новостей пока нет"
-            
-            text = f"📰 <b>Последние новости"
-            if category:
-                text += f" ({category})"
-            text += ":</b>\n\n"
-            
-            for i, news in enumerate(news_items, 1):
-                text += f"{i}. <b>{news.title}</b>\n"
-                text += f"📅 {news.publish_date.strftime('%d.%m %H:%M')}\n"
-                text += f"🏷️ {news.category}\n"
-                text += f"🔗 <a href='{news.link}'>Читать</a>\n\n"
-            
-            return text
-            
+            return render_cache.get_or_render(
+                ("news", category, limit),
+                lambda: self.render_news_summary(limit, category)
+            )
         except Exception as e:
             logger.error(f"Ошибка получения сводки новостей: {e}")
             return "❌ Ошибка получения новостей"
-        finally:
-            if 'db' in locals():
-                db.close()
     
     def get_stats(self) -> str:
-        """Получение статистики в виде текста"""
+        """Получение статистики в виде текста (из кэша готовых ответов)"""
         try:
-            db = get_db_session()
-            
-            total_news = db.query(NewsItem).count()
-            
-            # Статистика по категориям
-            categories_stats = {}
-            categories = db.query(NewsItem.category).distinct().all()
-            
-            for cat in categories:
-                if cat[0]:
-                    count = db.query(NewsItem).filter(NewsItem.category == cat[0]).count()
-                    categories_stats[cat[0]] = count
-            
-            text = "📊 <b>Статистика новостей:</b>\n\n"
-            text += f"📰 Всего новостей: {total_news}\n\n"
-            
-            for category, count in categories_stats.items():
-                emoji = {
-                    'gifts': '🎁',
-                    'crypto': '💰',
-                    'nft': '🖼️',
-                    'tech': '💻',
-                    'community': '👥'
-                }.get(category, '📢')
-                text += f"{emoji} {category}: {count}\n"
-            
-            return text
-            
+            return render_cache.get_or_render(("stats", None, None), self.render_stats)
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
             return "❌ Ошибка получения статистики"
-        finally:
-            if 'db' in locals():
+    
+    def render_news_summary(self, limit: int = 5, category: str = None) -> str:
+        """Рендеринг сводки новостей из памяти (hot_set) или из базы данных (с реплики, если она настроена)"""
+        news_items = hot_set.latest(category, limit)
+        if news_items is None:
+            db = get_read_db_session()
+            try:
+                query = db.query(NewsItem.title, NewsItem.publish_date, NewsItem.category, NewsItem.link)
+                if category and category != "all":
+                    query = query.filter(NewsItem.category == category)
+                
+                news_items = query.order_by(NewsItem.publish_date.desc()).limit(limit).all()
+            finally:
                 db.close()
+        
+        if not news_items:
+            return "📭 Новостей пока нет"
+        
+        text = f"📰 <b>Последние новости"
+        if category:
+            text += f" ({category})"
+        text += ":</b>\n\n"
+        
+        for i, news in enumerate(news_items, 1):
+            text += f"{i}. <b>{news.title}</b>\n"
+            text += f"📅 {news.publish_date.strftime('%d.%m %H:%M')}\n"
+            text += f"🏷️ {news.category}\n"
+            text += f"🔗 <a href='{news.link}'>Читать</a>\n\n"
+        
+        return text
+    
+    def render_stats(self) -> str:
+        """Рендеринг статистики из базы данных (с реплики, если она настроена)"""
+        db = get_read_db_session()
+        try:
+            # Статистика по категориям одним запросом
+            rows = db.query(NewsItem.category, func.count(NewsItem.id)).group_by(NewsItem.category).all()
+        finally:
+            db.close()
+        
+        total_news = sum(count for _, count in rows)
+        categories_stats = {category: count for category, count in rows if category}
+        
+        text = "📊 <b>Статистика новостей:</b>\n\n"
+        text += f"📰 Всего новостей: {total_news}\n\n"
+        
+        for category, count in categories_stats.items():
+            emoji = CATEGORY_EMOJI.get(category, '📢')
+            text += f"{emoji} {category}: {count}\n"
+        
+        return text
     
     def publish_to_channel(self, chat_id: int):
         """Публикация новостей в канал"""
         try:
-            from services.auto_publisher import auto_publisher
+            from services.auto_publisher import publishing_manager
             
             # Запускаем публикацию напрямую
             import asyncio
             
-            # Создаем новую задачу для публикации
+            # Публикация идет через реестр задач: повторное нажатие присоединяется к текущей.
+            # send_message блокирующий - в event loop отправляем через поток
             async def publish_task():
                 try:
-                    await auto_publisher.publish_batch(force=True)
-                    self.send_message(chat_id, "✅ Публикация новостей в канал завершена!")
+                    job, created = await publishing_manager.submit_publish_job()
+                    if created:
+                        started = "🚀 Публикация новостей в канал запущена..."
+                    else:
+                        started = "⏳ Публикация уже идет, дождитесь завершения..."
+                    await asyncio.to_thread(self.send_message, chat_id, started)
+                    await job.wait()
+                    await asyncio.to_thread(
+                        self.send_message, chat_id, f"✅ Публикация новостей в канал завершена! Опубликовано: {job.sent}"
+                    )
                 except Exception as e:
                     logger.error(f"Ошибка в задаче публикации: {e}")
-                    self.send_message(chat_id, f"❌ Ошибка публикации: {str(e)}")
+                    await asyncio.to_thread(self.send_message, chat_id, f"❌ Ошибка публикации: {str(e)}")
             
-            # Запускаем задачу
-            asyncio.create_task(publish_task())
-            self.send_message(chat_id, "🚀 Публикация новостей в канал запущена...")
+            # Запускаем задачу: из потока воркера - в основном event loop приложения
+            try:
+                asyncio.get_running_loop().create_task(publish_task())
+            except RuntimeError:
+                asyncio.run_coroutine_threadsafe(publish_task(), self.loop)
                 
         except Exception as e:
             logger.error(f"Ошибка публикации в канал: {e}")
@@ -6,6 +6,24 @@ load_dotenv()
 # Настройки базы данных - для Render
 # Получаем DATABASE_URL из переменных окружения или используем SQLite для локальной разработки
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./news.db")
+# SSL для PostgreSQL (Render требует require; disable - для локального сервера без SSL)
+DATABASE_SSL_MODE = os.getenv("DATABASE_SSL_MODE", "require")
+
+# Пул соединений PostgreSQL (отдельно у синхронного и асинхронного движка, в каждом процессе)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # 0 - без пула в приложении (NullPool), например за PgBouncer
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Соединений сверх DB_POOL_SIZE при пиках
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Ожидание свободного соединения (секунды)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))  # Переоткрывать соединения старше (секунды)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "idle")  # always - проверять при каждой выдаче, idle - после простоя, never
+DB_POOL_PRE_PING_IDLE = float(os.getenv("DB_POOL_PRE_PING_IDLE", "30"))  # Простой, после которого idle проверяет соединение (секунды)
+# PgBouncer в режиме transaction: без именованных prepared statements asyncpg и без LISTEN.
+# Миграции (pg_advisory_lock) запускайте с DATABASE_URL напрямую к PostgreSQL
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# Реплики для маршрутов только на чтение (URL через запятую; пусто - все читают с основной базы)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+READ_REPLICA_MAX_LAG = float(os.getenv("READ_REPLICA_MAX_LAG", "10"))  # Отставание, после которого реплика не используется (секунды)
+READ_REPLICA_CHECK_INTERVAL = int(os.getenv("READ_REPLICA_CHECK_INTERVAL", "5"))  # Как часто проверять реплики (секунды)
 
 # Настройки Telegram Bot
 TOKEN = os.getenv("TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN", "8429342375:AAFl55U3d2jiq3bm4UNTyDrbB0rztFTio2I")
@@ -14,24 +32,99 @@ WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://gift-propaganda-cf8i.onrender.co
 # Настройки для автоматической публикации постов в канал    
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@gift_propaganda_channel")  # ID канала для публикации
 AUTO_PUBLISH_ENABLED = os.getenv("AUTO_PUBLISH_ENABLED", "false").lower() == "true"  # ОТКЛЮЧЕНО по умолчанию
-AUTO_PUBLISH_INTERVAL = int(os.getenv("AUTO_PUBLISH_INTERVAL", "3600"))  # Интервал публикации в секундах (1 час)
+AUTO_PUBLISH_INTERVAL = int(os.getenv("AUTO_PUBLISH_INTERVAL", "3600"))  # Страховочная проверка, если уведомления о новостях недоступны (секунды)
+AUTO_PUBLISH_MIN_SPACING = int(os.getenv("AUTO_PUBLISH_MIN_SPACING", "60"))  # Минимальный промежуток между пакетами в канал (секунды)
 AUTO_PUBLISH_LIMIT = int(os.getenv("AUTO_PUBLISH_LIMIT", "5"))  # Количество постов за раз
+AUTO_PUBLISH_MODE = os.getenv("AUTO_PUBLISH_MODE", "single")  # single - пост на новость, digest - несколько новостей в одном посте
+AUTO_PUBLISH_DIGEST_SIZE = int(os.getenv("AUTO_PUBLISH_DIGEST_SIZE", "10"))  # Максимум новостей в дайджесте
+AUTO_PUBLISH_RATE_PER_MINUTE = float(os.getenv("AUTO_PUBLISH_RATE_PER_MINUTE", "12"))  # Постов в минуту в один канал
+
+# Маршрутизация по каналам (JSON-список). Каждая новость уходит в первый подходящий канал, пример:
+# [{"channel_id": "@crypto_channel", "categories": ["crypto"], "interval": 1800, "limit": 5},
+#  {"channel_id": "@nft_channel", "categories": ["nft", "gifts"], "sources": ["@nextgen_NFT"], "mode": "digest"}]
+# Поддерживаемые ключи: channel_id, categories, sources, keywords, interval, min_spacing, limit, mode, digest_size, rate_per_minute
+# interval маршрута - период публикации канала: пакеты не чаще раза в interval секунд (если не задан min_spacing)
+# Если не задано - одна публикация всех новостей в CHANNEL_ID
+PUBLISH_CHANNELS = os.getenv("PUBLISH_CHANNELS", "")
+
+# Будить публикацию в других процессах через PostgreSQL LISTEN/NOTIFY (на SQLite не используется)
+PG_NOTIFY_ENABLED = os.getenv("PG_NOTIFY_ENABLED", "true").lower() == "true"
+
+# Настройки SQLite, применяются к каждому соединению (пустое значение - оставить по умолчанию)
+SQLITE_BUSY_TIMEOUT = os.getenv("SQLITE_BUSY_TIMEOUT", "5000")  # Ожидание блокировки, мс
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # Читатели не блокируют писателя
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # В режиме WAL безопасно при сбое процесса
+SQLITE_CACHE_SIZE = os.getenv("SQLITE_CACHE_SIZE", "-65536")  # Отрицательное значение - в КиБ (64 МБ)
+SQLITE_MMAP_SIZE = os.getenv("SQLITE_MMAP_SIZE", "268435456")  # 256 МБ
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+
+# Миграции схемы применяются при деплое (scripts/migrate.py); true - применять при старте приложения
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true"
+# Пока в news_items остались колонки текста (до миграции 011), текст новости пишется и в них - для воркеров
+# прошлой версии во время раскатки. false на всех воркерах - перед применением 011
+NEWS_BODY_DUAL_WRITE = os.getenv("NEWS_BODY_DUAL_WRITE", "true").lower() == "true"
+
+# Хранение новостей: старые новости архивируются в ARCHIVE_DIR (gzip JSONL) и удаляются из базы
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "180"))  # Срок хранения по умолчанию (0 - хранить всегда)
+RETENTION_CATEGORY_DAYS = os.getenv("RETENTION_CATEGORY_DAYS", "")  # JSON, например {"crypto": 30, "nft": 365}
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "86400"))  # Как часто запускать архивацию (секунды)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))  # Новостей на пакет архивации/удаления
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+
+# Помесячное секционирование news_items по publish_date (только PostgreSQL, включается scripts/partitions.py enable)
+PARTITIONING_ENABLED = os.getenv("PARTITIONING_ENABLED", "false").lower() == "true"
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))  # Секций заранее на будущие месяцы
+PARTITION_RETAIN_MONTHS = int(os.getenv("PARTITION_RETAIN_MONTHS", "0"))  # Старше - отключать секцию (0 - хранить все)
+PARTITION_EXPIRED_ACTION = os.getenv("PARTITION_EXPIRED_ACTION", "detach")  # detach - оставить отдельной таблицей, archive - в ARCHIVE_DIR
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))  # Секунды
+
+# Очередь входящих webhook-обновлений
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))  # Максимум обновлений в очереди
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))  # Количество воркеров обработки
+WEBHOOK_DEDUP_WINDOW = int(os.getenv("WEBHOOK_DEDUP_WINDOW", "1000"))  # Сколько последних update_id помнить
+
+# Общий кэш: memory - в каждом процессе, redis - один на все воркеры (REDIS_URL)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))  # Записей в памяти процесса (LRU)
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "giftnews:")  # Префикс ключей в Redis
+
+# Кэш готовых ответов бота (сбрасывается при появлении новостей, TTL - страховка)
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "300"))
+# Кэш страниц ленты, категорий и статистики API (сбрасывается при появлении новостей; счетчики просмотров отстают на TTL)
+FEED_CACHE_TTL = int(os.getenv("FEED_CACHE_TTL", "30"))
+SOURCE_CACHE_TTL = int(os.getenv("SOURCE_CACHE_TTL", "3600"))  # Справочник источников
+
+# Последние новости каждой категории в памяти воркера: первые страницы ленты и сводки бота без запросов к базе
+HOT_SET_SIZE = int(os.getenv("HOT_SET_SIZE", "100"))  # Новостей на категорию (0 - отключено)
+HOT_SET_REFRESH_INTERVAL = int(os.getenv("HOT_SET_REFRESH_INTERVAL", "300"))  # Полная перезагрузка (секунды; счетчики просмотров отстают на нее)
+
+# Дельта-синхронизация ленты (/api/news/changes)
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "2"))  # Изменения моложе не отдаются: транзакции с более ранним updated_at успевают закоммититься
+CHANGES_TOMBSTONE_DAYS = int(os.getenv("CHANGES_TOMBSTONE_DAYS", "30"))  # Сколько хранить записи об удаленных новостях; курсор старше - полная перезагрузка
+
+# Поток новых новостей для мини-приложения (/api/news/stream - SSE, /api/news/ws - WebSocket)
+STREAM_HEARTBEAT = int(os.getenv("STREAM_HEARTBEAT", "15"))  # Пинг простаивающего соединения (секунды)
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "100"))  # Событий в очереди соединения; переполнение - разрыв, клиент продолжит с Last-Event-ID
+STREAM_HISTORY_SIZE = int(os.getenv("STREAM_HISTORY_SIZE", "1000"))  # Последних событий в памяти для продолжения без запросов к базе
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "10000"))  # Соединений на воркер
+STREAM_CATCHUP_WINDOW = int(os.getenv("STREAM_CATCHUP_WINDOW", "200"))  # ID ниже последнего, которые перечитываются по NOTIFY (поздние коммиты других воркеров)
+
+# Рассылка новостей подписчикам бота
+FANOUT_MODE = os.getenv("FANOUT_MODE", "instant")  # instant - сразу после сохранения, digest - раз в интервал, off - отключено
+FANOUT_DIGEST_INTERVAL = int(os.getenv("FANOUT_DIGEST_INTERVAL", "3600"))  # Интервал дайджеста в секундах
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "20"))  # Одновременных запросов к Bot API
+FANOUT_RATE = float(os.getenv("FANOUT_RATE", "25"))  # Сообщений в секунду (лимит Telegram ~30)
+FANOUT_PAGE_SIZE = int(os.getenv("FANOUT_PAGE_SIZE", "1000"))  # Подписчиков за один запрос к базе
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
 
 # Подпись для постов (будет добавляться в конец каждого поста)
 POST_SIGNATURE = os.getenv("POST_SIGNATURE", "🎁 Gift Propaganda - Ваш источник лучших новостей!")
 SOURCE_LINK_TEXT = os.getenv("SOURCE_LINK_TEXT", "📰 Читать источник")
 
-# Настройки Redis (если используется)
+# Настройки Redis (CACHE_BACKEND=redis)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
 # Другие настройки
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-
-# Логирование для отладки
-print(f"DATABASE_URL: {DATABASE_URL[:50]}...")
-print(f"TOKEN: {'SET' if TOKEN else 'NOT SET'}")
-print(f"WEBHOOK_URL: {WEBHOOK_URL}")
-print(f"CHANNEL_ID: {CHANNEL_ID}")
-print(f"AUTO_PUBLISH_ENABLED: {AUTO_PUBLISH_ENABLED} (ОТКЛЮЧЕНО - только ручная публикация)")
-print(f"AUTO_PUBLISH_INTERVAL: {AUTO_PUBLISH_INTERVAL} seconds")
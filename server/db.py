@@ -1,35 +1,308 @@
 # server/db.py
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey, text
+from sqlalchemy import create_engine, event, inspect, Column, Integer, BigInteger, String, Text, DateTime, Boolean, JSON, ForeignKey, Index, UniqueConstraint, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from datetime import datetime
 import os
+import threading
+import time
+import uuid
+
+from config import (
+    DATABASE_SSL_MODE,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_POOL_PRE_PING_IDLE, DB_PGBOUNCER,
+    SQLITE_BUSY_TIMEOUT, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_TEMP_STORE, NEWS_BODY_DUAL_WRITE
+)
+from services.metrics import register_metrics
 
 # Получаем URL базы данных из переменных окружения
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./news.db")
 
-# Создаем движок базы данных
-if DATABASE_URL.startswith("sqlite"):
-    # Для SQLite
-    engine = create_engine(
-        DATABASE_URL,
+# PRAGMA для каждого соединения SQLite; busy_timeout первым, чтобы смена журнала дождалась блокировки
+SQLITE_PRAGMAS = {
+    'busy_timeout': SQLITE_BUSY_TIMEOUT,
+    'journal_mode': SQLITE_JOURNAL_MODE,
+    'synchronous': SQLITE_SYNCHRONOUS,
+    'cache_size': SQLITE_CACHE_SIZE,
+    'mmap_size': SQLITE_MMAP_SIZE,
+    'temp_store': SQLITE_TEMP_STORE,
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    """Применяет PRAGMA к новому соединению SQLite (пустые значения пропускаются)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+class _TimedPoolMixin:
+    """Счетчики выдачи соединений пула: сколько раз, сколько ждали, сколько раз не дождались"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # Ожидание свободного соединения (и открытие нового, если пул еще не заполнен)
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(async_engine=False):
+    """Параметры пула PostgreSQL из настроек DB_POOL_*"""
+    if DB_POOL_SIZE <= 0:
+        # Пулом занимается PgBouncer: соединение открывается на время сессии
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": TimedAsyncQueuePool if async_engine else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING == "always",
+        "pool_reset_on_return": 'commit',
+    }
+
+
+def ping_idle_connections(engine, idle_seconds=DB_POOL_PRE_PING_IDLE):
+    """
+    Проверяет соединение при выдаче из пула, только если оно простаивало дольше
+    idle_seconds: активно используемые соединения выдаются без лишнего запроса.
+    Оборванное соединение заменяется новым (DisconnectionError - повтор выдачи)
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            raise DisconnectionError(f"Idle connection is dead: {e}") from e
+
+    event.listen(sync_engine, "checkin", on_checkin)
+    event.listen(sync_engine, "checkout", on_checkout)
+
+
+def build_engine(url=None):
+    """Создает движок базы данных с настройками для SQLite или PostgreSQL"""
+    url = url or DATABASE_URL
+    if url.startswith("sqlite"):
+        # Для SQLite
+        sqlite_engine = create_engine(
+            url,
+            echo=False,
+            connect_args={"check_same_thread": False}
+        )
+        event.listen(sqlite_engine, "connect", lambda dbapi_connection, record: set_sqlite_pragmas(dbapi_connection))
+        return sqlite_engine
+
+    # Для PostgreSQL (psycopg2 не использует серверные prepared statements - с PgBouncer работает как есть)
+    postgres_engine = create_engine(
+        url,
+        connect_args={"sslmode": DATABASE_SSL_MODE},
         echo=False,
-        connect_args={"check_same_thread": False}
+        **pool_options()
     )
-else:
-    # Для PostgreSQL
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"sslmode": "require"},
+    if DB_POOL_SIZE > 0 and DB_POOL_PRE_PING == "idle":
+        ping_idle_connections(postgres_engine)
+    return postgres_engine
+
+
+def async_database_url(url=None):
+    """URL для асинхронного драйвера: aiosqlite для SQLite, asyncpg для PostgreSQL"""
+    url = make_url(url or DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    return url
+
+
+def build_async_engine(url=None):
+    """Асинхронный движок для маршрутов FastAPI с теми же настройками, что у синхронного"""
+    url = async_database_url(url)
+    if url.get_backend_name() == "sqlite":
+        sqlite_engine = create_async_engine(url, echo=False)
+        event.listen(
+            sqlite_engine.sync_engine, "connect",
+            lambda dbapi_connection, record: set_sqlite_pragmas(dbapi_connection)
+        )
+        return sqlite_engine
+
+    connect_args = {"ssl": DATABASE_SSL_MODE}
+    if DB_PGBOUNCER:
+        # В режиме transaction соседние транзакции идут через разные серверные соединения:
+        # кэш prepared statements отключен, а имена уникальны, чтобы не столкнуться с чужими
+        url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+
+    postgres_engine = create_async_engine(
+        url,
+        connect_args=connect_args,
         echo=False,
-        pool_pre_ping=True,
-        pool_recycle=300,
-        pool_reset_on_return='commit'
+        **pool_options(async_engine=True)
     )
+    if DB_POOL_SIZE > 0 and DB_POOL_PRE_PING == "idle":
+        ping_idle_connections(postgres_engine)
+    return postgres_engine
+
+
+class LazyEngine:
+    """
+    Движок, создаваемый при первом обращении, а не при импорте модуля.
+    В процессе, полученном через fork (воркеры uvicorn/gunicorn), создается
+    новый движок: соединения пула родителя ему не передаются и не закрываются
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._engine = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._engine is None or self._pid != os.getpid():
+            with self._lock:
+                if self._engine is None or self._pid != os.getpid():
+                    if self._engine is not None:
+                        # Унаследованный пул забываем без закрытия соединений родителя
+                        getattr(self._engine, "sync_engine", self._engine).dispose(close=False)
+                    self._engine = self.factory()
+                    self._pid = os.getpid()
+        return self._engine
+
+    @property
+    def created(self) -> bool:
+        return self._engine is not None and self._pid == os.getpid()
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker, который привязывает каждую сессию к движку текущего процесса"""
+
+    def __init__(self, lazy_engine: LazyEngine, **kw):
+        super().__init__(**kw)
+        self.lazy_engine = lazy_engine
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            local_kw.setdefault("bind", self.lazy_engine.get())
+        return super().__call__(**local_kw)
+
+
+class LazyAsyncSessionmaker(async_sessionmaker):
+    """async_sessionmaker, который привязывает каждую сессию к движку текущего процесса"""
+
+    def __init__(self, lazy_engine: LazyEngine, **kw):
+        super().__init__(**kw)
+        self.lazy_engine = lazy_engine
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            local_kw.setdefault("bind", self.lazy_engine.get())
+        return super().__call__(**local_kw)
+
+
+# Движки создаются при первом запросе к базе (импорт модуля не открывает соединений)
+_engine = LazyEngine(build_engine)
+# Асинхронный движок для маршрутов API (запросы не блокируют event loop)
+_async_engine = LazyEngine(build_async_engine)
+
+
+def get_engine():
+    return _engine.get()
+
+
+def get_async_engine():
+    return _async_engine.get()
+
+
+def __getattr__(name):
+    # db.engine и from db import engine - движок текущего процесса
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def dispose_engines():
+    """Закрывает пулы соединений процесса (при остановке приложения)"""
+    if _async_engine.created:
+        await _async_engine.get().dispose()
+    if _engine.created:
+        _engine.get().dispose()
+
+
+def pool_stats(lazy_engine: LazyEngine):
+    """Текущее состояние пула движка (движок не создается, если его еще нет)"""
+    if not lazy_engine.created:
+        return {"created": False}
+    pool = getattr(lazy_engine.get(), "sync_engine", lazy_engine.get()).pool
+    stats = {"created": True, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # overflow() отрицателен, пока пул не заполнен до pool_size
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, _TimedPoolMixin):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "wait_avg_ms": round(pool.wait_total / pool.checkouts * 1000, 2) if pool.checkouts else 0.0,
+            "wait_max_ms": round(pool.wait_max * 1000, 2),
+            "timeouts": pool.timeouts,
+        })
+    return stats
+
+
+register_metrics("db_pool", lambda: {"sync": pool_stats(_engine), "async": pool_stats(_async_engine)})
+
 
 # Сессии
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = LazySessionmaker(_engine, autocommit=False, autoflush=False)
+# expire_on_commit=False: после коммита атрибуты остаются доступны без ленивой загрузки
+AsyncSessionLocal = LazyAsyncSessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
 
@@ -44,13 +317,71 @@ class NewsSource(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+# Длина анонса новости в ленте (news_items.summary)
+SUMMARY_LENGTH = 300
+
+
+def make_summary(content):
+    """Анонс для ленты: начало текста новости без лишних пробелов"""
+    text = " ".join((content or "").split())
+    if len(text) <= SUMMARY_LENGTH:
+        return text
+    return text[:SUMMARY_LENGTH - 1].rstrip() + "…"
+
+
+class NewsBody(Base):
+    """Полный текст новости; читают только карточка новости и публикация, лента - нет"""
+    __tablename__ = 'news_bodies'
+    news_id = Column(Integer, ForeignKey('news_items.id', ondelete='CASCADE'), primary_key=True)
+    content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+
+
+# Колонки текста, остающиеся в news_items между миграциями 008 (expand) и 011 (contract)
+LEGACY_BODY_COLUMNS = ('content', 'content_html')
+# Есть ли они в базе (по URL движка): проверяется при первой записи текста
+_legacy_body_columns = {}
+
+
+def has_legacy_body_columns(connection) -> bool:
+    if not NEWS_BODY_DUAL_WRITE:
+        return False
+    key = str(connection.engine.url)
+    if key not in _legacy_body_columns:
+        columns = {column['name'] for column in inspect(connection).get_columns('news_items')}
+        _legacy_body_columns[key] = set(LEGACY_BODY_COLUMNS) <= columns
+    return _legacy_body_columns[key]
+
+
+def write_legacy_bodies(connection, bodies):
+    """
+    Дублирует тексты (строки news_bodies) в колонки news_items, пока они есть:
+    воркеры прошлой версии во время раскатки читают текст оттуда
+    """
+    if bodies and has_legacy_body_columns(connection):
+        connection.execute(
+            text("UPDATE news_items SET content = :content, content_html = :content_html WHERE id = :news_id"),
+            [
+                {"news_id": body["news_id"], "content": body["content"], "content_html": body.get("content_html")}
+                for body in bodies
+            ]
+        )
+
+
+@event.listens_for(NewsBody, "after_insert")
+@event.listens_for(NewsBody, "after_update")
+def _dual_write_body(mapper, connection, target):
+    write_legacy_bodies(connection, [
+        {"news_id": target.news_id, "content": target.content, "content_html": target.content_html}
+    ])
+
+
 class NewsItem(Base):
     __tablename__ = 'news_items'
     id = Column(Integer, primary_key=True)
     source_id = Column(Integer, ForeignKey('news_sources.id'), nullable=False)  # Жёсткая связь
     title = Column(String(1000), nullable=False)
-    content = Column(Text, nullable=False)
-    content_html = Column(Text, nullable=True)
+    summary = Column(String(SUMMARY_LENGTH), nullable=True)  # Анонс для ленты (полный текст - в news_bodies)
     link = Column(String(1000), nullable=False)
     publish_date = Column(DateTime, nullable=False)
     category = Column(String(100), nullable=False)
@@ -68,65 +399,147 @@ class NewsItem(Base):
     is_published_to_channel = Column(Boolean, default=False)  # Опубликован ли пост в канал
     published_to_channel_at = Column(DateTime, nullable=True)  # Когда был опубликован
     telegram_message_id = Column(Integer, nullable=True)  # ID сообщения в Telegram канале
+    telegram_message_ids = Column(JSON, nullable=True)  # Все ID сообщений поста (альбом может занимать несколько)
+    telegram_chat_id = Column(String(255), nullable=True)  # Канал, в который опубликован пост
+    post_text = Column(Text, nullable=True)  # Готовый HTML-текст поста для канала
+    post_render_error = Column(String(255), nullable=True)  # Причина, по которой пост нельзя опубликовать
     
     source = relationship("NewsSource")  # Для удобного доступа
+    # Тяжелый текст вынесен в news_bodies (миграция 008) и загружается только при обращении
+    body = relationship("NewsBody", uselist=False, lazy="select", cascade="all, delete-orphan")
+
+    def _ensure_body(self) -> "NewsBody":
+        if self.body is None:
+            self.body = NewsBody(content="")
+        return self.body
+
+    @property
+    def content(self):
+        """Текст новости (plain text) из news_bodies"""
+        return self.body.content if self.body is not None else None
+
+    @content.setter
+    def content(self, value):
+        self._ensure_body().content = value or ""
+        self.summary = make_summary(value)
+
+    @property
+    def content_html(self):
+        """HTML-текст новости из news_bodies"""
+        return self.body.content_html if self.body is not None else None
+
+    @content_html.setter
+    def content_html(self, value):
+        self._ensure_body().content_html = value
+    
+    __table_args__ = (
+        # Общая лента по дате: на секционированной таблице - упорядоченный обход секций (миграция 013)
+        Index('ix_news_items_publish_date', publish_date.desc()),
+        # Лента категории по дате и очередь неопубликованных (миграция 007)
+        Index('ix_news_items_category_publish_date', 'category', 'publish_date'),
+        Index('ix_news_items_unpublished', 'is_published_to_channel', 'publish_date'),
+        # Изменения с курсора для /api/news/changes (миграция 010)
+        Index('ix_news_items_updated_at', 'updated_at', 'id'),
+    )
+
+
+class NewsTombstone(Base):
+    """Удаленная из news_items новость: клиенты узнают об удалении через /api/news/changes"""
+    __tablename__ = 'news_tombstones'
+    news_id = Column(Integer, primary_key=True)
+    category = Column(String(100), nullable=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_news_tombstones_deleted_at', 'deleted_at', 'news_id'),
+    )
+
+
+class MediaFile(Base):
+    """Реестр медиа, уже загруженных в Telegram: URL источника -> file_id"""
+    __tablename__ = 'media_registry'
+    id = Column(Integer, primary_key=True)
+    source_url = Column(String(1000), unique=True, index=True, nullable=False)
+    media_type = Column(String(20), nullable=False)
+    file_id = Column(String(255), nullable=False)
+    file_unique_id = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PublishOutbox(Base):
+    """Запись об отправленном в канал посте: какие новости и какие сообщения он содержит"""
+    __tablename__ = 'publish_outbox'
+    id = Column(Integer, primary_key=True)
+    channel_id = Column(String(255), nullable=False)
+    kind = Column(String(20), nullable=False)  # single - одна новость, digest - несколько новостей
+    news_ids = Column(JSON, nullable=False)
+    message_ids = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ChannelCursor(Base):
+    """Состояние конвейера публикации канала: позиция в outbox, время запусков, backoff"""
+    __tablename__ = 'channel_cursors'
+    channel_id = Column(String(255), primary_key=True)
+    last_outbox_id = Column(Integer, nullable=True)  # Последний пост канала в publish_outbox
+    last_published_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    consecutive_failures = Column(Integer, default=0)
+    paused_until = Column(DateTime, nullable=True)  # Канал недоступен - ждем до этого времени
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BackgroundJob(Base):
+    """Фоновая задача (ручная публикация и т.п.): статус и прогресс видны всем воркерам"""
+    __tablename__ = 'background_jobs'
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    key = Column(String(255), nullable=False)
+    # Ключ выполняющейся задачи (после завершения - NULL): не больше одной задачи на ключ во всех воркерах
+    active_key = Column(String(255), nullable=True, unique=True, index=True)
+    status = Column(String(20), nullable=False)
+    requests = Column(Integer, nullable=False, default=1)
+    queued = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Воркер, выполняющий задачу, обновляет раз в несколько секунд
+
+
+class ChatSubscription(Base):
+    """Подписка чата бота на категорию новостей ('all' - на все категории)"""
+    __tablename__ = 'chat_subscriptions'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    category = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'category', name='uq_chat_subscriptions_chat_category'),
+        # Рассылка выбирает подписчиков категории страницами по chat_id
+        Index('ix_chat_subscriptions_category_chat', 'category', 'chat_id'),
+    )
 
 def get_db() -> Session:
     db = SessionLocal()
     try:
-        # Принудительно обновляем метаданные при каждом запросе
-        db.execute(text("SELECT 1"))
         yield db
     finally:
         db.close()
 
 
+async def get_async_db() -> AsyncSession:
+    """Асинхронная сессия для маршрутов FastAPI"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
 
 
 def get_db_session():
     return SessionLocal()
-
-def refresh_metadata():
-    """Принудительно обновляет метаданные SQLAlchemy"""
-    Base.metadata.reflect(bind=engine)
-    print("Метаданные SQLAlchemy обновлены")
-
-# Принудительно обновляем метаданные при импорте
-try:
-    refresh_metadata()
-except Exception as e:
-    print(f"Ошибка при обновлении метаданных: {e}")
-
-# Пересоздаем движок с обновленными метаданными
-def recreate_engine():
-    """Пересоздает движок базы данных с обновленными метаданными"""
-    global engine, SessionLocal
-    if DATABASE_URL.startswith("sqlite"):
-        # Для SQLite
-        engine = create_engine(
-            DATABASE_URL,
-            echo=False,
-            connect_args={"check_same_thread": False}
-        )
-    else:
-        # Для PostgreSQL
-        engine = create_engine(
-            DATABASE_URL,
-            connect_args={"sslmode": "require"},
-            echo=False,
-            pool_pre_ping=True,
-            pool_recycle=300,
-            pool_reset_on_return='commit'
-        )
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    refresh_metadata()
-    return engine
-
-# Пересоздаем модель с обновленными метаданными
-def recreate_models():
-    """Пересоздает модели с обновленными метаданными"""
-    global NewsItem, NewsSource
-    Base.metadata.reflect(bind=engine)
-    return NewsItem, NewsSource
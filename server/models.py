@@ -1,6 +1,10 @@
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Добавляем модель для медиа
 class MediaItem(BaseModel):
@@ -47,6 +51,47 @@ class NewsResponse(BaseModel):
     page: int
     pages: int
 
+
+def item_media(item) -> List[MediaItem]:
+    """Медиа новости из JSON поля, а если его нет или оно битое - из image_url/video_url"""
+    if item.media:
+        try:
+            # media может прийти строкой JSON
+            media_data = json.loads(item.media) if isinstance(item.media, str) else item.media
+            # Список медиа или один объект
+            if isinstance(media_data, list):
+                return [MediaItem(**media) for media in media_data]
+            return [MediaItem(**media_data)]
+        except Exception as e:
+            logger.warning(f"Error parsing media for {item.id}: {e}")
+            logger.warning(f"Media data: {item.media}")
+
+    if item.image_url:
+        return [MediaItem(type='photo', url=item.image_url, thumbnail=item.image_url)]
+    if item.video_url:
+        return [MediaItem(type='video', url=item.video_url, thumbnail=item.image_url)]
+    return []
+
+
+def feed_item_response(item, source: Optional[NewsSourceResponse]) -> NewsItemResponse:
+    """Новость для ленты (анонс без полного текста); item - строка NewsItem или объект с теми же полями"""
+    return NewsItemResponse(
+        id=item.id,
+        title=item.title or "",
+        content=item.summary or "",  # Анонс; полный текст и HTML - в /news/{id}
+        content_html=None,
+        link=item.link or "",
+        publish_date=item.publish_date.isoformat() if item.publish_date else datetime.now().isoformat(),
+        category=item.category or "general",
+        media=item_media(item),
+        reading_time=item.reading_time,
+        views_count=item.views_count or 0,
+        author=item.author,
+        source_name=source.name if source else None,
+        source_url=source.url if source else None,
+        source=source
+    )
+
 class CategoryResponse(BaseModel):
     categories: List[str]
 
@@ -5,6 +5,7 @@
 
 import asyncio
 import logging
+import os
 import re
 import time
 from datetime import datetime, timedelta
@@ -14,6 +15,8 @@ import feedparser
 from bs4 import BeautifulSoup
 from db import get_db_session, NewsItem, NewsSource
 from config import TOKEN
+from services import news_events, pg_notify
+from services.post_renderer import render_post, PostRenderError
 
 logger = logging.getLogger(__name__)
 
@@ -307,6 +310,7 @@ class TelegramNewsService:
         try:
             db = get_db_session()
             saved_count = 0
+            saved_items = []
             
             for item in news_items:
                 try:
@@ -334,6 +338,11 @@ class TelegramNewsService:
                         db.add(source)
                         db.flush()  # Получаем ID
                     
+                    # Все медиа поста сохраняем целиком (нужно для публикации альбомом)
+                    media = item.get('media') or []
+                    photo_urls = [m.get('url') for m in media if m.get('type') == 'photo' and m.get('url')]
+                    video_urls = [m.get('url') for m in media if m.get('type') == 'video' and m.get('url')]
+                    
                     # Создаем новость
                     news_item = NewsItem(
                         title=item['title'],
@@ -344,22 +353,43 @@ class TelegramNewsService:
                         category=item['category'],
                         author=item.get('author', ''),
                         source_id=source.id,
-                        image_url=item.get('media', [{}])[0].get('url') if item.get('media') else None,
-                        video_url=None,  # Можно добавить логику для видео
+                        media=media or None,
+                        image_url=photo_urls[0] if photo_urls else None,
+                        video_url=video_urls[0] if video_urls else None,
                         reading_time=len(item['content']) // 200,  # Примерное время чтения
                         views_count=0,
                         is_published_to_channel=False
                     )
                     
+                    # Текст поста для канала рендерим один раз, пока новость в памяти
+                    try:
+                        news_item.post_text = render_post(news_item)
+                    except PostRenderError as e:
+                        news_item.post_render_error = str(e)[:255]
+                        logger.warning(f"Новость '{news_item.title[:50]}' не может быть опубликована: {e}")
+                    
                     db.add(news_item)
+                    saved_items.append(news_item)
                     saved_count += 1
                     
                 except Exception as e:
                     logger.error(f"Ошибка сохранения новости: {e}")
                     continue
             
+            # Получаем ID новых новостей до коммита, чтобы не перечитывать их после
+            db.flush()
+            saved_payload = [news_events.news_payload(news_item) for news_item in saved_items]
+            if any(item['publishable'] for item in saved_payload):
+                # Уведомление другим процессам уходит вместе с коммитом
+                pg_notify.notify(db)
+            if saved_payload:
+                # Остальные процессы перезагружают последние новости (services.hot_set)
+                pg_notify.notify(db, pg_notify.FEED_CHANNEL, str(os.getpid()))
             db.commit()
             logger.info(f"Successfully updated {saved_count} news items")
+            
+            if saved_payload:
+                news_events.emit(news_events.NEWS_SAVED, saved_payload)
             return saved_count
             
         except Exception as e:
@@ -1,35 +1,106 @@
 """
-Сервис для автоматической публикации новостей в Telegram канал
+Сервис для автоматической публикации новостей в Telegram каналы
+
+Каждый канал обслуживается своим конвейером (AutoPublisher) со своим
+лимитом, ограничением частоты и курсором. Конвейеры работают параллельно,
+поэтому медленный или недоступный канал не задерживает остальные.
+
+Конвейер не опрашивает базу по таймеру: он просыпается по событию NEWS_SAVED
+(или PostgreSQL NOTIFY из другого процесса), выдерживая минимальный промежуток
+между пакетами.
 """
 import asyncio
+import html
+import json
 import logging
 import requests
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import desc, func, and_, or_, not_, true, select, inspect
 
-from db import get_db_session, NewsItem, NewsSource
+from db import get_db_session, NewsItem, NewsBody, NewsSource, PublishOutbox, ChannelCursor
+from services.rate_limit import TokenBucket
+from services.jobs import job_registry, Job
+from services import news_events
+from services import pg_notify
+from services.pg_notify import PgListener
+from services.media_registry import media_registry
+from services.post_renderer import (
+    render_post, get_media_list, PostRenderError, MESSAGE_LIMIT, CAPTION_LIMIT, CATEGORY_EMOJI
+)
 from config import (
     TOKEN, CHANNEL_ID, AUTO_PUBLISH_ENABLED, AUTO_PUBLISH_INTERVAL,
-    AUTO_PUBLISH_LIMIT, POST_SIGNATURE, SOURCE_LINK_TEXT
+    AUTO_PUBLISH_LIMIT, AUTO_PUBLISH_MODE, AUTO_PUBLISH_DIGEST_SIZE,
+    AUTO_PUBLISH_RATE_PER_MINUTE, AUTO_PUBLISH_MIN_SPACING, PUBLISH_CHANNELS, POST_SIGNATURE, SOURCE_LINK_TEXT
 )
 
 logger = logging.getLogger(__name__)
 
+# Telegram принимает от 2 до 10 элементов в одном sendMediaGroup
+MEDIA_GROUP_LIMIT = 10
+
+# deleteMessages принимает до 100 ID за вызов
+DELETE_MESSAGES_LIMIT = 100
+
+# Максимальная пауза конвейера после серии неудачных запусков (канал забанил бота и т.п.)
+MAX_BACKOFF_SECONDS = 6 * 3600
+
+ROUTE_KEYS = {
+    'channel_id', 'categories', 'sources', 'keywords', 'interval', 'min_spacing',
+    'limit', 'mode', 'digest_size', 'rate_per_minute'
+}
+
 
 class AutoPublisher:
-    """Сервис для автоматической публикации новостей в Telegram канал"""
+    """Конвейер автоматической публикации новостей в один Telegram канал"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        channel_id: str = CHANNEL_ID,
+        categories: Optional[List[str]] = None,
+        sources: Optional[List[str]] = None,
+        keywords: Optional[List[str]] = None,
+        interval: int = AUTO_PUBLISH_INTERVAL,
+        min_spacing: int = AUTO_PUBLISH_MIN_SPACING,
+        limit: int = AUTO_PUBLISH_LIMIT,
+        mode: str = AUTO_PUBLISH_MODE,
+        digest_size: int = AUTO_PUBLISH_DIGEST_SIZE,
+        rate_per_minute: float = AUTO_PUBLISH_RATE_PER_MINUTE
+    ):
         self.token = TOKEN
-        self.channel_id = CHANNEL_ID
+        self.channel_id = channel_id
         self.enabled = AUTO_PUBLISH_ENABLED
-        self.interval = AUTO_PUBLISH_INTERVAL
-        self.limit = AUTO_PUBLISH_LIMIT
+        self.interval = interval
+        self.min_spacing = min_spacing
+        self.limit = limit
+        self.mode = mode
+        self.digest_size = digest_size
+        self.rate_per_minute = rate_per_minute
         self.signature = POST_SIGNATURE
         self.source_link_text = SOURCE_LINK_TEXT
         
+        # Фильтры маршрута; пустой фильтр - без ограничения
+        self.categories = categories or []
+        self.sources = sources or []
+        self.keywords = keywords or []
+        # Конвейеры каналов, стоящих в таблице маршрутов раньше (их новости сюда не попадают)
+        self.excluded_routes: List["AutoPublisher"] = []
+        
+        # Ограничение частоты постов в канал (без накопления - посты идут равномерно)
+        self.bucket = TokenBucket(rate_per_minute / 60, capacity=1, key=f"channel:{channel_id}")
+        # Плановый и ручной пакеты одного канала не выполняются одновременно
+        self._batch_lock = asyncio.Lock()
+        self.last_batch: Dict[str, Any] = {}
+        
+        # Пробуждение по событиям о новых новостях
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Страховочный опрос раз в interval - только если события могут не дойти (задается менеджером)
+        self.fallback_poll: Optional[int] = None
+        self.wakeups = 0
+        
         if not self.token:
             logger.error("Telegram bot token not configured!")
             self.enabled = False
@@ -38,197 +109,439 @@ class AutoPublisher:
             logger.error("Channel ID not configured!")
             self.enabled = False
     
-    def clean_text_for_telegram(self, text: str) -> str:
+    def route_filter(self):
+        """
+        SQL-условие маршрута: новости, подходящие под фильтры канала
+        """
+        conditions = []
+        if self.categories:
+            conditions.append(NewsItem.category.in_(self.categories))
+        if self.sources:
+            conditions.append(NewsItem.source_id.in_(
+                select(NewsSource.id).where(NewsSource.name.in_(self.sources))
+            ))
+        if self.keywords:
+            conditions.append(or_(*[NewsItem.title.ilike(f"%{keyword}%") for keyword in self.keywords]))
+        return and_(*conditions) if conditions else true()
+    
+    def matches(self, news_item: NewsItem, source_name: Optional[str] = None) -> bool:
+        """
+        Проверка маршрута для одной новости (то же, что route_filter, но в Python)
+        """
+        if self.categories and news_item.category not in self.categories:
+            return False
+        if self.sources and source_name not in self.sources:
+            return False
+        if self.keywords:
+            title = (news_item.title or "").lower()
+            if not any(keyword.lower() in title for keyword in self.keywords):
+                return False
+        return True
+    
+    def may_match(self, item: Dict[str, Any]) -> bool:
+        """
+        Может ли новость из события NEWS_SAVED попасть в канал (источник проверит запрос)
+        """
+        if not item.get('publishable', True):
+            return False
+        if self.categories and item.get('category') not in self.categories:
+            return False
+        if self.keywords:
+            title = (item.get('title') or "").lower()
+            if not any(keyword.lower() in title for keyword in self.keywords):
+                return False
+        return True
+    
+    def wake(self):
+        """
+        Будит конвейер; может вызываться из любого потока
+        """
+        if self._loop and self._wakeup:
+            self.wakeups += 1
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def format_post_content(self, news_item: NewsItem, source: Optional[NewsSource] = None) -> str:
+        """
+        Форматирует контент поста для публикации в Telegram канал
+        Бросает PostRenderError, если новость не укладывается в лимит Telegram
+        """
+        return render_post(news_item)
+    
+    def get_post_content(self, db: Session, news_item: NewsItem) -> Optional[str]:
         """
-        Очищает текст от символов, которые могут вызвать проблемы с Markdown
+        Возвращает сохраненный текст поста; для старых новостей рендерит и сохраняет его
+        Новости, которые невозможно отрендерить, помечаются ошибкой и больше не выбираются
         """
-        import re
+        if news_item.post_text:
+            return news_item.post_text
         
-        # Экранируем специальные символы Markdown
-        text = re.sub(r'([*_`\[\]()~>#+=|{}.!-])', r'\\\1', text)
+        # Для рендера нужен текст из news_bodies; новость может быть из уже закрытой сессии
+        if inspect(news_item).detached and 'body' not in news_item.__dict__:
+            set_committed_value(news_item, 'body', db.get(NewsBody, news_item.id))
         
-        # Убираем множественные обратные слеши
-        text = re.sub(r'\\{2,}', r'\\', text)
+        try:
+            post_text = self.format_post_content(news_item)
+            values = {NewsItem.post_text: post_text}
+        except PostRenderError as e:
+            logger.warning(f"News {news_item.id} rejected before publishing: {e}")
+            post_text = None
+            values = {NewsItem.post_render_error: str(e)[:255]}
         
-        return text
+        db.query(NewsItem).filter(NewsItem.id == news_item.id).update(values, synchronize_session=False)
+        db.commit()
+        news_item.post_text = post_text
+        return post_text
     
-    def format_post_content(self, news_item: NewsItem, source: Optional[NewsSource] = None) -> str:
+    def get_media_list(self, news_item: NewsItem) -> List[Dict[str, Any]]:
         """
-        Форматирует контент поста для публикации в Telegram канал
+        Извлекает все медиа новости (фото и видео) в исходном порядке
         """
-        # Основной контент
-        content_parts = []
-        
-        # Заголовок
-        content_parts.append(f"📰 <b>{self.clean_text_for_telegram(news_item.title)}</b>")
-        content_parts.append("")
-        
-        # Краткое описание (первые 300 символов)
-        description = news_item.content[:300]
-        if len(news_item.content) > 300:
-            description += "..."
-        content_parts.append(self.clean_text_for_telegram(description))
-        content_parts.append("")
-        
-        # Категория
-        category_emoji = {
-            'gifts': '🎁',
-            'crypto': '💰',
-            'nft': '🖼️',
-            'tech': '💻',
-            'community': '👥',
-            'general': '📢'
-        }
-        emoji = category_emoji.get(news_item.category, '📢')
-        content_parts.append(f"{emoji} Категория: {news_item.category}")
+        return get_media_list(news_item)
+    
+    def get_media_data(self, news_item: NewsItem) -> Optional[Dict[str, Any]]:
+        """
+        Извлекает первое медиа новости для публикации одиночным сообщением
+        """
+        media_list = self.get_media_list(news_item)
+        return media_list[0] if media_list else None
+    
+    def _api_request(self, method: str, data: Dict[str, Any]) -> Optional[Any]:
+        """
+        Вызывает метод Telegram Bot API, возвращает поле result или None при ошибке
+        """
+        response = requests.post(
+            f"https://api.telegram.org/bot{self.token}/{method}",
+            data=data,
+            timeout=30
+        )
         
-        # Автор/источник
-        if news_item.author:
-            content_parts.append(f"👤 Автор: {self.clean_text_for_telegram(news_item.author)}")
+        if response.status_code == 200:
+            result = response.json()
+            if result.get('ok'):
+                return result['result']
+            logger.error(f"Telegram API error in {method}: {result}")
+        else:
+            logger.error(f"HTTP error {response.status_code} in {method}: {response.text}")
+        return None
+    
+    def _send_single(self, content: str, media_data: Optional[Dict[str, Any]]) -> List[int]:
+        """
+        Публикует пост одним сообщением (текст, фото или видео)
+        Возвращает список из одного ID сообщения или пустой список при ошибке
+        """
+        if not media_data:
+            result = self._api_request('sendMessage', {
+                'chat_id': self.channel_id,
+                'text': content,
+                'parse_mode': 'HTML',
+                'disable_web_page_preview': False
+            })
+            return [result['message_id']] if result else []
         
-        # Время чтения
-        if news_item.reading_time:
-            content_parts.append(f"⏱️ Время чтения: {news_item.reading_time} мин")
+        method = 'sendPhoto' if media_data['type'] == 'photo' else 'sendVideo'
+        media_value = media_registry.resolve(media_data)
         
-        # Просмотры
-        if news_item.views_count:
-            content_parts.append(f"👀 Просмотров: {news_item.views_count}")
+        result = self._api_request(method, {
+            'chat_id': self.channel_id,
+            media_data['type']: media_value,
+            'caption': content,
+            'parse_mode': 'HTML'
+        })
         
-        content_parts.append("")
+        if not result and media_value != media_data['url']:
+            # Сохраненный file_id больше не принимается - отправляем по исходному URL
+            media_registry.forget(media_data['url'])
+            result = self._api_request(method, {
+                'chat_id': self.channel_id,
+                media_data['type']: media_data['url'],
+                'caption': content,
+                'parse_mode': 'HTML'
+            })
         
-        # Подпись и ссылка на источник
-        content_parts.append(f"---")
-        content_parts.append(f"{self.clean_text_for_telegram(self.signature)}")
-        content_parts.append("")
-        content_parts.append(f"{self.source_link_text}: {news_item.link}")
+        if not result:
+            return []
         
-        return "\n".join(content_parts)
+        media_registry.remember_from_message(media_data, result)
+        return [result['message_id']]
     
-    def get_media_data(self, news_item: NewsItem) -> Optional[Dict[str, Any]]:
+    def _build_media_group(self, content: str, media_list: List[Dict[str, Any]], use_file_ids: bool = True) -> str:
         """
-        Извлекает медиа данные для публикации
+        Формирует JSON-поле media для sendMediaGroup с подписью на первом элементе
         """
-        # Приоритет: media JSON > image_url > video_url
-        if news_item.media:
-            try:
-                if isinstance(news_item.media, str):
-                    import json
-                    media_data = json.loads(news_item.media)
-                else:
-                    media_data = news_item.media
+        group = []
+        for position, media in enumerate(media_list):
+            media_value = media_registry.resolve(media) if use_file_ids else media['url']
+            entry = {'type': media['type'], 'media': media_value}
+            if content and position == 0:
+                entry['caption'] = content
+                entry['parse_mode'] = 'HTML'
+            group.append(entry)
+        return json.dumps(group)
+    
+    def _send_media_group(self, content: str, media_list: List[Dict[str, Any]]) -> List[int]:
+        """
+        Публикует пост альбомом через sendMediaGroup
+        Подпись ставится на первый элемент, альбомы больше MEDIA_GROUP_LIMIT разбиваются на части.
+        Если какая-то часть не отправилась, уже отправленные сообщения удаляются,
+        чтобы в канале не оставался неполный пост. Возвращает ID всех сообщений или пустой список.
+        """
+        chunks = [
+            media_list[i:i + MEDIA_GROUP_LIMIT]
+            for i in range(0, len(media_list), MEDIA_GROUP_LIMIT)
+        ]
+        message_ids = []
+        
+        for index, chunk in enumerate(chunks):
+            caption = content if index == 0 else ""
+            
+            if len(chunk) == 1:
+                # sendMediaGroup принимает минимум 2 элемента - хвост из одного медиа отправляем отдельно
+                sent_ids = self._send_single(caption, chunk[0])
+            else:
+                result = self._api_request('sendMediaGroup', {
+                    'chat_id': self.channel_id,
+                    'media': self._build_media_group(caption, chunk)
+                })
                 
-                # Если это список медиа, берем первое
-                if isinstance(media_data, list) and media_data:
-                    media_data = media_data[0]
+                if not result and any(media_registry.get_file_id(media['url']) for media in chunk):
+                    # Один из сохраненных file_id устарел - повторяем по исходным URL
+                    for media in chunk:
+                        media_registry.forget(media['url'])
+                    result = self._api_request('sendMediaGroup', {
+                        'chat_id': self.channel_id,
+                        'media': self._build_media_group(caption, chunk, use_file_ids=False)
+                    })
                 
-                if media_data.get('type') == 'photo' and media_data.get('url'):
-                    return {
-                        'type': 'photo',
-                        'url': media_data['url']
-                    }
-                elif media_data.get('type') == 'video' and media_data.get('url'):
-                    return {
-                        'type': 'video',
-                        'url': media_data['url']
-                    }
-            except Exception as e:
-                logger.warning(f"Error parsing media for news {news_item.id}: {e}")
+                sent_ids = []
+                if result:
+                    for media, message in zip(chunk, result):
+                        media_registry.remember_from_message(media, message)
+                        sent_ids.append(message['message_id'])
+            
+            if not sent_ids:
+                if message_ids:
+                    logger.warning(f"Album chunk {index + 1}/{len(chunks)} failed, removing {len(message_ids)} sent messages")
+                    self.delete_channel_messages(message_ids)
+                return []
+            
+            message_ids.extend(sent_ids)
         
-        # Fallback к image_url или video_url
-        if news_item.image_url:
-            return {
-                'type': 'photo',
-                'url': news_item.image_url
-            }
-        elif news_item.video_url:
-            return {
-                'type': 'video',
-                'url': news_item.video_url
-            }
+        return message_ids
+    
+    def delete_channel_messages(self, message_ids: List[int], chat_id: Optional[str] = None) -> List[int]:
+        """
+        Удаляет сообщения из канала (по умолчанию - из канала конвейера)
+        Сообщения удаляются пачками по DELETE_MESSAGES_LIMIT через deleteMessages;
+        если пачка не удалилась целиком, ее сообщения удаляются по одному.
+        Возвращает список ID, которые удалить не удалось (уже удаленные считаются успешными)
+        """
+        failed_ids = []
         
-        return None
+        for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+            chunk = message_ids[i:i + DELETE_MESSAGES_LIMIT]
+            if len(chunk) > 1 and self._api_request('deleteMessages', {
+                'chat_id': chat_id or self.channel_id,
+                'message_ids': json.dumps(chunk)
+            }):
+                continue
+            failed_ids.extend(self._delete_messages_one_by_one(chunk, chat_id))
+        
+        return failed_ids
+    
+    def _delete_messages_one_by_one(self, message_ids: List[int], chat_id: Optional[str] = None) -> List[int]:
+        failed_ids = []
+        
+        for message_id in message_ids:
+            response = requests.post(
+                f"https://api.telegram.org/bot{self.token}/deleteMessage",
+                data={
+                    'chat_id': chat_id or self.channel_id,
+                    'message_id': message_id
+                },
+                timeout=30
+            )
+            
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            
+            if result.get('ok') or 'message to delete not found' in result.get('description', ''):
+                continue
+            
+            logger.error(f"Failed to delete message {message_id}: {response.status_code} {response.text}")
+            failed_ids.append(message_id)
+        
+        return failed_ids
+    
+    def get_published_message_ids(self, news_item: NewsItem) -> List[int]:
+        """
+        Возвращает все ID сообщений, из которых состоит опубликованный пост
+        """
+        if news_item.telegram_message_ids:
+            return list(news_item.telegram_message_ids)
+        if news_item.telegram_message_id:
+            return [news_item.telegram_message_id]
+        return []
+    
+    def _send_post(self, content: str, media_list: List[Dict[str, Any]]) -> List[int]:
+        """
+        Отправляет пост: несколько медиа - альбомом, иначе одним сообщением
+        """
+        if len(media_list) > 1:
+            return self._send_media_group(content, media_list)
+        return self._send_single(content, media_list[0] if media_list else None)
+    
+    def _mark_published(self, db: Session, news_ids: List[int], message_ids: List[int], kind: str):
+        """
+        Помечает новости опубликованными и записывает пост в outbox
+        """
+        db.query(NewsItem).filter(NewsItem.id.in_(news_ids)).update({
+            NewsItem.is_published_to_channel: True,
+            NewsItem.published_to_channel_at: datetime.utcnow(),
+            NewsItem.telegram_message_id: message_ids[0],
+            NewsItem.telegram_message_ids: message_ids,
+            NewsItem.telegram_chat_id: str(self.channel_id)
+        }, synchronize_session=False)
+        db.add(PublishOutbox(
+            channel_id=str(self.channel_id),
+            kind=kind,
+            news_ids=news_ids,
+            message_ids=message_ids
+        ))
+        db.commit()
     
     async def publish_news_to_channel(self, news_item: NewsItem) -> Optional[int]:
         """
         Публикует новость в Telegram канал
-        Возвращает ID сообщения в канале или None при ошибке
+        Возвращает ID (первого) сообщения в канале или None при ошибке
         """
+        # Запросы к Bot API и базе блокирующие - выполняем вне event loop
+        return await asyncio.to_thread(self._publish_news, news_item)
+    
+    def _publish_news(self, news_item: NewsItem) -> Optional[int]:
         try:
-            # Получаем источник
             db = get_db_session()
-            source = db.query(NewsSource).filter(NewsSource.id == news_item.source_id).first()
-            
-            # Форматируем контент
-            content = self.format_post_content(news_item, source)
             
-            # Получаем медиа
-            media_data = self.get_media_data(news_item)
+            # Готовый текст поста (рендерится один раз при сохранении новости)
+            content = self.get_post_content(db, news_item)
+            if content is None:
+                return None
             
             # Публикуем в канал
-            if media_data and media_data['type'] == 'photo':
-                # Публикация с фото
-                response = requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={
-                        'chat_id': self.channel_id,
-                        'photo': media_data['url'],
-                        'caption': content,
-                        'parse_mode': 'HTML'
-                    },
-                    timeout=30
-                )
-            elif media_data and media_data['type'] == 'video':
-                # Публикация с видео
-                response = requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendVideo",
-                    data={
-                        'chat_id': self.channel_id,
-                        'video': media_data['url'],
-                        'caption': content,
-                        'parse_mode': 'HTML'
-                    },
-                    timeout=30
-                )
-            else:
-                # Публикация только текста
-                response = requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendMessage",
-                    data={
-                        'chat_id': self.channel_id,
-                        'text': content,
-                        'parse_mode': 'HTML',
-                        'disable_web_page_preview': False
-                    },
-                    timeout=30
-                )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('ok'):
-                    message_id = result['result']['message_id']
-                    logger.info(f"Successfully published news {news_item.id} to channel, message_id: {message_id}")
-                    
-                    # Обновляем статус в базе данных
-                    news_item.is_published_to_channel = True
-                    news_item.published_to_channel_at = datetime.utcnow()
-                    news_item.telegram_message_id = message_id
-                    db.commit()
-                    
-                    return message_id
-                else:
-                    logger.error(f"Telegram API error: {result}")
-                    return None
-            else:
-                logger.error(f"HTTP error {response.status_code}: {response.text}")
+            message_ids = self._send_post(content, self.get_media_list(news_item))
+            if not message_ids:
                 return None
+            
+            message_id = message_ids[0]
+            logger.info(f"Successfully published news {news_item.id} to {self.channel_id}, message_ids: {message_ids}")
+            
+            # Обновляем статус в базе данных (news_item может быть из другой сессии)
+            self._mark_published(db, [news_item.id], message_ids, 'single')
+            
+            news_item.is_published_to_channel = True
+            news_item.telegram_message_id = message_id
+            news_item.telegram_message_ids = message_ids
+            news_item.telegram_chat_id = str(self.channel_id)
+            
+            return message_id
                 
         except Exception as e:
-            logger.error(f"Error publishing news {news_item.id} to channel: {e}")
+            logger.error(f"Error publishing news {news_item.id} to {self.channel_id}: {e}")
             return None
         finally:
             if 'db' in locals():
                 db.close()
     
+    def _digest_entry(self, news_item: NewsItem, title_limit: Optional[int] = None) -> str:
+        title = news_item.title or ""
+        if title_limit is not None and len(title) > title_limit:
+            title = title[:max(0, title_limit - 1)].rstrip() + "…"
+        emoji = CATEGORY_EMOJI.get(news_item.category, '📢')
+        return (
+            f"{emoji} <b>{html.escape(title)}</b>\n"
+            f"<a href=\"{html.escape(news_item.link or '', quote=True)}\">{html.escape(self.source_link_text)}</a>\n\n"
+        )
+    
+    def render_digest(self, news_items: List[NewsItem], limit: int) -> Tuple[str, List[NewsItem]]:
+        """
+        Собирает дайджест из новостей, пока он укладывается в limit символов
+        Длина измеряется по готовому HTML (видимый текст всегда не длиннее).
+        Возвращает текст и список новостей, которые в него вошли.
+        """
+        header = "🗞 <b>Дайджест новостей</b>\n\n"
+        footer = f"---\n{html.escape(self.signature)}"
+        
+        text = header
+        included = []
+        for news_item in news_items:
+            entry = self._digest_entry(news_item)
+            if len(text) + len(entry) + len(footer) > limit:
+                if included:
+                    break
+                # Даже одна новость не помещается - укорачиваем ее заголовок
+                overflow = len(text) + len(entry) + len(footer) - limit
+                entry = self._digest_entry(news_item, max(1, len(news_item.title or "") - overflow))
+                if len(text) + len(entry) + len(footer) > limit:
+                    break
+            text += entry
+            included.append(news_item)
+        
+        return text + footer, included
+    
+    def _first_photos(self, news_items: List[NewsItem]) -> List[Dict[str, Any]]:
+        """По одному фото от каждой новости"""
+        photos = []
+        for news_item in news_items:
+            photo = next((media for media in self.get_media_list(news_item) if media['type'] == 'photo'), None)
+            if photo:
+                photos.append(photo)
+        return photos
+    
+    async def publish_digest(self, news_items: List[NewsItem], job: Optional[Job] = None) -> int:
+        """
+        Публикует несколько новостей одним постом
+        Если у вошедших в пост новостей есть фото, дайджест уходит альбомом с подписью (лимит 1024 символа),
+        иначе текстом (лимит 4096). Возвращает количество новостей, вошедших в пост; не вошедшие
+        остаются неопубликованными до следующего дайджеста.
+        job: задача реестра - в ней учитываются только новости, вошедшие в пост
+        """
+        if not news_items:
+            return 0
+        
+        content, included = self.render_digest(news_items, MESSAGE_LIMIT)
+        photos = self._first_photos(included)
+        if photos:
+            # С фото текст становится подписью - собираем заново под ее лимит (войдет начало списка)
+            content, included = self.render_digest(news_items, CAPTION_LIMIT)
+            photos = self._first_photos(included)
+        if not included:
+            logger.error("Digest is empty: no news fits the message limit")
+            return 0
+        if job:
+            job.add_queued(len(included))
+        
+        message_ids = await asyncio.to_thread(self._send_post, content, photos[:MEDIA_GROUP_LIMIT])
+        if not message_ids:
+            if job:
+                job.add_failed(len(included))
+            return 0
+        
+        news_ids = [news_item.id for news_item in included]
+        await asyncio.to_thread(self._mark_digest_published, news_ids, message_ids)
+        if job:
+            job.add_sent(len(included))
+        
+        logger.info(f"Published digest to {self.channel_id} with news {news_ids}, message_ids: {message_ids}")
+        return len(included)
+    
+    def _mark_digest_published(self, news_ids: List[int], message_ids: List[int]):
+        db = get_db_session()
+        try:
+            self._mark_published(db, news_ids, message_ids, 'digest')
+        finally:
+            db.close()
+    
     def get_unpublished_news(self, limit: int = None) -> List[NewsItem]:
         """
         Получает неопубликованные новости для публикации
@@ -237,15 +550,19 @@ class AutoPublisher:
             db = get_db_session()
             
             # Получаем свежие неопубликованные новости
+            # Новости маршрута канала, кроме попавших под маршруты предыдущих каналов
             query = db.query(NewsItem).filter(
-                NewsItem.is_published_to_channel == False
+                NewsItem.is_published_to_channel == False,
+                NewsItem.post_render_error.is_(None),
+                self.route_filter(),
+                *[not_(route.route_filter()) for route in self.excluded_routes]
             ).order_by(desc(NewsItem.publish_date))
             
             if limit:
                 query = query.limit(limit)
             
             news_items = query.all()
-            logger.info(f"Found {len(news_items)} unpublished news items")
+            logger.info(f"Found {len(news_items)} unpublished news items for {self.channel_id}")
             
             return news_items
             
@@ -256,66 +573,337 @@ class AutoPublisher:
             if 'db' in locals():
                 db.close()
     
-    async def publish_batch(self, force: bool = False) -> int:
+    async def publish_batch(self, force: bool = False, job: Optional[Job] = None) -> int:
         """
         Публикует пакет новостей в канал
         force: если True, публикует независимо от AUTO_PUBLISH_ENABLED (для ручной публикации)
+        job: задача реестра, в которую пишется прогресс
         Возвращает количество опубликованных новостей
         """
         if not self.enabled and not force:
             logger.info("Auto publishing is disabled")
             return 0
         
+        async with self._batch_lock:
+            return await self._publish_batch(job)
+    
+    async def _publish_batch(self, job: Optional[Job]) -> int:
+        self.last_batch = {'published': 0, 'failed': 0, 'has_more': False, 'started_at': datetime.utcnow().isoformat()}
+        
         try:
             # Получаем неопубликованные новости
-            news_items = self.get_unpublished_news(self.limit)
+            batch_size = self.digest_size if self.mode == 'digest' else self.limit
+            news_items = await asyncio.to_thread(self.get_unpublished_news, batch_size)
             
             if not news_items:
-                logger.info("No unpublished news to publish")
+                logger.info(f"No unpublished news to publish to {self.channel_id}")
                 return 0
+            # Пакет заполнен целиком - в очереди могут быть еще новости
+            self.last_batch['has_more'] = len(news_items) >= batch_size
+            
+            if self.mode == 'digest':
+                # Новости одним постом (сколько поместится)
+                await self.bucket.acquire()
+                published_count = await self.publish_digest(news_items, job)
+                self.last_batch['published'] = published_count
+                self.last_batch['failed'] = 0 if published_count else 1
+                if published_count and published_count < len(news_items):
+                    # Не поместившиеся в лимит символов новости ждут следующего дайджеста
+                    self.last_batch['has_more'] = True
+                logger.info(f"Published {published_count} news items to {self.channel_id} as digest")
+                return published_count
+            
+            if job:
+                job.add_queued(len(news_items))
             
             published_count = 0
             
-            # Публикуем каждую новость с задержкой
+            # Публикуем каждую новость, соблюдая лимит частоты канала
             for news_item in news_items:
                 try:
+                    await self.bucket.acquire()
                     message_id = await self.publish_news_to_channel(news_item)
                     if message_id:
                         published_count += 1
                         logger.info(f"Published news {news_item.id} (message_id: {message_id})")
-                    
-                    # Задержка между публикациями (чтобы не спамить)
-                    await asyncio.sleep(5)
+                        if job:
+                            job.add_sent()
+                    else:
+                        self.last_batch['failed'] += 1
+                        if job:
+                            job.add_failed()
                     
                 except Exception as e:
                     logger.error(f"Error publishing news {news_item.id}: {e}")
+                    self.last_batch['failed'] += 1
+                    if job:
+                        job.add_failed()
                     continue
             
-            logger.info(f"Published {published_count} news items to channel")
+            self.last_batch['published'] = published_count
+            logger.info(f"Published {published_count} news items to {self.channel_id}")
             return published_count
             
         except Exception as e:
-            logger.error(f"Error in publish_batch: {e}")
+            logger.error(f"Error in publish_batch for {self.channel_id}: {e}")
             return 0
+        finally:
+            self.last_batch['finished_at'] = datetime.utcnow().isoformat()
+    
+    def load_cursor(self) -> Dict[str, Any]:
+        """
+        Состояние конвейера канала из channel_cursors
+        """
+        db = get_db_session()
+        try:
+            cursor = db.query(ChannelCursor).filter(ChannelCursor.channel_id == str(self.channel_id)).first()
+            if not cursor:
+                return {'channel_id': str(self.channel_id), 'consecutive_failures': 0}
+            return {
+                'channel_id': cursor.channel_id,
+                'last_outbox_id': cursor.last_outbox_id,
+                'last_published_at': cursor.last_published_at,
+                'last_run_at': cursor.last_run_at,
+                'consecutive_failures': cursor.consecutive_failures or 0,
+                'paused_until': cursor.paused_until
+            }
+        finally:
+            db.close()
+    
+    def advance_cursor(self, published: int, failed: int):
+        """
+        Сохраняет результат запуска: позицию в outbox и backoff при сплошных ошибках
+        """
+        db = get_db_session()
+        try:
+            now = datetime.utcnow()
+            cursor = db.query(ChannelCursor).filter(ChannelCursor.channel_id == str(self.channel_id)).first()
+            if not cursor:
+                cursor = ChannelCursor(channel_id=str(self.channel_id), consecutive_failures=0)
+                db.add(cursor)
+            
+            cursor.last_run_at = now
+            if published:
+                cursor.last_outbox_id = db.query(func.max(PublishOutbox.id)).filter(
+                    PublishOutbox.channel_id == str(self.channel_id)
+                ).scalar()
+                cursor.last_published_at = now
+                cursor.consecutive_failures = 0
+                cursor.paused_until = None
+            elif failed:
+                # Канал недоступен: каждый следующий неудачный запуск откладываем вдвое дольше
+                cursor.consecutive_failures = (cursor.consecutive_failures or 0) + 1
+                backoff = min(max(self.min_spacing, 60) * 2 ** (cursor.consecutive_failures - 1), MAX_BACKOFF_SECONDS)
+                cursor.paused_until = now + timedelta(seconds=backoff)
+                logger.warning(f"Channel {self.channel_id} failed {cursor.consecutive_failures} times, paused for {backoff}s")
+            
+            db.commit()
+        finally:
+            db.close()
+    
+    def seconds_until_next_run(self, cursor: Dict[str, Any]) -> float:
+        now = datetime.utcnow()
+        next_run = now
+        if cursor.get('last_run_at'):
+            next_run = max(next_run, cursor['last_run_at'] + timedelta(seconds=self.min_spacing))
+        if cursor.get('paused_until'):
+            next_run = max(next_run, cursor['paused_until'])
+        return (next_run - now).total_seconds()
     
     async def start_auto_publishing(self):
         """
         Запускает автоматическую публикацию в фоновом режиме
+        Пакет запускается по сигналу о новых новостях, не чаще раза в min_spacing;
+        время последнего запуска и пауза после ошибок берутся из курсора канала
         """
         if not self.enabled:
-            logger.info("Auto publishing is disabled, not starting")
+            logger.info(f"Auto publishing to {self.channel_id} is disabled, not starting")
             return
         
-        logger.info(f"Starting auto publishing service (interval: {self.interval}s)")
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Первый запуск - сразу: публикуем накопившееся за время простоя
+        self._wakeup.set()
+        
+        logger.info(
+            f"Starting auto publishing to {self.channel_id} "
+            f"(min spacing: {self.min_spacing}s, fallback poll: {self.fallback_poll or 'off'})"
+        )
         
         while True:
             try:
-                await self.publish_batch()
-                await asyncio.sleep(self.interval)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.fallback_poll)
+                except asyncio.TimeoutError:
+                    pass
+                
+                cursor = await asyncio.to_thread(self.load_cursor)
+                delay = self.seconds_until_next_run(cursor)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Сигналы, пришедшие во время ожидания, покрывает этот пакет
+                self._wakeup.clear()
+                
+                published = await self.publish_batch()
+                failed = self.last_batch.get('failed', 0)
+                await asyncio.to_thread(self.advance_cursor, published, failed)
+                
+                if failed or self.last_batch.get('has_more'):
+                    # Остались новости (или повтор после паузы) - следующий пакет без нового сигнала
+                    self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"Error in auto publishing loop: {e}")
+                logger.error(f"Error in auto publishing loop for {self.channel_id}: {e}")
                 await asyncio.sleep(60)  # Ждем минуту перед повторной попыткой
+    
+    def get_status(self) -> Dict[str, Any]:
+        cursor = self.load_cursor()
+        return {
+            "channel_id": self.channel_id,
+            "categories": self.categories,
+            "sources": self.sources,
+            "keywords": self.keywords,
+            "interval_seconds": self.interval,
+            "min_spacing_seconds": self.min_spacing,
+            "fallback_poll_seconds": self.fallback_poll,
+            "wakeups": self.wakeups,
+            "batch_limit": self.limit,
+            "mode": self.mode,
+            "rate_per_minute": self.rate_per_minute,
+            "last_batch": self.last_batch,
+            "cursor": {
+                key: value.isoformat() if isinstance(value, datetime) else value
+                for key, value in cursor.items()
+            }
+        }
+
+
+class PublishingManager:
+    """Набор конвейеров публикации по таблице маршрутов PUBLISH_CHANNELS"""
+    
+    def __init__(self, routes_config: str = PUBLISH_CHANNELS):
+        self.pipelines = [AutoPublisher(**route) for route in self._parse_routes(routes_config)]
+        
+        # Новость публикуется только в первый подходящий канал
+        for index, pipeline in enumerate(self.pipelines):
+            pipeline.excluded_routes = self.pipelines[:index]
+        
+        self.listener = PgListener(lambda payload: self.wake_all())
+    
+    @staticmethod
+    def _parse_routes(routes_config: str) -> List[Dict[str, Any]]:
+        if routes_config:
+            try:
+                routes = json.loads(routes_config)
+                parsed = []
+                for route in routes:
+                    unknown = set(route) - ROUTE_KEYS
+                    if unknown:
+                        logger.warning(f"Unknown keys in route for {route.get('channel_id')}: {unknown}")
+                    if not route.get('channel_id'):
+                        logger.error(f"Route without channel_id skipped: {route}")
+                        continue
+                    route = {key: value for key, value in route.items() if key in ROUTE_KEYS}
+                    # Свой интервал канала: пакеты по сигналу, но не чаще раза в interval
+                    if 'interval' in route and 'min_spacing' not in route:
+                        route['min_spacing'] = route['interval']
+                    parsed.append(route)
+                if parsed:
+                    return parsed
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.error(f"Invalid PUBLISH_CHANNELS, falling back to CHANNEL_ID: {e}")
+        
+        return [{'channel_id': CHANNEL_ID}]
+    
+    @property
+    def primary(self) -> AutoPublisher:
+        return self.pipelines[0]
+    
+    def get(self, channel_id: Optional[str]) -> Optional[AutoPublisher]:
+        for pipeline in self.pipelines:
+            if str(pipeline.channel_id) == str(channel_id):
+                return pipeline
+        return None
+    
+    def pipeline_for(self, news_item: NewsItem) -> AutoPublisher:
+        """
+        Конвейер, в который маршрутизируется новость (для ручной публикации - основной, если ни один не подошел)
+        """
+        source_name = None
+        if any(pipeline.sources for pipeline in self.pipelines):
+            db = get_db_session()
+            try:
+                source_name = db.query(NewsSource.name).filter(NewsSource.id == news_item.source_id).scalar()
+            finally:
+                db.close()
+        
+        for pipeline in self.pipelines:
+            if pipeline.matches(news_item, source_name):
+                return pipeline
+        return self.primary
+    
+    async def publish_news(self, news_item: NewsItem) -> Optional[int]:
+        """
+        Ручная публикация новости в канал ее маршрута
+        Публикация идет в потоке со своей сессией: новость из AsyncSession нужно сначала отсоединить (expunge)
+        """
+        pipeline = await asyncio.to_thread(self.pipeline_for, news_item)
+        return await pipeline.publish_news_to_channel(news_item)
+    
+    def handle_news_saved(self, items: List[Dict[str, Any]]):
+        """
+        Обработчик события NEWS_SAVED: будит конвейеры, в которые могут попасть новости
+        """
+        for pipeline in self.pipelines:
+            if any(pipeline.may_match(item) for item in items):
+                pipeline.wake()
+    
+    def wake_all(self):
+        for pipeline in self.pipelines:
+            pipeline.wake()
+    
+    async def start_all(self):
+        """
+        Запускает конвейеры всех каналов параллельно
+        """
+        if not self.listener.start() and pg_notify.is_postgres():
+            # Новости могут сохранять другие процессы - без NOTIFY нужен страховочный опрос
+            for pipeline in self.pipelines:
+                pipeline.fallback_poll = pipeline.interval
+        await asyncio.gather(
+            *(pipeline.start_auto_publishing() for pipeline in self.pipelines),
+            return_exceptions=True
+        )
+    
+    async def publish_all(self, force: bool = False, job: Optional[Job] = None) -> Dict[str, int]:
+        """
+        Публикует пакет в каждый канал параллельно
+        Возвращает количество опубликованных новостей по каналам
+        """
+        results = await asyncio.gather(
+            *(pipeline.publish_batch(force=force, job=job) for pipeline in self.pipelines),
+            return_exceptions=True
+        )
+        return {
+            str(pipeline.channel_id): result if isinstance(result, int) else 0
+            for pipeline, result in zip(self.pipelines, results)
+        }
+    
+    async def submit_publish_job(self) -> Tuple[Job, bool]:
+        """
+        Ручная публикация во все каналы через реестр задач
+        Повторные запросы, пока публикация идет (в любом воркере), получают ту же задачу
+        """
+        return await job_registry.submit(
+            "publish", "publish:all", lambda job: self.publish_all(force=True, job=job)
+        )
+    
+    def get_status(self) -> List[Dict[str, Any]]:
+        return [pipeline.get_status() for pipeline in self.pipelines]
 
 
-# Глобальный экземпляр сервиса
-auto_publisher = AutoPublisher()
+# Глобальные экземпляры: все каналы и основной канал (CHANNEL_ID или первый маршрут)
+publishing_manager = PublishingManager()
+auto_publisher = publishing_manager.primary
+news_events.subscribe(news_events.NEWS_SAVED, publishing_manager.handle_news_saved)
@@ -0,0 +1,591 @@
+"""
+Общий кэш: в памяти процесса или в Redis (CACHE_BACKEND)
+
+Через кэш работают страницы ленты, категории и статистика API, готовые
+ответы бота, справочник источников и token bucket-ы лимитов Telegram Bot API.
+memory - LRU с TTL в каждом процессе (у каждого воркера свой кэш, сброс по
+событиям только в процессе, где они произошли), redis - один кэш на все
+воркеры и процессы (REDIS_URL), сброс виден всем сразу.
+
+Записи помечаются тегами, invalidate_tags удаляет все записи тега и
+увеличивает его версию. Вычисление, начатое до сброса, сохраняет результат,
+только если версии тегов не изменились (set(..., versions=...)), поэтому
+устаревшее значение не попадает в кэш после сброса. Значения в Redis хранятся
+в JSON; None не кэшируется. Ошибки Redis не ломают запросы: чтение считается
+промахом, запись пропускается, лимиты считаются локально.
+
+Одинаковые одновременные промахи объединяются (single-flight): в процессе
+запросы ждут одну общую задачу вычисления, между воркерами - блокировку ключа
+и затем берут готовое значение из кэша. Сколько запросов так дождались чужого
+вычисления - счетчик coalesced.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_PREFIX, REDIS_URL
+from services import news_events
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Тег записей, зависящих от набора новостей (лента, категории, статистика, ответы бота)
+NEWS_TAG = "news"
+# Тег справочника источников
+SOURCES_TAG = "sources"
+
+# Сколько ждать чужое вычисление того же ключа, прежде чем считать самим (секунды)
+LOCK_WAIT = 10
+
+
+class CacheBackend(ABC):
+    """Общий интерфейс бэкендов кэша"""
+
+    name = ""
+    # Кэш общий для всех процессов (иначе - у каждого воркера свой)
+    shared = False
+    # Операции блокируют поток (асинхронные методы выполняют их через asyncio.to_thread)
+    blocking = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.stale_sets = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        # Вычисления aget_or_set, идущие в этом процессе, по ключам
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    # --- Операции бэкенда ---
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = (),
+            versions: Optional[Tuple[int, ...]] = None) -> bool:
+        """
+        Сохраняет значение на ttl секунд. С versions (снимок tag_versions(tags) до
+        вычисления) запись пропускается, если теги сбросили во время вычисления
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        ...
+
+    @abstractmethod
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        ...
+
+    @abstractmethod
+    def invalidate_tags(self, *tags: str):
+        ...
+
+    @abstractmethod
+    def lock(self, key: str, timeout: float = LOCK_WAIT):
+        """
+        Контекстный менеджер: одно вычисление ключа за раз. Отдает True, если
+        блокировка получена, False - если ожидание истекло (вычислять все равно можно)
+        """
+
+    @abstractmethod
+    def take_tokens(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """
+        Token bucket: забирает tokens и возвращает 0 или, если токенов не хватает,
+        сколько секунд подождать до следующей попытки (ничего не забирая)
+        """
+
+    def entries(self) -> Optional[int]:
+        return None
+
+    # --- Вычисление при промахе ---
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: float, tags: Iterable[str] = ()) -> Any:
+        """
+        Значение из кэша или результат compute() (один раз на ключ при параллельных
+        промахах). Исключения compute не кэшируются и пробрасываются вызывающему
+        """
+        tags = tuple(tags)
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock(key):
+            # Пока ждали блокировку, значение мог вычислить другой поток или процесс
+            value = self.get(key)
+            if value is not None:
+                self.coalesced += 1
+                return value
+            versions = self.tag_versions(tags)
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl, tags, versions)
+            return value
+
+    # --- Асинхронные обертки ---
+
+    async def _run(self, function: Callable, *args):
+        if self.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def aget(self, key: str) -> Any:
+        return await self._run(self.get, key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Any]:
+        return await self._run(self.get_many, keys)
+
+    async def aset(self, key: str, value: Any, ttl: float, tags: Iterable[str] = (),
+                   versions: Optional[Tuple[int, ...]] = None) -> bool:
+        return await self._run(self.set, key, value, ttl, tuple(tags), versions)
+
+    async def atag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        return await self._run(self.tag_versions, tuple(tags))
+
+    async def ainvalidate_tags(self, *tags: str):
+        return await self._run(self.invalidate_tags, *tags)
+
+    async def atake_tokens(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        return await self._run(self.take_tokens, key, rate, capacity, tokens)
+
+    @asynccontextmanager
+    async def alock(self, key: str, timeout: float = LOCK_WAIT):
+        # Взятие и освобождение могут пройти в разных потоках пула to_thread
+        manager = self.lock(key, timeout)
+        acquired = await self._run(manager.__enter__)
+        try:
+            yield acquired
+        finally:
+            await self._run(manager.__exit__, None, None, None)
+
+    async def aget_or_set(self, key: str, compute, ttl: float, tags: Iterable[str] = ()) -> Any:
+        """
+        Асинхронный get_or_set: compute - корутинная функция без аргументов.
+        Одновременные промахи по ключу в процессе ждут одно вычисление
+        (и получают его исключение, если оно упало)
+        """
+        value = await self.aget(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # Отдельная задача: отмена запроса, начавшего вычисление, не отменяет его для остальных
+            task = asyncio.ensure_future(self._acompute(key, compute, ttl, tuple(tags)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Исключение уже получили ожидающие; если их не осталось, asyncio не пишет "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _acompute(self, key: str, compute, ttl: float, tags: Tuple[str, ...]) -> Any:
+        async with self.alock(key):
+            # Пока ждали блокировку, значение мог вычислить другой воркер
+            value = await self.aget(key)
+            if value is not None:
+                self.coalesced += 1
+                return value
+            versions = await self.atag_versions(tags)
+            value = await compute()
+            if value is not None:
+                await self.aset(key, value, ttl, tags, versions)
+            return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "shared": self.shared,
+            "entries": self.entries(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else None,
+            "sets": self.sets,
+            "stale_sets": self.stale_sets,
+            "invalidations": self.invalidations,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight)
+        }
+
+
+class MemoryCache(CacheBackend):
+    """LRU с TTL в памяти процесса"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        # Ключ -> (срок, значение, теги)
+        self._entries: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        self._versions: Dict[str, int] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        # Блокировки ключей со счетчиком владельцев и ожидающих: ключи приходят из
+        # параметров запросов, поэтому запись удаляется, когда блокировка никому не нужна
+        self._locks: Dict[str, list] = {}
+        self._async_locks: Dict[str, list] = {}
+        self._guard = threading.Lock()
+        self.evictions = 0
+
+    def _remove(self, key: str):
+        """Удаляет запись вместе с ее ключом в наборах тегов (вызывать под _guard)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: str) -> Any:
+        with self._guard:
+            value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        with self._guard:
+            values = {key: self._get(key) for key in keys}
+        found = {key: value for key, value in values.items() if value is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = (),
+            versions: Optional[Tuple[int, ...]] = None) -> bool:
+        tags = tuple(tags)
+        with self._guard:
+            if versions is not None and versions != tuple(self._versions.get(tag, 0) for tag in tags):
+                self.stale_sets += 1
+                return False
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        self.sets += 1
+        return True
+
+    def delete(self, *keys: str):
+        with self._guard:
+            for key in keys:
+                self._remove(key)
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._guard:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def invalidate_tags(self, *tags: str):
+        with self._guard:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+        self.invalidations += 1
+
+    def _take_lock(self, locks: Dict[str, list], key: str, factory: Callable):
+        with self._guard:
+            entry = locks.get(key)
+            if entry is None:
+                entry = locks[key] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _return_lock(self, locks: Dict[str, list], key: str):
+        with self._guard:
+            entry = locks[key]
+            entry[1] -= 1
+            if not entry[1]:
+                del locks[key]
+
+    @contextmanager
+    def lock(self, key: str, timeout: float = LOCK_WAIT):
+        key_lock = self._take_lock(self._locks, key, threading.Lock)
+        try:
+            acquired = key_lock.acquire(timeout=timeout)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    key_lock.release()
+        finally:
+            self._return_lock(self._locks, key)
+
+    @asynccontextmanager
+    async def alock(self, key: str, timeout: float = LOCK_WAIT):
+        # В event loop ждем asyncio.Lock, а не блокируем поток
+        key_lock = self._take_lock(self._async_locks, key, asyncio.Lock)
+        try:
+            try:
+                await asyncio.wait_for(key_lock.acquire(), timeout)
+                acquired = True
+            except asyncio.TimeoutError:
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    key_lock.release()
+        finally:
+            self._return_lock(self._async_locks, key)
+
+    def take_tokens(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        with self._guard:
+            now = time.monotonic()
+            available, updated_at = self._buckets.get(key, (capacity, now))
+            available = min(capacity, available + (now - updated_at) * rate)
+            if available >= tokens:
+                self._buckets[key] = (available - tokens, now)
+                return 0.0
+            self._buckets[key] = (available, now)
+            return (tokens - available) / rate
+
+    def entries(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "tags": len(self._tags),
+            "locks": len(self._locks) + len(self._async_locks)
+        })
+        return stats
+
+
+class RedisCache(CacheBackend):
+    """Кэш в Redis, общий для всех воркеров (значения в JSON)"""
+
+    name = "redis"
+    shared = True
+    blocking = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = CACHE_PREFIX, client=None):
+        super().__init__()
+        import redis
+
+        self._redis = redis
+        # Соединения открываются при первой операции; после fork пул redis-py пересоздается сам
+        self.client = client or redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.prefix = prefix
+        # Лимиты считаются локально, пока Redis недоступен
+        self._fallback = MemoryCache(max_entries=0)
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def _version_key(self, tag: str) -> str:
+        return f"{self.prefix}tagv:{tag}"
+
+    def _failed(self, operation: str, error: Exception):
+        self.errors += 1
+        if self.last_error != str(error):
+            logger.warning(f"Redis cache {operation} failed: {error}")
+        self.last_error = str(error)
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self.client.get(self._key(key))
+        except self._redis.RedisError as e:
+            self._failed("get", e)
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        try:
+            raws = self.client.mget([self._key(key) for key in keys])
+        except self._redis.RedisError as e:
+            self._failed("mget", e)
+            raws = [None] * len(keys)
+        found = {key: json.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = (),
+            versions: Optional[Tuple[int, ...]] = None) -> bool:
+        tags = tuple(tags)
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        try:
+            with self.client.pipeline() as pipe:
+                if versions is not None and tags:
+                    # Запись применится, только если версии тегов не изменились до EXEC
+                    version_keys = [self._version_key(tag) for tag in tags]
+                    pipe.watch(*version_keys)
+                    current = tuple(int(version or 0) for version in pipe.mget(version_keys))
+                    if current != versions:
+                        pipe.reset()
+                        self.stale_sets += 1
+                        return False
+                    pipe.multi()
+                pipe.set(self._key(key), data, px=max(1, int(ttl * 1000)))
+                for tag in tags:
+                    pipe.sadd(self._tag_key(tag), key)
+                    pipe.expire(self._tag_key(tag), max(1, int(ttl)) * 2)
+                pipe.execute()
+        except self._redis.WatchError:
+            self.stale_sets += 1
+            return False
+        except self._redis.RedisError as e:
+            self._failed("set", e)
+            return False
+        self.sets += 1
+        return True
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            self.client.delete(*[self._key(key) for key in keys])
+        except self._redis.RedisError as e:
+            self._failed("delete", e)
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        tags = tuple(tags)
+        if not tags:
+            return ()
+        try:
+            return tuple(int(version or 0) for version in self.client.mget([self._version_key(tag) for tag in tags]))
+        except self._redis.RedisError as e:
+            self._failed("tag_versions", e)
+            return (-1,) * len(tags)
+
+    def invalidate_tags(self, *tags: str):
+        try:
+            for tag in tags:
+                # Сначала версия: начатые до сброса вычисления уже не запишутся
+                self.client.incr(self._version_key(tag))
+                keys = self.client.smembers(self._tag_key(tag))
+                with self.client.pipeline() as pipe:
+                    if keys:
+                        pipe.delete(*[self._key(key.decode()) for key in keys])
+                    pipe.delete(self._tag_key(tag))
+                    pipe.execute()
+        except self._redis.RedisError as e:
+            self._failed("invalidate", e)
+        self.invalidations += 1
+
+    @contextmanager
+    def lock(self, key: str, timeout: float = LOCK_WAIT):
+        # Блокировка истекает сама, если процесс-владелец упал посреди вычисления;
+        # thread_local=False - alock отпускает ее из другого потока
+        redis_lock = self.client.lock(
+            f"{self.prefix}lock:{key}", timeout=timeout * 3, blocking_timeout=timeout, thread_local=False
+        )
+        try:
+            acquired = redis_lock.acquire()
+        except self._redis.RedisError as e:
+            self._failed("lock", e)
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    redis_lock.release()
+                except self._redis.RedisError:
+                    pass
+
+    def take_tokens(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        bucket_key = f"{self.prefix}bucket:{key}"
+        try:
+            with self.client.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(bucket_key)
+                        stored_tokens, updated_at = pipe.hmget(bucket_key, "tokens", "updated_at")
+                        now = time.time()
+                        available = capacity if stored_tokens is None else min(
+                            capacity, float(stored_tokens) + (now - float(updated_at)) * rate
+                        )
+                        wait = 0.0 if available >= tokens else (tokens - available) / rate
+                        pipe.multi()
+                        pipe.hset(bucket_key, mapping={
+                            "tokens": available - tokens if wait == 0 else available, "updated_at": now
+                        })
+                        pipe.expire(bucket_key, max(60, int(capacity / rate) + 1))
+                        pipe.execute()
+                        return wait
+                    except self._redis.WatchError:
+                        # Токены одновременно забрал другой процесс - пересчитываем
+                        continue
+        except self._redis.RedisError as e:
+            self._failed("take_tokens", e)
+            return self._fallback.take_tokens(key, rate, capacity, tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({"errors": self.errors, "last_error": self.last_error})
+        return stats
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    if backend == "redis":
+        try:
+            return RedisCache()
+        except ImportError:
+            logger.error("CACHE_BACKEND=redis, but the redis package is not installed; using in-memory cache")
+    return MemoryCache()
+
+
+def invalidate_news(*_):
+    """Сбрасывает записи, зависящие от набора новостей"""
+    cache.invalidate_tags(NEWS_TAG)
+
+
+# Глобальный экземпляр
+cache = create_cache()
+news_events.subscribe(news_events.NEWS_SAVED, invalidate_news)
+news_events.subscribe(news_events.NEWS_DELETED, invalidate_news)
+news_events.subscribe(news_events.NEWS_RESTORED, invalidate_news)
+register_metrics("cache", cache.get_stats)
@@ -0,0 +1,178 @@
+"""
+Изменения ленты с момента курсора (дельта-синхронизация мини-приложения)
+
+Клиент держит локальную копию ленты и вместо перезагрузки страниц
+запрашивает /api/news/changes?since=<token>: новые новости целиком,
+измененные (просмотры, публикация в канал) - короткими фрагментами и ID
+удаленных, плюс следующий токен. Первый запрос без since только выдает
+токен - его берут до загрузки ленты, чтобы не пропустить изменения между
+ними.
+
+Новости выбираются диапазонным сканированием индекса (updated_at, id) после
+позиции курсора, удаления - из news_tombstones по (deleted_at, news_id);
+записи об удалении пишут архивация (record_tombstones в той же транзакции,
+что и удаление) и отключение секций. Изменения моложе CHANGES_SETTLE_SECONDS
+не отдаются: updated_at выставляется до коммита, и транзакция с более ранней
+отметкой может закоммититься позже уже выданного курсора. Токен старше
+CHANGES_TOMBSTONE_DAYS (записи об удалениях уже очищены) требует полной
+перезагрузки - в ответе reset.
+"""
+import base64
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import DateTime, delete, insert, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+
+from config import CHANGES_SETTLE_SECONDS, CHANGES_TOMBSTONE_DAYS
+from db import NewsItem, NewsTombstone
+
+logger = logging.getLogger(__name__)
+
+news_table = NewsItem.__table__
+tombstones_table = NewsTombstone.__table__
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ChangesCursor:
+    """
+    Позиции в news_items (updated_at, id) и в news_tombstones (deleted_at, news_id)
+    known - момент, до которого клиент знает все созданные новости: при постраничной
+    выдаче он не сдвигается до последней страницы, новости новее него отдаются целиком
+    """
+
+    def __init__(self, updated_at: datetime, news_id: int, deleted_at: datetime, tombstone_id: int, known: datetime):
+        self.updated_at, self.news_id = updated_at, news_id
+        self.deleted_at, self.tombstone_id = deleted_at, tombstone_id
+        self.known = known
+
+    @classmethod
+    def at(cls, moment: datetime) -> "ChangesCursor":
+        return cls(moment, 0, moment, 0, moment)
+
+    def encode(self) -> str:
+        data = [
+            self.updated_at.isoformat(), self.news_id, self.deleted_at.isoformat(), self.tombstone_id,
+            self.known.isoformat()
+        ]
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "ChangesCursor":
+        try:
+            updated_at, news_id, deleted_at, tombstone_id, known = json.loads(
+                base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            )
+            return cls(
+                datetime.fromisoformat(updated_at), int(news_id),
+                datetime.fromisoformat(deleted_at), int(tombstone_id),
+                datetime.fromisoformat(known)
+            )
+        except (ValueError, TypeError) as e:
+            raise InvalidToken(f"Invalid changes token: {e}")
+
+
+def record_tombstones(db, ids: Iterable[int], deleted_at: Optional[datetime] = None):
+    """
+    Записывает удаление новостей (вызывать в транзакции удаления, до DELETE)
+    db - сессия или соединение
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    db.execute(insert(tombstones_table).from_select(
+        ['news_id', 'category', 'deleted_at'],
+        select(news_table.c.id, news_table.c.category, literal(deleted_at or datetime.utcnow(), DateTime))
+        .where(news_table.c.id.in_(ids))
+    ))
+
+
+def clear_tombstones(db, ids: Iterable[int]):
+    """Снимает записи об удалении с восстановленных новостей"""
+    ids = list(ids)
+    if ids:
+        db.execute(delete(tombstones_table).where(tombstones_table.c.news_id.in_(ids)))
+
+
+def purge_tombstones(db, now: Optional[datetime] = None) -> int:
+    """Удаляет записи об удалениях старше CHANGES_TOMBSTONE_DAYS"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=CHANGES_TOMBSTONE_DAYS)
+    return db.execute(delete(tombstones_table).where(tombstones_table.c.deleted_at < cutoff)).rowcount
+
+
+async def load_changes(
+    db: AsyncSession,
+    token: Optional[str],
+    category: Optional[str] = None,
+    limit: int = 200
+) -> Tuple[ChangesCursor, ChangesCursor, List[NewsItem], List[int], bool, bool]:
+    """
+    Изменения после токена: (курсор токена, следующий курсор, измененные новости, ID удаленных, есть ли еще, нужен ли reset)
+    Новость, измененная и удаленная после токена, попадает в оба списка - удаления применяются последними
+    """
+    now = datetime.utcnow()
+    horizon = now - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    if not token:
+        cursor = ChangesCursor.at(horizon)
+        return cursor, cursor, [], [], False, False
+
+    cursor = ChangesCursor.decode(token)
+    if min(cursor.deleted_at, cursor.known) < now - timedelta(days=CHANGES_TOMBSTONE_DAYS):
+        return cursor, ChangesCursor.at(horizon), [], [], False, True
+
+    filters = [
+        tuple_(NewsItem.updated_at, NewsItem.id) > tuple_(cursor.updated_at, cursor.news_id),
+        NewsItem.updated_at < horizon,
+    ]
+    tombstone_filters = [
+        tuple_(NewsTombstone.deleted_at, NewsTombstone.news_id) > tuple_(cursor.deleted_at, cursor.tombstone_id),
+        NewsTombstone.deleted_at < horizon,
+    ]
+    if category and category != "all":
+        filters.append(NewsItem.category == category)
+        tombstone_filters.append(NewsTombstone.category == category)
+
+    items = (await db.execute(
+        select(NewsItem).options(defer(NewsItem.post_text)).where(*filters)
+        .order_by(NewsItem.updated_at, NewsItem.id).limit(limit + 1)
+    )).scalars().all()
+    tombstones = (await db.execute(
+        select(NewsTombstone.deleted_at, NewsTombstone.news_id).where(*tombstone_filters)
+        .order_by(NewsTombstone.deleted_at, NewsTombstone.news_id).limit(limit + 1)
+    )).all()
+
+    has_more = len(items) > limit or len(tombstones) > limit
+    items, tombstones = items[:limit], tombstones[:limit]
+
+    # Список, в котором еще есть данные, продолжается с последней выданной записи, исчерпанный - с горизонта
+    # (там нет записей новее курсора и моложе горизонта, кроме уже выданных)
+    next_cursor = ChangesCursor(
+        items[-1].updated_at if len(items) == limit else horizon,
+        items[-1].id if len(items) == limit else 0,
+        tombstones[-1].deleted_at if len(tombstones) == limit else horizon,
+        tombstones[-1].news_id if len(tombstones) == limit else 0,
+        cursor.known if has_more else horizon,
+    )
+    return cursor, next_cursor, items, [tombstone.news_id for tombstone in tombstones], has_more, False
+
+
+def is_new(item: NewsItem, cursor: ChangesCursor) -> bool:
+    """Новость создана после того, как клиент получил ленту, - отдается целиком"""
+    return item.created_at is None or item.created_at >= cursor.known
+
+
+def change_fragment(item: NewsItem) -> Dict[str, Any]:
+    """Изменяемые поля уже известной клиенту новости"""
+    return {
+        "id": item.id,
+        "views_count": item.views_count or 0,
+        "is_published_to_channel": bool(item.is_published_to_channel),
+        "published_to_channel_at": item.published_to_channel_at.isoformat() if item.published_to_channel_at else None,
+        "updated_at": item.updated_at.isoformat() if item.updated_at else None,
+    }
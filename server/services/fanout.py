@@ -0,0 +1,332 @@
+"""
+Рассылка новых новостей подписчикам бота по категориям
+
+Когда save_news_items фиксирует новые новости, движок группирует их по
+категориям, рендерит одно сообщение на категорию и рассылает его всем
+подписчикам через пул конкурентных отправителей с общим ограничением частоты.
+Чаты, заблокировавшие бота, автоматически отписываются.
+"""
+import asyncio
+import html
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from config import (
+    TOKEN, TELEGRAM_API_URL, FANOUT_MODE, FANOUT_DIGEST_INTERVAL,
+    FANOUT_CONCURRENCY, FANOUT_RATE, FANOUT_PAGE_SIZE
+)
+from services import news_events, subscriptions
+from services.metrics import register_metrics
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+# Сколько раз повторяем отправку после ответа 429
+MAX_RETRIES = 3
+
+CATEGORY_EMOJI = {
+    'gifts': '🎁',
+    'crypto': '💰',
+    'nft': '🖼️',
+    'tech': '💻',
+    'community': '👥',
+    'general': '📢'
+}
+
+
+class FanoutResult:
+    """Итог рассылки одного сообщения по списку чатов"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.blocked: List[int] = []
+        self.elapsed = 0.0
+
+    def merge(self, other: "FanoutResult"):
+        self.sent += other.sent
+        self.failed += other.failed
+        self.retried += other.retried
+        self.blocked.extend(other.blocked)
+        self.elapsed += other.elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "blocked": len(self.blocked),
+            "elapsed_seconds": round(self.elapsed, 3),
+            "messages_per_second": round(self.sent / self.elapsed, 1) if self.elapsed else 0.0
+        }
+
+
+class FanoutEngine:
+    """Движок рассылки новостей подписчикам"""
+
+    def __init__(
+        self,
+        mode: str = FANOUT_MODE,
+        digest_interval: int = FANOUT_DIGEST_INTERVAL,
+        concurrency: int = FANOUT_CONCURRENCY,
+        rate: float = FANOUT_RATE,
+        page_size: int = FANOUT_PAGE_SIZE,
+        api_url: str = TELEGRAM_API_URL,
+        token: str = TOKEN
+    ):
+        self.mode = mode
+        self.digest_interval = digest_interval
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.page_size = page_size
+        self.base_url = f"{api_url}/bot{token}"
+
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._bucket: Optional[TokenBucket] = None
+
+        self.deliveries = 0
+        self.totals = FanoutResult()
+        self.unsubscribed = 0
+
+    # --- Прием новостей ---
+
+    def handle_news_saved(self, items: List[Dict[str, Any]]):
+        """
+        Обработчик события NEWS_SAVED: копит новости и будит движок
+        Может вызываться из любого потока
+        """
+        if self.mode == "off" or not items:
+            return
+
+        with self._pending_lock:
+            self._pending.extend(items)
+
+        if self.mode == "instant" and self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take_pending(self) -> List[Dict[str, Any]]:
+        with self._pending_lock:
+            items, self._pending = self._pending, []
+        return items
+
+    # --- Жизненный цикл ---
+
+    async def start(self):
+        """
+        Запускает фоновую задачу рассылки (вызывается при старте приложения)
+        """
+        if self.mode == "off" or self._task:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Fan-out engine started (mode: {self.mode}, rate: {self.rate}/s, concurrency: {self.concurrency})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self.mode == "digest":
+                    await asyncio.sleep(self.digest_interval)
+                else:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+
+                items = self._take_pending()
+                if items:
+                    await self.deliver(items)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in fan-out loop: {e}")
+                await asyncio.sleep(60)
+
+    # --- Рендеринг ---
+
+    def render_message(self, items: List[Dict[str, Any]], category: str) -> str:
+        """
+        Одно сообщение со списком новостей категории в пределах лимита Telegram
+        """
+        if category == subscriptions.ALL_CATEGORIES:
+            header = "🔔 <b>Новые новости"
+        else:
+            header = f"🔔 <b>Новое в категории {CATEGORY_EMOJI.get(category, '📢')} {category}"
+        if self.mode == "digest":
+            header += " (дайджест)"
+        text = header + ":</b>\n\n"
+
+        for index, item in enumerate(items, 1):
+            entry = (
+                f"{index}. <b>{html.escape(item['title'])}</b>\n"
+                f"🔗 <a href=\"{html.escape(item['link'], quote=True)}\">Читать</a>\n\n"
+            )
+            # Для непоследней новости оставляем место под строку "…и еще N"
+            more = f"…и еще {len(items) - index + 1}"
+            reserve = len(more) if index < len(items) else 0
+            if len(text) + len(entry) + reserve > MESSAGE_LIMIT:
+                text += more
+                break
+            text += entry
+
+        return text.rstrip()
+
+    # --- Отправка ---
+
+    async def _send_one(self, session: aiohttp.ClientSession, chat_id: int, text: str, result: FanoutResult):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True
+        }
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            try:
+                async with session.post(f"{self.base_url}/sendMessage", json=payload) as response:
+                    data = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Network error sending to {chat_id}: {e}")
+                result.failed += 1
+                return
+
+            if data.get("ok"):
+                result.sent += 1
+                return
+
+            error_code = data.get("error_code")
+            description = data.get("description", "")
+
+            if error_code == 429 and attempt < MAX_RETRIES:
+                # Telegram просит подождать - притормаживаем всех отправителей
+                retry_after = (data.get("parameters") or {}).get("retry_after", 1)
+                result.retried += 1
+                await self._bucket.pause(retry_after)
+                continue
+
+            if error_code == 403 or "chat not found" in description:
+                # Бот заблокирован, удален из чата или чат не существует
+                result.blocked.append(chat_id)
+                return
+
+            logger.warning(f"Failed to send to {chat_id}: {error_code} {description}")
+            result.failed += 1
+            return
+
+        result.failed += 1
+
+    async def send_to_chats(
+        self,
+        chat_ids: Iterable[int],
+        text: str,
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> FanoutResult:
+        """
+        Рассылает один текст по списку чатов пулом из concurrency отправителей
+        """
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.rate, key="fanout")
+
+        result = FanoutResult()
+        started_at = time.monotonic()
+        chat_iterator = iter(chat_ids)
+
+        async def sender():
+            # Все отправители забирают чаты из общего итератора
+            for chat_id in chat_iterator:
+                await self._send_one(session, chat_id, text, result)
+
+        own_session = session is None
+        if own_session:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.concurrency)
+            )
+        try:
+            await asyncio.gather(*(sender() for _ in range(self.concurrency)))
+        finally:
+            if own_session:
+                await session.close()
+
+        result.elapsed = time.monotonic() - started_at
+        return result
+
+    async def deliver_to_category(self, category: str, text: str, session: aiohttp.ClientSession) -> FanoutResult:
+        """
+        Рассылает сообщение всем подписчикам категории постранично
+        """
+        total = FanoutResult()
+        after_chat_id = None
+
+        while True:
+            page = await asyncio.to_thread(
+                subscriptions.fetch_subscriber_page, category, after_chat_id, self.page_size
+            )
+            if not page:
+                break
+            after_chat_id = page[-1]
+
+            result = await self.send_to_chats(page, text, session)
+            if result.blocked:
+                self.unsubscribed += await asyncio.to_thread(subscriptions.remove_chats, result.blocked)
+            total.merge(result)
+
+        return total
+
+    async def deliver(self, items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Рассылает новости: по сообщению на каждую категорию и общее для подписчиков 'all'
+        """
+        by_category = defaultdict(list)
+        for item in items:
+            by_category[item.get('category') or 'general'].append(item)
+        by_category[subscriptions.ALL_CATEGORIES] = list(items)
+
+        report = {}
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=self.concurrency)
+        ) as session:
+            for category, category_items in by_category.items():
+                text = self.render_message(category_items, category)
+                result = await self.deliver_to_category(category, text, session)
+                self.totals.merge(result)
+                report[category] = result.to_dict()
+
+        self.deliveries += 1
+        logger.info(f"Fan-out delivered {len(items)} news: {report}")
+        return report
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "mode": self.mode,
+            "pending_items": pending,
+            "deliveries": self.deliveries,
+            "unsubscribed": self.unsubscribed,
+            "totals": self.totals.to_dict()
+        }
+
+
+# Глобальный экземпляр движка
+fanout_engine = FanoutEngine()
+news_events.subscribe(news_events.NEWS_SAVED, fanout_engine.handle_news_saved)
+register_metrics("fanout", fanout_engine.get_stats)
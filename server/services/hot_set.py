@@ -0,0 +1,259 @@
+"""
+Последние новости каждой категории в памяти воркера
+
+Почти весь трафик - первые страницы ленты нескольких категорий и сводки бота.
+Для каждой категории (и для ленты целиком) воркер держит HOT_SET_SIZE самых
+свежих новостей в компактном виде: запись со __slots__ и готовым JSON новости
+для ленты. Такие запросы отдаются из памяти без обращения к базе и без
+валидации pydantic.
+
+Набор загружается из базы при старте и раз в HOT_SET_REFRESH_INTERVAL секунд
+(заодно обновляются счетчики просмотров). Новости, сохраненные в этом
+процессе, добавляются сразу по событию NEWS_SAVED; о новостях из других
+процессов приходит NOTIFY (PostgreSQL), после которого набор перезагружается.
+Удаление и восстановление новостей, новый источник или изменение во время
+загрузки делают набор неготовым - до следующей загрузки запросы идут в базу.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+from operator import attrgetter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import defer
+
+from config import HOT_SET_SIZE, HOT_SET_REFRESH_INTERVAL
+from db import get_db_session, NewsItem, NewsSource
+from models import NewsSourceResponse, feed_item_response
+from services import news_events, pg_notify
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Ключ ленты без фильтра по категории
+ALL = "all"
+
+_publish_date = attrgetter("publish_date")
+
+
+class HotItem:
+    """Новость в наборе: поля для сводок бота и готовый JSON для ленты"""
+
+    __slots__ = ("id", "category", "publish_date", "title", "link", "json")
+
+    def __init__(self, item, source: Optional[NewsSourceResponse]):
+        self.id = item.id
+        self.category = item.category
+        self.publish_date = item.publish_date
+        self.title = item.title
+        self.link = item.link
+        self.json = feed_item_response(item, source).model_dump_json().encode()
+
+    def size(self) -> int:
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.publish_date) + sys.getsizeof(self.title)
+            + sys.getsizeof(self.link) + sys.getsizeof(self.json)
+        )
+
+
+class HotSet:
+    """Кольцевые буферы последних новостей по категориям"""
+
+    def __init__(self, size: int = HOT_SET_SIZE, refresh_interval: int = HOT_SET_REFRESH_INTERVAL):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        # По возрастанию даты публикации: самые свежие - в конце
+        self._rings: Dict[str, List[HotItem]] = {}
+        self._totals: Dict[str, int] = {}
+        self._sources: Dict[int, NewsSourceResponse] = {}
+        self._lock = threading.Lock()
+        # Меняется при каждом изменении набора: загрузка, во время которой он изменился, не применяется
+        self._generation = 0
+        self.ready = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.loads = 0
+        self.added = 0
+        self.served = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    # --- Загрузка и обновление ---
+
+    def warm(self) -> bool:
+        """Загружает набор из базы; возвращает False, если он изменился во время загрузки"""
+        with self._lock:
+            generation = self._generation
+
+        db = get_db_session()
+        try:
+            totals = dict(db.query(NewsItem.category, func.count()).group_by(NewsItem.category).all())
+            query = db.query(NewsItem).options(defer(NewsItem.post_text)).order_by(NewsItem.publish_date.desc())
+            rows = {ALL: query.limit(self.size).all()}
+            for category in totals:
+                rows[category] = query.filter(NewsItem.category == category).limit(self.size).all()
+            # Источников немного - держим все, чтобы новые новости не требовали запросов
+            sources = {source.id: NewsSourceResponse.from_orm(source) for source in db.query(NewsSource).all()}
+        finally:
+            db.close()
+
+        items: Dict[int, HotItem] = {}
+        rings = {}
+        for key, news_items in rows.items():
+            rings[key] = [
+                items.get(item.id) or items.setdefault(item.id, HotItem(item, sources.get(item.source_id)))
+                for item in reversed(news_items)
+            ]
+        totals[ALL] = sum(totals.values())
+
+        with self._lock:
+            self._rings, self._totals, self._sources = rings, totals, sources
+            self.ready = self._generation == generation
+        self.loads += 1
+        if not self.ready:
+            logger.info("News changed while loading hot set, reloading")
+            self.refresh()
+        return self.ready
+
+    def _insert(self, key: str, item: HotItem):
+        ring = self._rings.setdefault(key, [])
+        self._totals[key] = self._totals.get(key, 0) + 1
+        bisect.insort(ring, item, key=_publish_date)
+        if len(ring) > self.size:
+            del ring[:-self.size]
+
+    def handle_news_saved(self, items: List[Dict[str, Any]]):
+        """Обработчик NEWS_SAVED: добавляет новости этого процесса без запросов к базе"""
+        with self._lock:
+            self._generation += 1
+            if not self.ready:
+                return
+            for payload in items:
+                if payload['source_id'] is not None and payload['source_id'] not in self._sources:
+                    # Новый источник - его данных в наборе нет
+                    self.ready = False
+                    break
+                item = HotItem(SimpleNamespace(**payload), self._sources.get(payload['source_id']))
+                if any(existing.id == item.id for existing in self._rings.get(ALL, ())):
+                    continue
+                self._insert(ALL, item)
+                self._insert(item.category, item)
+                self.added += 1
+        if not self.ready:
+            self.refresh()
+
+    def handle_news_changed(self, *_):
+        """Обработчик удаления и восстановления: набор неготов до перезагрузки"""
+        with self._lock:
+            self._generation += 1
+            self.ready = False
+        self.refresh()
+
+    def handle_notification(self, payload: str):
+        # Свои сохранения уже применены по NEWS_SAVED
+        if payload != str(os.getpid()):
+            self.refresh()
+
+    def refresh(self):
+        """Будит фоновую перезагрузку; может вызываться из любого потока"""
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run_periodically(self):
+        """Загрузка при старте, по уведомлениям и раз в refresh_interval секунд"""
+        if not self.enabled:
+            logger.info("Hot set is disabled (HOT_SET_SIZE=0)")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        pg_notify.feed_listener.start()
+
+        logger.info(f"Starting hot set: {self.size} newest news per category, reload every {self.refresh_interval}s")
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.warm)
+            except Exception as e:
+                logger.error(f"Error loading hot set: {e}")
+
+    # --- Чтение ---
+
+    def _latest(self, category: Optional[str], offset: int, limit: int):
+        """Новости offset..offset+limit (от свежих) и общее количество, None - набор не покрывает запрос"""
+        key = category if category and category != "all" else ALL
+        with self._lock:
+            if not self.ready:
+                return None
+            ring = self._rings.get(key, [])
+            total = self._totals.get(key, 0)
+            # Покрыто, если в буфере есть нужные позиции или в нем вся категория
+            if offset + limit > len(ring) and len(ring) < total:
+                return None
+            end = len(ring) - offset
+            return ring[max(0, end - limit):max(0, end)][::-1], total
+
+    def latest(self, category: Optional[str], limit: int) -> Optional[List[HotItem]]:
+        """Последние новости для сводки бота (None - читать из базы)"""
+        result = self._latest(category, 0, limit)
+        if result is None:
+            self.fallbacks += 1
+            return None
+        self.served += 1
+        return result[0]
+
+    def feed_page(self, category: Optional[str], offset: int, limit: int, page: int) -> Optional[bytes]:
+        """Готовый JSON страницы ленты в формате NewsResponse (None - читать из базы)"""
+        result = self._latest(category, offset, limit)
+        if result is None:
+            self.fallbacks += 1
+            return None
+        items, total = result
+        self.served += 1
+        return b'{"data":[%b],"total":%d,"page":%d,"pages":%d}' % (
+            b",".join(item.json for item in items), total, page, (total + limit - 1) // limit
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = {item.id: item for ring in self._rings.values() for item in ring}
+            categories = {key: len(ring) for key, ring in self._rings.items()}
+        memory = sum(item.size() for item in items.values())
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "size": self.size,
+            "categories": categories,
+            "items": len(items),
+            "memory_bytes": memory,
+            "bytes_per_10k_items": memory * 10000 // len(items) if items else None,
+            "loads": self.loads,
+            "added": self.added,
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "listening": pg_notify.feed_listener.connected
+        }
+
+
+# Глобальный экземпляр
+hot_set = HotSet()
+news_events.subscribe(news_events.NEWS_SAVED, hot_set.handle_news_saved)
+news_events.subscribe(news_events.NEWS_DELETED, hot_set.handle_news_changed)
+news_events.subscribe(news_events.NEWS_RESTORED, hot_set.handle_news_changed)
+pg_notify.feed_listener.add_callback(hot_set.handle_notification)
+register_metrics("hot_set", hot_set.get_stats)
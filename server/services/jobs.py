@@ -0,0 +1,295 @@
+"""
+Реестр фоновых задач (ручная публикация и т.п.)
+
+Одинаковые запросы объединяются: пока задача с тем же ключом выполняется,
+новый запрос получает ее вместо запуска еще одной. Прогресс задачи доступен
+по ее ID через /telegram/jobs/{id}.
+
+Задачи хранятся в таблице background_jobs, поэтому статус отдает любой воркер,
+а объединение работает между процессами: у выполняющейся задачи заполнен
+уникальный active_key, и второй воркер не может вставить задачу с тем же ключом.
+Воркер, выполняющий задачу, раз в PROGRESS_INTERVAL записывает прогресс и
+heartbeat; задача без heartbeat дольше STALE_AFTER (воркер упал) считается
+завершенной с ошибкой и не мешает запустить новую.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from db import get_db_session, BackgroundJob
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Сколько завершенных задач хранится для запросов статуса
+HISTORY_SIZE = 100
+# Как часто выполняющаяся задача сохраняет прогресс (секунды)
+PROGRESS_INTERVAL = 2
+# Задача без heartbeat дольше этого времени считается потерянной
+STALE_AFTER = 60
+
+
+class Job:
+    """Фоновая задача и ее прогресс"""
+
+    def __init__(self, kind: str, key: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.requests = 1
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_row(cls, row: BackgroundJob) -> "Job":
+        job = cls(row.kind, row.key)
+        job.load(row)
+        return job
+
+    def load(self, row: BackgroundJob):
+        """Копирует состояние задачи из записи в базе"""
+        self.id = row.id
+        for field in ("status", "requests", "queued", "sent", "failed", "result", "error",
+                      "created_at", "started_at", "finished_at"):
+            setattr(self, field, getattr(row, field))
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def add_queued(self, count: int = 1):
+        self.queued += count
+
+    def add_sent(self, count: int = 1):
+        self.sent += count
+
+    def add_failed(self, count: int = 1):
+        self.failed += count
+
+    async def wait(self) -> Any:
+        """
+        Ждет завершения задачи и возвращает ее результат
+        Задачу другого воркера ждет по записи в базе
+        """
+        if self._task:
+            await asyncio.shield(self._task)
+            return self.result
+
+        while self.active:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            row = await asyncio.to_thread(load_job, self.id)
+            if row is None:
+                break
+            self.load(row)
+        return self.result
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = None
+        if self.started_at:
+            duration = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "requests": self.requests,
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_seconds": round(duration, 3) if duration is not None else None
+        }
+
+
+def load_job(job_id: str) -> Optional[BackgroundJob]:
+    db = get_db_session()
+    try:
+        return db.get(BackgroundJob, job_id)
+    finally:
+        db.close()
+
+
+class JobRegistry:
+    """Реестр задач с объединением одинаковых запросов"""
+
+    def __init__(self, history_size: int = HISTORY_SIZE, progress_interval: float = PROGRESS_INTERVAL,
+                 stale_after: float = STALE_AFTER):
+        self.history_size = history_size
+        self.progress_interval = progress_interval
+        self.stale_after = stale_after
+        # Задачи, выполняющиеся в этом процессе
+        self._running: Dict[str, Job] = {}
+        self.submitted = 0
+        self.coalesced = 0
+
+    async def submit(self, kind: str, key: str, run: Callable[[Job], Awaitable[Any]]) -> Tuple[Job, bool]:
+        """
+        Запускает задачу run(job) или возвращает уже выполняющуюся с тем же ключом (в любом воркере)
+        Возвращает (задача, создана ли новая)
+        """
+        job = Job(kind, key)
+        existing = await asyncio.to_thread(self._claim, job)
+        if existing is not None:
+            self.coalesced += 1
+            logger.info(f"Request coalesced onto running job {existing.id} ({key})")
+            local = self._running.get(existing.id)
+            if local:
+                local.requests = existing.requests
+                return local, False
+            return existing, False
+
+        self._running[job.id] = job
+        self.submitted += 1
+        job._task = asyncio.get_running_loop().create_task(self._run(job, run))
+        return job, True
+
+    def _claim(self, job: Job) -> Optional[Job]:
+        """
+        Записывает новую задачу с active_key; если ключ уже занят - отмечает повторный запрос
+        и возвращает выполняющуюся задачу
+        """
+        db = get_db_session()
+        try:
+            # Задача упавшего воркера не должна держать ключ вечно
+            stale = datetime.utcnow() - timedelta(seconds=self.stale_after)
+            expired = db.query(BackgroundJob).filter(
+                BackgroundJob.active_key == job.key, BackgroundJob.heartbeat_at < stale
+            ).update({
+                BackgroundJob.active_key: None,
+                BackgroundJob.status: FAILED,
+                BackgroundJob.error: "Worker stopped responding",
+                BackgroundJob.finished_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if expired:
+                logger.warning(f"Job with key {job.key} lost its worker, marked as failed")
+            db.commit()
+
+            try:
+                db.add(BackgroundJob(
+                    id=job.id, kind=job.kind, key=job.key, active_key=job.key, status=job.status,
+                    requests=job.requests, created_at=job.created_at, heartbeat_at=datetime.utcnow()
+                ))
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            db.query(BackgroundJob).filter(BackgroundJob.active_key == job.key).update(
+                {BackgroundJob.requests: BackgroundJob.requests + 1}, synchronize_session=False
+            )
+            db.commit()
+            row = db.query(BackgroundJob).filter(BackgroundJob.active_key == job.key).first()
+            if row is None:
+                # Задача успела завершиться между вставкой и чтением - пробуем снова
+                return self._claim(job)
+            return Job.from_row(row)
+        finally:
+            db.close()
+
+    def _save(self, job: Job, finished: bool = False):
+        """Сохраняет прогресс задачи (и освобождает ключ, если она завершена)"""
+        values = {
+            BackgroundJob.status: job.status,
+            BackgroundJob.queued: job.queued,
+            BackgroundJob.sent: job.sent,
+            BackgroundJob.failed: job.failed,
+            BackgroundJob.result: job.result,
+            BackgroundJob.error: job.error,
+            BackgroundJob.started_at: job.started_at,
+            BackgroundJob.finished_at: job.finished_at,
+            BackgroundJob.heartbeat_at: datetime.utcnow()
+        }
+        if finished:
+            values[BackgroundJob.active_key] = None
+        db = get_db_session()
+        try:
+            db.query(BackgroundJob).filter(BackgroundJob.id == job.id).update(values, synchronize_session=False)
+            if finished:
+                self._trim(db)
+            db.commit()
+        finally:
+            db.close()
+
+    def _trim(self, db):
+        # Удаляем самые старые завершенные задачи сверх лимита истории
+        kept = db.query(BackgroundJob.id).filter(BackgroundJob.active_key.is_(None)).order_by(
+            BackgroundJob.created_at.desc()
+        ).limit(self.history_size)
+        db.query(BackgroundJob).filter(
+            BackgroundJob.active_key.is_(None), BackgroundJob.id.notin_(kept.scalar_subquery())
+        ).delete(synchronize_session=False)
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await asyncio.to_thread(self._save, job)
+            except Exception as e:
+                logger.error(f"Failed to save progress of job {job.id}: {e}")
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Any]]):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            job.result = await run(job)
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.key}) failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            heartbeat.cancel()
+            job.finished_at = datetime.utcnow()
+            try:
+                await asyncio.to_thread(self._save, job, True)
+            except Exception as e:
+                logger.error(f"Failed to save result of job {job.id}: {e}")
+            finally:
+                self._running.pop(job.id, None)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """
+        Задача по ID: выполняющаяся в этом процессе - с текущим прогрессом, иначе из базы
+        """
+        row = await asyncio.to_thread(load_job, job_id)
+        if row is None:
+            return None
+        job = self._running.get(job_id)
+        if job:
+            # Повторные запросы из других воркеров учитываются только в базе
+            job.requests = row.requests
+            return job
+        return Job.from_row(row)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "running": len(self._running)
+        }
+
+
+# Глобальный реестр задач
+job_registry = JobRegistry()
+register_metrics("jobs", job_registry.get_stats)
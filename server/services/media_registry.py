@@ -0,0 +1,157 @@
+"""
+Реестр file_id для медиа, уже отправленных в Telegram
+
+Telegram возвращает file_id после первой успешной отправки фото/видео по URL.
+Повторные отправки по file_id не требуют повторного скачивания файла с источника.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from db import get_db_session, MediaFile
+
+logger = logging.getLogger(__name__)
+
+# Сколько URL держим в памяти процесса (остальное читается из базы)
+CACHE_SIZE = 10000
+# Сколько секунд помним, что file_id для URL нет: его может сохранить другой воркер
+MISS_TTL = 60
+
+
+class MediaRegistry:
+    """
+    Отображение URL медиа на file_id с кэшем в памяти поверх таблицы media_registry
+    Кэш общий для потоков публикации (asyncio.to_thread), поэтому под блокировкой
+    """
+    
+    def __init__(self, cache_size: int = CACHE_SIZE, miss_ttl: float = MISS_TTL):
+        self.cache_size = cache_size
+        self.miss_ttl = miss_ttl
+        # URL -> (file_id, время проверки); None - file_id в базе не было
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _cache_put(self, url: str, file_id: Optional[str]):
+        with self._lock:
+            self._cache[url] = (file_id, time.monotonic())
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
+    def _cache_get(self, url: str) -> Tuple[bool, Optional[str]]:
+        """(найдено, file_id); промах старше miss_ttl считается ненайденным"""
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is None:
+                return False, None
+            file_id, checked_at = entry
+            if file_id is None and time.monotonic() - checked_at >= self.miss_ttl:
+                del self._cache[url]
+                return False, None
+            self._cache.move_to_end(url)
+            return True, file_id
+    
+    def _cache_discard(self, url: str):
+        with self._lock:
+            self._cache.pop(url, None)
+    
+    def get_file_id(self, url: str) -> Optional[str]:
+        """
+        Возвращает file_id для URL или None, если медиа еще не загружалось
+        """
+        if not url:
+            return None
+        
+        found, file_id = self._cache_get(url)
+        if found:
+            return file_id
+        
+        try:
+            db = get_db_session()
+            record = db.query(MediaFile).filter(MediaFile.source_url == url).first()
+            file_id = record.file_id if record else None
+        except Exception as e:
+            logger.warning(f"Error reading media registry for {url}: {e}")
+            return None
+        finally:
+            if 'db' in locals():
+                db.close()
+        
+        self._cache_put(url, file_id)
+        return file_id
+    
+    def resolve(self, media: Dict[str, Any]) -> str:
+        """
+        Возвращает значение для поля photo/video: file_id, если он известен, иначе URL
+        """
+        return self.get_file_id(media['url']) or media['url']
+    
+    def remember(self, url: str, media_type: str, file_id: str, file_unique_id: Optional[str] = None):
+        """
+        Сохраняет file_id, полученный после первой успешной отправки
+        """
+        if not url or not file_id or self._cache_get(url) == (True, file_id):
+            return
+        
+        try:
+            db = get_db_session()
+            record = db.query(MediaFile).filter(MediaFile.source_url == url).first()
+            if record:
+                record.file_id = file_id
+                record.file_unique_id = file_unique_id
+                record.media_type = media_type
+            else:
+                db.add(MediaFile(
+                    source_url=url,
+                    media_type=media_type,
+                    file_id=file_id,
+                    file_unique_id=file_unique_id
+                ))
+            db.commit()
+        except Exception as e:
+            # Запись могла появиться параллельно - file_id все равно валиден
+            logger.warning(f"Error saving media registry for {url}: {e}")
+            if 'db' in locals():
+                db.rollback()
+        finally:
+            if 'db' in locals():
+                db.close()
+        
+        self._cache_put(url, file_id)
+    
+    def remember_from_message(self, media: Dict[str, Any], message: Dict[str, Any]):
+        """
+        Извлекает file_id из отправленного сообщения и сохраняет его для URL медиа
+        """
+        file_info = None
+        if message.get('photo'):
+            # Telegram возвращает несколько размеров, последний - самый большой
+            file_info = message['photo'][-1]
+        else:
+            # Видео может вернуться как animation или document (например, gif)
+            file_info = message.get('video') or message.get('animation') or message.get('document')
+        
+        if file_info and file_info.get('file_id'):
+            self.remember(media['url'], media['type'], file_info['file_id'], file_info.get('file_unique_id'))
+    
+    def forget(self, url: str):
+        """
+        Удаляет file_id, который Telegram перестал принимать
+        """
+        try:
+            db = get_db_session()
+            db.query(MediaFile).filter(MediaFile.source_url == url).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Error removing media registry entry for {url}: {e}")
+        finally:
+            if 'db' in locals():
+                db.close()
+        # После удаления из базы: параллельное чтение не вернет в кэш старый file_id
+        self._cache_discard(url)
+
+
+# Глобальный экземпляр реестра
+media_registry = MediaRegistry()
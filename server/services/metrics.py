@@ -0,0 +1,30 @@
+"""
+Реестр метрик сервисов для эндпоинта /metrics
+"""
+import logging
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, collector: Callable[[], Dict[str, Any]]):
+    """
+    Регистрирует функцию, возвращающую текущие метрики подсистемы
+    """
+    _sources[name] = collector
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """
+    Собирает метрики всех зарегистрированных подсистем
+    """
+    result = {}
+    for name, collector in _sources.items():
+        try:
+            result[name] = collector()
+        except Exception as e:
+            logger.error(f"Error collecting metrics for {name}: {e}")
+            result[name] = {"error": str(e)}
+    return result
@@ -0,0 +1,61 @@
+"""
+Внутрипроцессные события об изменении новостей
+
+Источник событий - сохранение новостей парсером (save_news_items) и другие
+операции, меняющие набор новостей. Подписчики: кэши, публикация, рассылки.
+"""
+import logging
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Сохранены новые новости; payload - список словарей с полями новости
+NEWS_SAVED = "news_saved"
+# Удалены новости; payload - список ID
+NEWS_DELETED = "news_deleted"
+# Новости восстановлены из архива; payload - список ID (рассылки и публикация их не трогают)
+NEWS_RESTORED = "news_restored"
+
+_listeners: Dict[str, List[Callable[[Any], None]]] = {}
+
+
+def subscribe(event: str, listener: Callable[[Any], None]):
+    """
+    Подписывает обработчик на событие
+    Обработчики вызываются синхронно в потоке, который зафиксировал изменения,
+    поэтому они должны быть быстрыми (тяжелую работу - в свои очереди/задачи)
+    """
+    _listeners.setdefault(event, []).append(listener)
+
+
+def emit(event: str, payload: Any):
+    """
+    Оповещает подписчиков о событии; ошибки обработчиков не мешают остальным
+    """
+    for listener in _listeners.get(event, []):
+        try:
+            listener(payload)
+        except Exception as e:
+            logger.error(f"Error in {event} listener {getattr(listener, '__name__', listener)}: {e}")
+
+
+def news_payload(news_item) -> Dict[str, Any]:
+    """
+    Снимок полей новости для передачи подписчикам (не зависит от сессии БД)
+    """
+    return {
+        'id': news_item.id,
+        'source_id': news_item.source_id,
+        'title': news_item.title,
+        'summary': news_item.summary,
+        'link': news_item.link,
+        'category': news_item.category,
+        'publish_date': news_item.publish_date,
+        'media': news_item.media,
+        'image_url': news_item.image_url,
+        'video_url': news_item.video_url,
+        'reading_time': news_item.reading_time,
+        'author': news_item.author,
+        'views_count': news_item.views_count,
+        'publishable': news_item.post_render_error is None,
+    }
@@ -0,0 +1,331 @@
+"""
+Поток новых новостей для мини-приложения (SSE и WebSocket)
+
+Вместо опроса /api/news/ клиент держит соединение и получает компактные
+события о новых новостях своих категорий сразу после коммита сбора. События
+этого процесса приходят по NEWS_SAVED без запросов к базе; о новостях из
+других процессов сообщает NOTIFY (PostgreSQL), после которого воркер одним
+запросом дочитывает новости - один запрос на воркер, а не на соединение.
+ID выдаются до коммита, и новость другого воркера может зафиксироваться
+позже новости с большим ID, поэтому дочитывание начинается на
+STREAM_CATCHUP_WINDOW ID ниже последнего отправленного, а уже отправленные
+отсеиваются по истории.
+
+ID события - ID новости. Клиент, переподключившийся с Last-Event-ID, получает
+пропущенное из истории последних STREAM_HISTORY_SIZE событий, а если история
+не покрывает разрыв - из базы; если пропущено больше истории, приходит
+событие reset (перезагрузить ленту целиком). У каждого соединения очередь на
+STREAM_BUFFER_SIZE событий: медленный клиент, не успевающий ее разбирать,
+отключается и продолжает с Last-Event-ID. Простаивающее соединение - одна
+ожидающая корутина и пустая очередь без своих таймеров: пинг раз в
+STREAM_HEARTBEAT секунд всем простаивающим рассылает одна общая задача.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional, Union
+
+from sqlalchemy import func, select
+
+import db
+from config import (
+    STREAM_HEARTBEAT, STREAM_BUFFER_SIZE, STREAM_HISTORY_SIZE, STREAM_MAX_CONNECTIONS, STREAM_CATCHUP_WINDOW
+)
+from db import NewsItem
+from services import news_events, pg_notify
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Маркеры в потоке событий соединения
+HEARTBEAT = "heartbeat"
+RESET = "reset"
+
+
+class StreamEvent:
+    """Новость в потоке: JSON собирается один раз и отправляется всем соединениям"""
+
+    __slots__ = ("id", "category", "data")
+
+    def __init__(self, item: Dict[str, Any]):
+        self.id = item['id']
+        self.category = item['category']
+        publish_date = item['publish_date']
+        self.data = json.dumps({
+            'id': item['id'],
+            'title': item['title'],
+            'category': item['category'],
+            'link': item['link'],
+            'publish_date': publish_date.isoformat() if publish_date else None,
+            'source_id': item['source_id'],
+            'image_url': item['image_url'],
+        }, ensure_ascii=False)
+
+
+class Subscriber:
+    """Соединение: категории подписки и очередь неотправленных событий"""
+
+    __slots__ = ("categories", "queue", "overflowed")
+
+    def __init__(self, categories: FrozenSet[str], buffer_size: int):
+        self.categories = categories
+        self.queue: asyncio.Queue = asyncio.Queue(buffer_size)
+        self.overflowed = False
+
+    def matches(self, event: StreamEvent) -> bool:
+        return not self.categories or event.category in self.categories
+
+
+def parse_categories(value: Optional[str]) -> FrozenSet[str]:
+    """Категории через запятую; пусто или all - все"""
+    categories = {category.strip() for category in (value or "").split(",") if category.strip()}
+    return frozenset() if "all" in categories else frozenset(categories)
+
+
+class NewsStream:
+    """Рассылка событий о новых новостях по открытым соединениям воркера"""
+
+    def __init__(
+        self,
+        heartbeat: int = STREAM_HEARTBEAT,
+        buffer_size: int = STREAM_BUFFER_SIZE,
+        history_size: int = STREAM_HISTORY_SIZE,
+        max_connections: int = STREAM_MAX_CONNECTIONS,
+        catchup_window: int = STREAM_CATCHUP_WINDOW
+    ):
+        self.heartbeat = heartbeat
+        # Окно уже, чем история: иначе отправленные новости из окна не отсеять, а пакет дочитывания не продвинется
+        self.catchup_window = max(0, min(catchup_window, history_size - 1))
+        self.buffer_size = buffer_size
+        self.max_connections = max_connections
+        self.subscribers: set = set()
+
+        self.history: deque = deque(maxlen=history_size)
+        self._history_ids: set = set()
+        # Все новости с ID больше floor есть в истории
+        self._floor = 0
+        self.last_id = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._fetching = False
+        self._fetch_again = False
+
+        self.connections = 0
+        self.rejected = 0
+        self.events = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.replays = 0
+        self.db_replays = 0
+        self.resets = 0
+        self.late_events = 0
+
+    async def start(self):
+        """Запоминает последний ID новости и начинает принимать события"""
+        self._loop = asyncio.get_running_loop()
+        async with db.AsyncSessionLocal() as session:
+            self.last_id = self._floor = (await session.execute(select(func.max(NewsItem.id)))).scalar() or 0
+        pg_notify.feed_listener.start()
+        self._heartbeat_task = asyncio.create_task(self._send_heartbeats())
+
+    async def _send_heartbeats(self):
+        """Пинг соединениям, которым за интервал нечего было отправить"""
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscriber in self.subscribers:
+                if subscriber.queue.empty():
+                    subscriber.queue.put_nowait(HEARTBEAT)
+
+    def close(self):
+        """Завершает все соединения (остановка приложения)"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+
+    # --- Источники событий ---
+
+    def handle_news_saved(self, items: List[Dict[str, Any]]):
+        """Обработчик NEWS_SAVED (вызывается в потоке сбора)"""
+        if self._loop:
+            events = [StreamEvent(item) for item in items]
+            self._loop.call_soon_threadsafe(self.publish, events)
+
+    def handle_notification(self, payload: str):
+        # Свои новости уже пришли по NEWS_SAVED
+        if self._loop and payload != str(os.getpid()):
+            self._loop.call_soon_threadsafe(self._schedule_fetch)
+
+    def _schedule_fetch(self):
+        if self._fetching:
+            self._fetch_again = True
+            return
+        self._fetching = True
+        asyncio.ensure_future(self._fetch_new())
+
+    async def _fetch_new(self):
+        """Дочитывает новости других процессов (с окном ниже последнего отправленного ID)"""
+        try:
+            while True:
+                self._fetch_again = False
+                # Ниже _floor истории нет - там уже отправленное не отличить от нового
+                after_id = max(self.last_id - self.catchup_window, self._floor)
+                events = await self._load(after_id, frozenset(), self.history.maxlen)
+                self.late_events += sum(
+                    1 for event in events if event.id < self.last_id and event.id not in self._history_ids
+                )
+                self.publish(events)
+                if not self._fetch_again and len(events) < self.history.maxlen:
+                    break
+        except Exception as e:
+            logger.error(f"Error loading new news for stream: {e}")
+        finally:
+            self._fetching = False
+
+    async def _load(self, after_id: int, categories: FrozenSet[str], limit: int) -> List[StreamEvent]:
+        query = select(
+            NewsItem.id, NewsItem.title, NewsItem.category, NewsItem.link,
+            NewsItem.publish_date, NewsItem.source_id, NewsItem.image_url
+        ).where(NewsItem.id > after_id)
+        if categories:
+            query = query.where(NewsItem.category.in_(categories))
+        async with db.AsyncSessionLocal() as session:
+            rows = (await session.execute(query.order_by(NewsItem.id).limit(limit))).mappings().all()
+        return [StreamEvent(row) for row in rows]
+
+    def publish(self, events: List[StreamEvent]):
+        """Рассылает события подписчикам (в event loop)"""
+        for event in sorted(events, key=lambda event: event.id):
+            if event.id in self._history_ids:
+                continue
+            if len(self.history) == self.history.maxlen:
+                evicted = self.history.popleft()
+                self._history_ids.discard(evicted.id)
+                self._floor = max(self._floor, evicted.id)
+            self.history.append(event)
+            self._history_ids.add(event.id)
+            self.last_id = max(self.last_id, event.id)
+            self.events += 1
+
+            for subscriber in self.subscribers:
+                if subscriber.overflowed or not subscriber.matches(event):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Клиент не успевает - отключаем, он продолжит с Last-Event-ID
+                    subscriber.overflowed = True
+                    self.overflows += 1
+
+    # --- Соединения ---
+
+    def connect(self, categories: FrozenSet[str]) -> Optional[Subscriber]:
+        """Регистрирует соединение (None - достигнут STREAM_MAX_CONNECTIONS)"""
+        if len(self.subscribers) >= self.max_connections:
+            self.rejected += 1
+            return None
+        subscriber = Subscriber(categories, self.buffer_size)
+        self.subscribers.add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def disconnect(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def _replay(self, subscriber: Subscriber, last_event_id: int) -> Optional[List[StreamEvent]]:
+        """Пропущенные после last_event_id события (None - пропущено больше истории)"""
+        self.replays += 1
+        if last_event_id >= self._floor:
+            return [event for event in self.history if event.id > last_event_id and subscriber.matches(event)]
+
+        self.db_replays += 1
+        limit = self.history.maxlen
+        events = await self._load(last_event_id, subscriber.categories, limit + 1)
+        return events if len(events) <= limit else None
+
+    async def iterate(
+        self, subscriber: Subscriber, last_event_id: Optional[int] = None
+    ) -> AsyncIterator[Union[StreamEvent, str]]:
+        """
+        События соединения: StreamEvent, HEARTBEAT при простое или RESET (после него поток завершается).
+        Поток заканчивается при переполнении очереди и при остановке приложения
+        """
+        try:
+            sent_id = 0
+            if last_event_id is not None:
+                missed = await self._replay(subscriber, last_event_id)
+                if missed is None:
+                    self.resets += 1
+                    yield RESET
+                    return
+                for event in missed:
+                    yield event
+                    sent_id = event.id
+                self.delivered += len(missed)
+
+            while not subscriber.overflowed:
+                event = await subscriber.queue.get()
+                if event is None:
+                    return
+                if event is HEARTBEAT:
+                    yield HEARTBEAT
+                    continue
+                # Уже отправлено при продолжении с Last-Event-ID
+                if event.id <= sent_id:
+                    continue
+                yield event
+                self.delivered += 1
+        finally:
+            self.disconnect(subscriber)
+
+    async def sse(self, subscriber: Subscriber, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """Поток в формате text/event-stream"""
+        # Пауза перед переподключением EventSource (мс)
+        yield f"retry: {self.heartbeat * 1000}\n\n"
+        async for event in self.iterate(subscriber, last_event_id):
+            if event is HEARTBEAT:
+                yield ": ping\n\n"
+            elif event is RESET:
+                yield "event: reset\ndata: {}\n\n"
+            else:
+                yield f"id: {event.id}\nevent: news\ndata: {event.data}\n\n"
+
+    async def messages(self, subscriber: Subscriber, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """Поток JSON-сообщений для WebSocket"""
+        async for event in self.iterate(subscriber, last_event_id):
+            if event is HEARTBEAT:
+                yield '{"type":"ping"}'
+            elif event is RESET:
+                yield '{"type":"reset"}'
+            else:
+                yield f'{{"type":"news","id":{event.id},"item":{event.data}}}'
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.subscribers),
+            "connections_total": self.connections,
+            "rejected": self.rejected,
+            "last_id": self.last_id,
+            "history": len(self.history),
+            "events": self.events,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "replays": self.replays,
+            "db_replays": self.db_replays,
+            "resets": self.resets,
+            "late_events": self.late_events,
+            "listening": pg_notify.feed_listener.connected
+        }
+
+
+# Глобальный экземпляр
+news_stream = NewsStream()
+news_events.subscribe(news_events.NEWS_SAVED, news_stream.handle_news_saved)
+pg_notify.feed_listener.add_callback(news_stream.handle_notification)
+register_metrics("news_stream", news_stream.get_stats)
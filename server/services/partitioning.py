@@ -0,0 +1,411 @@
+"""
+Помесячное секционирование news_items на PostgreSQL
+
+Лента и публикация выбирают новости по publish_date и читают в основном
+последние месяцы, поэтому news_items можно разбить на секции по месяцам
+(news_items_pГГГГ_ММ). Запросы с ORDER BY publish_date DESC LIMIT читают секции
+по порядку (ordered Append по индексу ix_news_items_publish_date, который есть
+у каждой секции) и останавливаются на первых одной-двух. Секции по
+умолчанию (DEFAULT) нет намеренно: она отключает такой порядок чтения.
+
+Вместо нее недостающие секции создаются заранее (PARTITION_PREMAKE_MONTHS
+вперед, фоновая задача) и перед вставкой новости с датой вне имеющихся секций
+(событие before_insert модели и restore в retention), так что для ORM
+секционирование прозрачно. Секции старше PARTITION_RETAIN_MONTHS отключаются:
+detach - остаются отдельной таблицей, тексты новостей переносятся в
+<секция>_bodies (можно вернуть ATTACH PARTITION и INSERT в news_bodies), archive -
+новости уходят в ARCHIVE_DIR через retention, пустая секция удаляется.
+
+Перевод таблицы в секционированную и обратно - scripts/partitions.py (или
+миграция 009 при PARTITIONING_ENABLED): копирование пакетами по ID без
+блокировки, затем короткая блокировка для досинхронизации и переименования.
+На SQLite таблица всегда одна, все функции ничего не делают.
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, text, Index
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.engine import Connection, Engine
+
+import db
+from config import (
+    PARTITIONING_ENABLED, PARTITION_PREMAKE_MONTHS, PARTITION_RETAIN_MONTHS,
+    PARTITION_EXPIRED_ACTION, PARTITION_MAINTENANCE_INTERVAL
+)
+from db import NewsItem
+from services import changes
+from services.metrics import register_metrics
+from services.schema_migrations import Operation, key_ranges
+
+logger = logging.getLogger(__name__)
+
+TABLE = NewsItem.__tablename__
+PARTITION_PREFIX = f"{TABLE}_p"
+COPY_BATCH_SIZE = 5000
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(connection: Connection, parent: str = TABLE) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Секции таблицы: (имя, начало, конец) по возрастанию начала
+    """
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:parent)"
+    ), {"parent": parent}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_PATTERN.search(bound or "")
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(connection: Connection, month: datetime, parent: str = TABLE):
+    upper = add_months(month, 1)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+    ))
+
+
+class PartitionManager:
+    """Создание будущих секций и отключение устаревших"""
+
+    def __init__(
+        self,
+        premake_months: int = PARTITION_PREMAKE_MONTHS,
+        retain_months: int = PARTITION_RETAIN_MONTHS,
+        expired_action: str = PARTITION_EXPIRED_ACTION
+    ):
+        self.premake_months = premake_months
+        self.retain_months = retain_months
+        self.expired_action = expired_action
+
+        self._partitioned: Optional[bool] = None
+        # Месяцы, секции которых точно есть (проверка перед вставкой без запроса к каталогу)
+        self._months: Set[datetime] = set()
+
+        self.created = 0
+        self.detached = 0
+        self.last_run: Dict[str, Any] = {}
+
+    def refresh(self, connection: Connection) -> bool:
+        self._partitioned = is_partitioned(connection)
+        self._months = {lower for _, lower, _ in list_partitions(connection)} if self._partitioned else set()
+        return self._partitioned
+
+    def active(self, connection: Connection) -> bool:
+        if connection.dialect.name != "postgresql":
+            return False
+        if self._partitioned is None:
+            self.refresh(connection)
+        return self._partitioned
+
+    def ensure_months(self, connection: Connection, months: Iterable[datetime]) -> List[datetime]:
+        """
+        Создает недостающие секции для месяцев (в транзакции connection)
+        Возвращает созданные месяцы
+        """
+        if not self.active(connection):
+            return []
+
+        created = []
+        for month in sorted(set(months) - self._months):
+            exists = connection.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(month)}).scalar()
+            if exists is None:
+                create_partition(connection, month)
+                created.append(month)
+                # В кэш не добавляем: транзакция вставки еще может откатиться вместе с секцией
+            else:
+                self._months.add(month)
+
+        if created:
+            self.created += len(created)
+            logger.info(f"Created partitions {[partition_name(month) for month in created]}")
+        return created
+
+    # --- Обслуживание ---
+
+    def maintain(self, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+        """
+        Создает секции на PARTITION_PREMAKE_MONTHS вперед и отключает секции старше PARTITION_RETAIN_MONTHS
+        """
+        now = now or datetime.utcnow()
+        current = month_start(now)
+        report = {"created": [], "detached": []}
+
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            if not self.refresh(connection):
+                return report
+
+            months = [add_months(current, offset) for offset in range(self.premake_months + 1)]
+            report["created"] = [partition_name(month) for month in self.ensure_months(connection, months)]
+
+            if self.retain_months > 0:
+                cutoff = add_months(current, -self.retain_months)
+                for name, lower, upper in list_partitions(connection):
+                    if upper <= cutoff:
+                        self._detach(connection, name, upper, now)
+                        self._months.discard(lower)
+                        report["detached"].append(name)
+                if report["detached"]:
+                    changes.purge_tombstones(connection, now)
+
+        self.detached += len(report["detached"])
+        self.last_run = {"finished_at": datetime.utcnow().isoformat(), **report}
+        if report["created"] or report["detached"]:
+            logger.info(f"Partition maintenance: {report}")
+        return report
+
+    def _detach(self, connection: Connection, name: str, upper: datetime, now: datetime):
+        archive = self.expired_action == "archive"
+        if archive:
+            # Новости (с текстами из news_bodies) уходят в архив и удаляются - секция пустеет
+            from services.retention import retention_manager
+            retention_manager.archive_older_than(upper, now)
+
+        # CONCURRENTLY (PostgreSQL 14+) не блокирует чтение и запись в news_items
+        concurrently = " CONCURRENTLY" if connection.dialect.server_version_info >= (14,) else ""
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}{concurrently}"))
+        if archive:
+            connection.execute(text(f"DROP TABLE {name}"))
+        else:
+            # Для клиентов /api/news/changes новости отключенной секции удалены
+            connection.execute(
+                text(f"INSERT INTO news_tombstones (news_id, category, deleted_at) SELECT id, category, :now FROM {name}"),
+                {"now": now}
+            )
+            # Внешнего ключа news_bodies -> news_items у секционированной таблицы нет:
+            # тексты уходят вместе с секцией в {name}_bodies (сначала копия, потом удаление)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name}_bodies AS "
+                f"SELECT b.* FROM news_bodies b JOIN {name} n ON n.id = b.news_id"
+            ))
+            connection.execute(text(f"DELETE FROM news_bodies b USING {name} n WHERE n.id = b.news_id"))
+        logger.info(f"Partition {name} {'archived' if archive else 'detached'}")
+
+    async def run_periodically(self, interval: int = PARTITION_MAINTENANCE_INTERVAL):
+        """
+        Обслуживание секций раз в interval секунд (выполняется в отдельном потоке)
+        """
+        if not PARTITIONING_ENABLED or db.engine.dialect.name != "postgresql":
+            logger.info("Partitioning is disabled, not starting maintenance")
+            return
+
+        while True:
+            try:
+                await asyncio.to_thread(self.maintain)
+            except Exception as e:
+                logger.error(f"Error in partition maintenance: {e}")
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": PARTITIONING_ENABLED,
+            "partitioned": self._partitioned,
+            "known_months": len(self._months),
+            "created": self.created,
+            "detached": self.detached,
+            "last_run": self.last_run
+        }
+
+
+# --- Перевод таблицы ---
+
+def _rename_indexes(connection: Connection, source_suffix: str, target_suffix: str):
+    for index in NewsItem.__table__.indexes:
+        connection.execute(text(f"ALTER INDEX IF EXISTS {index.name}{source_suffix} RENAME TO {index.name}{target_suffix}"))
+
+
+def _index_columns(index: Index) -> str:
+    """Колонки индекса модели для CREATE INDEX, с порядком DESC"""
+    columns = []
+    for expression in index.expressions:
+        if isinstance(expression, UnaryExpression) and expression.modifier is operators.desc_op:
+            columns.append(f"{expression.element.name} DESC")
+        else:
+            columns.append(expression.name)
+    return ", ".join(columns)
+
+
+def _rebuild(engine: Engine, partitioned: bool, batch_size: int = COPY_BATCH_SIZE,
+             premake_months: int = PARTITION_PREMAKE_MONTHS):
+    """
+    Пересоздает news_items секционированной (partitioned=True) или обычной таблицей
+    1. Новая таблица {TABLE}_new той же структуры, индексы и секции на весь диапазон дат
+    2. Копирование пакетами по ID, без блокировки news_items
+    3. Под ACCESS EXCLUSIVE: повторное копирование строк, измененных или добавленных
+       за время копирования, переименование таблиц, индексов и последовательности ID
+    """
+    new, old = f"{TABLE}_new", f"{TABLE}_old"
+    now = datetime.utcnow()
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        # Остаток прерванного перевода
+        connection.execute(text(f"DROP TABLE IF EXISTS {new}"))
+
+        copy_started_at = connection.execute(text("SELECT now() AT TIME ZONE 'utc'")).scalar()
+        if partitioned:
+            connection.execute(text(
+                f"CREATE TABLE {new} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY RANGE (publish_date)"
+            ))
+            # Ключ секционирования обязан входить в первичный ключ; для ORM ключом остается id
+            connection.execute(text(f"ALTER TABLE {new} ADD PRIMARY KEY (id, publish_date)"))
+
+            first, last = connection.execute(text(f"SELECT MIN(publish_date), MAX(publish_date) FROM {TABLE}")).first()
+            month = month_start(first or now)
+            last = max(month_start(last or now), add_months(month_start(now), premake_months))
+            while month <= last:
+                create_partition(connection, month, parent=new)
+                month = add_months(month, 1)
+        else:
+            connection.execute(text(f"CREATE TABLE {new} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            connection.execute(text(f"ALTER TABLE {new} ADD PRIMARY KEY (id)"))
+
+        # Внешний ключ и индексы - пока таблица пустая
+        connection.execute(text(f"ALTER TABLE {new} ADD FOREIGN KEY (source_id) REFERENCES news_sources (id)"))
+        for index in NewsItem.__table__.indexes:
+            connection.execute(text(f"CREATE INDEX {index.name}_new ON {new} ({_index_columns(index)})"))
+
+        copied = 0
+        for start, end in key_ranges(connection, TABLE, "id", batch_size):
+            result = connection.execute(
+                text(f"INSERT INTO {new} SELECT * FROM {TABLE} WHERE id >= :start AND id < :end"),
+                {"start": start, "end": end}
+            )
+            copied += result.rowcount or 0
+        logger.info(f"Copied {copied} rows into {new}")
+
+    with engine.begin() as connection:
+        connection.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+
+        # Досинхронизация: строки, измененные или удаленные за время копирования, копируются заново
+        connection.execute(text(
+            f"DELETE FROM {new} n WHERE NOT EXISTS (SELECT 1 FROM {TABLE} o WHERE o.id = n.id) "
+            f"OR n.id IN (SELECT id FROM {TABLE} WHERE updated_at >= :since)"
+        ), {"since": copy_started_at})
+        missing = f"FROM {TABLE} o WHERE NOT EXISTS (SELECT 1 FROM {new} n WHERE n.id = o.id)"
+        if partitioned:
+            months = connection.execute(text(f"SELECT DISTINCT date_trunc('month', o.publish_date) {missing}")).scalars().all()
+            for month in months:
+                create_partition(connection, month, parent=new)
+        synced = connection.execute(text(f"INSERT INTO {new} SELECT o.* {missing}")).rowcount
+        logger.info(f"Synced {synced} rows changed during copy")
+
+        sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": TABLE}).scalar()
+        connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old}"))
+        connection.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {TABLE}_pkey TO {old}_pkey"))
+        _rename_indexes(connection, "", "_old")
+        connection.execute(text(f"ALTER TABLE {new} RENAME TO {TABLE}"))
+        connection.execute(text(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {new}_pkey TO {TABLE}_pkey"))
+        _rename_indexes(connection, "_new", "")
+        if sequence:
+            # Иначе последовательность удалится вместе со старой таблицей
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+
+        # news_bodies ссылается на старую таблицу; на секционированную сослаться нельзя
+        # (уникален только ключ (id, publish_date)), для обычной ключ восстанавливается
+        constraints = connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass('news_bodies') "
+            "AND confrelid = to_regclass(:old) AND contype = 'f'"
+        ), {"old": old}).scalars().all()
+        for name in constraints:
+            connection.execute(text(f"ALTER TABLE news_bodies DROP CONSTRAINT {name}"))
+        if not partitioned:
+            # NOT VALID: у отключенных секций могли остаться тексты без новостей
+            connection.execute(text(
+                f"ALTER TABLE news_bodies ADD FOREIGN KEY (news_id) REFERENCES {TABLE} (id) ON DELETE CASCADE NOT VALID"
+            ))
+
+        connection.execute(text(f"DROP TABLE {old}"))
+
+    partition_manager._partitioned = None
+    logger.info(f"{TABLE} is now {'partitioned by month' if partitioned else 'a single table'}")
+
+
+def partition_table(engine: Engine, batch_size: int = COPY_BATCH_SIZE) -> bool:
+    """
+    Переводит news_items в секционированную таблицу; False - уже секционирована или не PostgreSQL
+    """
+    with engine.connect() as connection:
+        if connection.dialect.name != "postgresql" or is_partitioned(connection):
+            return False
+    _rebuild(engine, partitioned=True, batch_size=batch_size)
+    return True
+
+
+def unpartition_table(engine: Engine, batch_size: int = COPY_BATCH_SIZE) -> bool:
+    """
+    Возвращает news_items в одну таблицу (отключенные секции не затрагиваются)
+    """
+    with engine.connect() as connection:
+        if not is_partitioned(connection):
+            return False
+    _rebuild(engine, partitioned=False, batch_size=batch_size)
+    return True
+
+
+class PartitionNewsItems(Operation):
+    """Шаг миграции 009 (она откладывается, пока PARTITIONING_ENABLED выключен)"""
+    transactional = False
+
+    def apply(self, connection: Connection):
+        partition_table(connection.engine)
+
+    def describe(self) -> str:
+        return f"partition {TABLE} by month"
+
+
+class UnpartitionNewsItems(Operation):
+    transactional = False
+
+    def apply(self, connection: Connection):
+        unpartition_table(connection.engine)
+
+    def describe(self) -> str:
+        return f"merge {TABLE} partitions into one table"
+
+
+@event.listens_for(NewsItem, "before_insert")
+def _ensure_partition(mapper, connection, target):
+    # Новость с датой вне имеющихся секций - секция создается в той же транзакции
+    if target.publish_date is not None and partition_manager.active(connection):
+        partition_manager.ensure_months(connection, [month_start(target.publish_date)])
+
+
+# Глобальный экземпляр
+partition_manager = PartitionManager()
+register_metrics("partitions", partition_manager.get_stats)
@@ -0,0 +1,124 @@
+"""
+Межпроцессные уведомления о новых новостях через PostgreSQL LISTEN/NOTIFY
+
+save_news_items отправляет NOTIFY в той же транзакции, что и новости, поэтому
+уведомление приходит только после коммита. Слушатель работает в отдельном
+потоке на собственном соединении (не из пула) и будит публикацию в других
+процессах. На SQLite все функции ничего не делают - хватает внутрипроцессных
+событий news_events.
+"""
+import logging
+import select
+import threading
+from typing import Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from config import PG_NOTIFY_ENABLED, DATABASE_SSL_MODE, DB_PGBOUNCER
+from db import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Канал уведомлений о сохраненных новостях, готовых к публикации
+NEWS_CHANNEL = "news_saved"
+# Канал уведомлений о любом изменении набора новостей (payload - PID отправителя)
+FEED_CHANNEL = "news_changed"
+
+# Как часто слушатель проверяет флаг остановки, секунды
+POLL_TIMEOUT = 5
+# Пауза перед переподключением после ошибки
+RECONNECT_DELAY = 30
+
+
+def is_postgres() -> bool:
+    return make_url(DATABASE_URL).get_backend_name() == "postgresql"
+
+
+def is_available() -> bool:
+    # LISTEN держит серверное соединение, PgBouncer в режиме transaction его не сохраняет
+    return PG_NOTIFY_ENABLED and is_postgres() and not DB_PGBOUNCER
+
+
+def notify(db, channel: str = NEWS_CHANNEL, payload: str = ""):
+    """
+    Ставит NOTIFY в текущую транзакцию сессии (доставляется при коммите)
+    """
+    if not is_available():
+        return
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+class PgListener:
+    """Поток, слушающий канал NOTIFY и вызывающий callback-и на каждое уведомление"""
+
+    def __init__(self, callback: Optional[Callable[[str], None]] = None, channel: str = NEWS_CHANNEL):
+        self.callbacks: List[Callable[[str], None]] = [callback] if callback else []
+        self.channel = channel
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.connected = False
+        self.notifications = 0
+
+    def start(self) -> bool:
+        """
+        Запускает слушатель; возвращает False, если LISTEN/NOTIFY недоступен
+        """
+        if not is_available():
+            return False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"pg-listen-{self.channel}", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def add_callback(self, callback: Callable[[str], None]):
+        self.callbacks.append(callback)
+
+    def _connect(self):
+        import psycopg2
+
+        url = make_url(DATABASE_URL).set(drivername="postgresql")
+        connection = psycopg2.connect(url.render_as_string(hide_password=False), sslmode=DATABASE_SSL_MODE)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return connection
+
+    def _run(self):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                self.connected = True
+                logger.info(f"Listening for PostgreSQL notifications on {self.channel}")
+
+                while not self._stopped.is_set():
+                    if select.select([connection], [], [], POLL_TIMEOUT) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.notifications += 1
+                        for callback in self.callbacks:
+                            try:
+                                callback(notification.payload)
+                            except Exception as e:
+                                logger.error(f"Error in {self.channel} notification callback: {e}")
+            except Exception as e:
+                logger.error(f"PostgreSQL listener on {self.channel} failed: {e}")
+                self._stopped.wait(RECONNECT_DELAY)
+            finally:
+                self.connected = False
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+# Общий слушатель изменений набора новостей (последние новости, поток новостей);
+# запускают подписчики, start можно вызывать повторно
+feed_listener = PgListener(channel=FEED_CHANNEL)
@@ -0,0 +1,171 @@
+"""
+Рендеринг текста поста для Telegram канала
+
+Текст поста рендерится один раз, когда новость становится доступной для
+публикации, и хранится в news_items.post_text. Публикатор отправляет готовый
+текст, а новости, которые невозможно уложить в лимит, отбраковываются до
+обращения к Bot API.
+"""
+import html
+import json
+import logging
+from typing import Any, Dict, List
+
+from config import POST_SIGNATURE, SOURCE_LINK_TEXT
+
+logger = logging.getLogger(__name__)
+
+# Лимиты длины текста сообщения и подписи к медиа
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+# Сколько символов описания попадает в пост
+DESCRIPTION_LENGTH = 300
+# Короче этого заголовок не обрезаем - такая новость отбраковывается
+MIN_TITLE_LENGTH = 20
+
+CATEGORY_EMOJI = {
+    'gifts': '🎁',
+    'crypto': '💰',
+    'nft': '🖼️',
+    'tech': '💻',
+    'community': '👥',
+    'general': '📢'
+}
+
+
+class PostRenderError(Exception):
+    """Новость невозможно отрендерить в допустимый пост"""
+
+
+def get_media_list(news_item) -> List[Dict[str, Any]]:
+    """
+    Извлекает все медиа новости (фото и видео) в исходном порядке
+    """
+    media_list = []
+
+    # Приоритет: media JSON > image_url > video_url
+    if news_item.media:
+        try:
+            if isinstance(news_item.media, str):
+                media_data = json.loads(news_item.media)
+            else:
+                media_data = news_item.media
+
+            # Одиночный объект оборачиваем в список
+            if isinstance(media_data, dict):
+                media_data = [media_data]
+
+            seen_urls = set()
+            for media in media_data or []:
+                if not isinstance(media, dict):
+                    continue
+                media_type = media.get('type')
+                url = media.get('url')
+                if media_type in ('photo', 'video') and url and url not in seen_urls:
+                    seen_urls.add(url)
+                    media_list.append({'type': media_type, 'url': url})
+        except Exception as e:
+            logger.warning(f"Error parsing media for news {news_item.id}: {e}")
+
+    if media_list:
+        return media_list
+
+    # Fallback к image_url или video_url
+    if news_item.image_url:
+        return [{'type': 'photo', 'url': news_item.image_url}]
+    elif news_item.video_url:
+        return [{'type': 'video', 'url': news_item.video_url}]
+
+    return []
+
+
+def _shorten(text: str, length: int) -> str:
+    if len(text) <= length:
+        return text
+    return text[:max(0, length - 3)].rstrip() + "..."
+
+
+def _fit_escaped(text: str, budget: int) -> str:
+    """
+    Самый длинный префикс текста (с "..." при обрезке), длина которого после экранирования <= budget
+    """
+    if len(html.escape(text)) <= budget:
+        return text
+
+    length = 0
+    for index, char in enumerate(text):
+        length += len(html.escape(char))
+        if length > budget - 3:
+            prefix = text[:index].rstrip()
+            return prefix + "..." if prefix else ""
+    return text
+
+
+def _compose(news_item, title: str, description: str) -> str:
+    content_parts = []
+
+    # Заголовок
+    content_parts.append(f"📰 <b>{html.escape(title)}</b>")
+    content_parts.append("")
+
+    # Краткое описание
+    if description:
+        content_parts.append(html.escape(description))
+        content_parts.append("")
+
+    # Категория
+    emoji = CATEGORY_EMOJI.get(news_item.category, '📢')
+    content_parts.append(f"{emoji} Категория: {html.escape(news_item.category or 'general')}")
+
+    # Автор/источник
+    if news_item.author:
+        content_parts.append(f"👤 Автор: {html.escape(news_item.author)}")
+
+    # Время чтения
+    if news_item.reading_time:
+        content_parts.append(f"⏱️ Время чтения: {news_item.reading_time} мин")
+
+    content_parts.append("")
+
+    # Подпись и ссылка на источник
+    content_parts.append("---")
+    content_parts.append(html.escape(POST_SIGNATURE))
+    content_parts.append("")
+    content_parts.append(
+        f"<a href=\"{html.escape(news_item.link, quote=True)}\">{html.escape(SOURCE_LINK_TEXT)}</a>"
+    )
+
+    return "\n".join(content_parts)
+
+
+def render_post(news_item) -> str:
+    """
+    Рендерит HTML-текст поста, укладывая его в лимит подписи (если у новости есть медиа)
+    или сообщения. Длина считается по готовому HTML - видимый текст всегда не длиннее.
+    Сначала сокращается описание, затем заголовок; если заголовок пришлось бы обрезать
+    короче MIN_TITLE_LENGTH - PostRenderError.
+    """
+    title = (news_item.title or "").strip()
+    if not title:
+        raise PostRenderError("empty title")
+    if not news_item.link:
+        raise PostRenderError("empty link")
+
+    limit = CAPTION_LIMIT if get_media_list(news_item) else MESSAGE_LIMIT
+    description = _shorten((news_item.content or "").strip(), DESCRIPTION_LENGTH)
+
+    text = _compose(news_item, title, description)
+    if len(text) > limit and description:
+        budget = len(html.escape(description)) - (len(text) - limit)
+        description = _fit_escaped(description, budget)
+        text = _compose(news_item, title, description)
+
+    if len(text) > limit:
+        budget = len(html.escape(title)) - (len(text) - limit)
+        if budget < MIN_TITLE_LENGTH:
+            raise PostRenderError(f"post exceeds {limit} characters")
+        title = _fit_escaped(title, budget)
+        text = _compose(news_item, title, description)
+
+    return text
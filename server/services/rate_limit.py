@@ -0,0 +1,57 @@
+"""
+Ограничение частоты запросов к Telegram Bot API
+
+Bucket с ключом при общем кэше (CACHE_BACKEND=redis) хранится в Redis, и лимит
+действует на все воркеры вместе; без ключа или с кэшем в памяти - на процесс.
+"""
+import asyncio
+import time
+from typing import Optional
+
+from services.cache import cache
+
+
+class TokenBucket:
+    """Асинхронный token bucket: rate токенов в секунду, не больше capacity накопленных"""
+    
+    def __init__(self, rate: float, capacity: float = None, key: Optional[str] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.key = key
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    async def acquire(self, tokens: float = 1):
+        """
+        Ждет, пока накопится нужное количество токенов (rate <= 0 - без ограничения)
+        """
+        if self.rate <= 0:
+            return
+        
+        async with self._lock:
+            if self.key and cache.shared:
+                # Общий bucket: ждем, пока токены освободятся у всех процессов
+                while (wait := await cache.atake_tokens(self.key, self.rate, self.capacity, tokens)) > 0:
+                    await asyncio.sleep(wait)
+                return
+
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+    
+    async def pause(self, seconds: float):
+        """
+        Приостанавливает выдачу токенов (ответ 429 с retry_after)
+        """
+        async with self._lock:
+            await asyncio.sleep(seconds)
+            self._tokens = 0
+            self._updated_at = time.monotonic()
@@ -0,0 +1,194 @@
+"""
+Чтение с реплик PostgreSQL
+
+Запись (сбор новостей, счетчик просмотров, публикация) идет в основную базу,
+а маршруты только на чтение - лента, категории, статистика, сводки бота - могут
+читать с реплик из DATABASE_READ_URL (несколько URL через запятую). Реплики
+выбираются по кругу среди исправных.
+
+Фоновая задача раз в READ_REPLICA_CHECK_INTERVAL секунд проверяет каждую
+реплику: доступна ли она и насколько отстает воспроизведение WAL. Реплика с
+ошибкой или отставанием больше READ_REPLICA_MAX_LAG исключается до следующей
+успешной проверки; если исправных нет (или проверок еще не было), чтение идет
+с основной базы. Отставание считается нулевым, когда реплика воспроизвела все
+полученное (основная база простаивает) или сервер не в режиме восстановления -
+так в качестве "реплики" можно указать вторую копию базы, в том числе SQLite.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import db
+from config import DATABASE_READ_URL, READ_REPLICA_MAX_LAG, READ_REPLICA_CHECK_INTERVAL
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики в секундах: время с последней воспроизведенной транзакции,
+# если получено больше, чем воспроизведено
+LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() IS NOT DISTINCT FROM pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_urls(value: str = DATABASE_READ_URL) -> List[str]:
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+class Replica:
+    """Реплика: синхронный и асинхронный движки и результат последней проверки"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.name = make_url(url).render_as_string(hide_password=True)
+        # Как и у основной базы, движки создаются при первом обращении в каждом процессе
+        self.engine = db.LazyEngine(lambda: db.build_engine(url))
+        self.async_engine = db.LazyEngine(lambda: db.build_async_engine(url))
+        self.session_factory = db.LazySessionmaker(self.engine, autocommit=False, autoflush=False)
+        self.async_session_factory = db.LazyAsyncSessionmaker(self.async_engine, expire_on_commit=False, autoflush=False)
+
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[datetime] = None
+        self.sessions = 0
+
+    def check(self, max_lag: float) -> bool:
+        try:
+            with self.engine.get().connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    self.lag = float(connection.execute(LAG_SQL).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            self.last_error = None if self.lag <= max_lag else f"lag {self.lag:.1f}s > {max_lag:g}s"
+        except Exception as e:
+            self.lag = None
+            self.last_error = str(e).splitlines()[0] if str(e) else type(e).__name__
+
+        was_healthy = self.healthy if self.checked_at else None
+        self.healthy = self.last_error is None
+        self.checked_at = datetime.utcnow()
+        if was_healthy is not self.healthy:
+            if self.healthy:
+                logger.info(f"Read replica {self.name} is in use (lag {self.lag:.1f}s)")
+            else:
+                logger.warning(f"Read replica {self.name} excluded: {self.last_error}")
+        return self.healthy
+
+
+class ReplicaRouter:
+    """Выбор сессии для чтения: исправная реплика по кругу или основная база"""
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        max_lag: float = READ_REPLICA_MAX_LAG,
+        check_interval: int = READ_REPLICA_CHECK_INTERVAL
+    ):
+        self.replicas = [Replica(url) for url in (replica_urls() if urls is None else urls)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+
+        self.checks = 0
+        self.primary_sessions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self) -> Optional[Replica]:
+        """Следующая исправная реплика по кругу (None - читать с основной базы)"""
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.healthy:
+                    replica.sessions += 1
+                    return replica
+            self.primary_sessions += 1
+            return None
+
+    def session(self) -> Session:
+        replica = self.pick()
+        return replica.session_factory() if replica else db.SessionLocal()
+
+    def async_session(self) -> AsyncSession:
+        replica = self.pick()
+        return replica.async_session_factory() if replica else db.AsyncSessionLocal()
+
+    def check(self) -> int:
+        """Проверяет все реплики, возвращает количество исправных"""
+        healthy = sum(replica.check(self.max_lag) for replica in self.replicas)
+        self.checks += 1
+        return healthy
+
+    async def run_periodically(self):
+        """
+        Проверка реплик раз в check_interval секунд (выполняется в отдельном потоке)
+        """
+        if not self.enabled:
+            logger.info("No read replicas configured, reading from primary")
+            return
+
+        logger.info(f"Starting read replica checks for {len(self.replicas)} replicas (max lag {self.max_lag:g}s)")
+        while True:
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logger.error(f"Error checking read replicas: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            if replica.async_engine.created:
+                await replica.async_engine.get().dispose()
+            if replica.engine.created:
+                replica.engine.get().dispose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_lag": self.max_lag,
+            "checks": self.checks,
+            "primary_sessions": self.primary_sessions,
+            "replicas": [
+                {
+                    "url": replica.name,
+                    "healthy": replica.healthy,
+                    "lag": replica.lag,
+                    "last_error": replica.last_error,
+                    "checked_at": replica.checked_at.isoformat() if replica.checked_at else None,
+                    "sessions": replica.sessions,
+                    "pool": {"sync": db.pool_stats(replica.engine), "async": db.pool_stats(replica.async_engine)}
+                }
+                for replica in self.replicas
+            ]
+        }
+
+
+# Глобальный экземпляр
+read_router = ReplicaRouter()
+register_metrics("read_replicas", read_router.get_stats)
+
+
+async def get_read_db() -> AsyncSession:
+    """Асинхронная сессия для маршрутов только на чтение (реплика или основная база)"""
+    async with read_router.async_session() as session:
+        yield session
+
+
+def get_read_db_session() -> Session:
+    """Синхронная сессия только на чтение (сводки бота)"""
+    return read_router.session()
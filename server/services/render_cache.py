@@ -0,0 +1,70 @@
+"""
+Кэш готовых текстов ответов бота (/news, /nft, /crypto, /stats)
+
+Ключ - (команда, категория, лимит). Тексты хранятся в общем кэше (services.cache)
+с тегом новостей и сбрасываются при сохранении или удалении новостей, поэтому
+всплеск одинаковых команд стоит одного запроса к базе на каждое изменение ленты,
+а с CACHE_BACKEND=redis - одного на все воркеры.
+"""
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config import RENDER_CACHE_TTL
+from services.cache import cache, CacheBackend, NEWS_TAG
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """Кэш отрендеренных текстов с защитой от параллельного рендеринга"""
+
+    def __init__(self, ttl: int = RENDER_CACHE_TTL, backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.backend = backend or cache
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return "render:" + ":".join("" if part is None else str(part) for part in parts)
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> str:
+        """
+        Возвращает текст из кэша или рендерит его (один раз на ключ, даже при параллельных запросах)
+        Исключения render не кэшируются и пробрасываются вызывающему
+        """
+        rendered = False
+
+        def compute() -> str:
+            nonlocal rendered
+            rendered = True
+            return render()
+
+        text = self.backend.get_or_set(self._key(key), compute, self.ttl, tags=(NEWS_TAG,))
+        if rendered:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def invalidate(self, *_):
+        """
+        Сбрасывает все записи (вместе с остальными записями, зависящими от новостей)
+        """
+        self.backend.invalidate_tags(NEWS_TAG)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_seconds": self.ttl
+        }
+
+
+# Глобальный экземпляр кэша (сброс по событиям новостей - в services.cache)
+render_cache = RenderCache()
+register_metrics("render_cache", render_cache.get_stats)
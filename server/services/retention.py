@@ -0,0 +1,353 @@
+"""
+Хранение и архивация старых новостей
+
+Новости старше срока хранения своей категории выгружаются пакетами в сжатые
+файлы JSONL (ARCHIVE_DIR/news_<категория>_<время запуска>.jsonl.gz) и только
+после записи пакета удаляются из базы тем же пакетом. Поэтому сбой посреди
+архивации не теряет данных: новость остается либо в базе, либо в архиве (в
+худшем случае и там, и там - восстановление пропускает существующие ID).
+
+Восстановление возвращает в таблицу новости из архивов с фильтром по категории
+и периоду публикации. Срок хранения при этом не меняется: чтобы восстановленные
+новости не ушли в архив снова, увеличьте RETENTION_CATEGORY_DAYS для категории.
+"""
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import DateTime, delete, insert, select
+
+from config import (
+    RETENTION_ENABLED, RETENTION_DAYS, RETENTION_CATEGORY_DAYS,
+    RETENTION_INTERVAL, RETENTION_BATCH_SIZE, ARCHIVE_DIR, CHANGES_TOMBSTONE_DAYS
+)
+from db import get_db_session, NewsItem, NewsBody, NewsSource, make_summary, write_legacy_bodies
+from services import changes, news_events, pg_notify
+from services.partitioning import partition_manager, month_start
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+news_table = NewsItem.__table__
+bodies_table = NewsBody.__table__
+# Текст новости хранится в news_bodies, в архиве - в той же записи, что и новость
+_BODY_COLUMNS = ('content', 'content_html')
+_DATETIME_COLUMNS = {column.name for column in news_table.columns if isinstance(column.type, DateTime)}
+
+
+def category_ttls() -> Dict[str, int]:
+    """
+    Сроки хранения по категориям в днях (RETENTION_CATEGORY_DAYS поверх RETENTION_DAYS)
+    """
+    if not RETENTION_CATEGORY_DAYS:
+        return {}
+    try:
+        return {category: int(days) for category, days in json.loads(RETENTION_CATEGORY_DAYS).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Invalid RETENTION_CATEGORY_DAYS, using RETENTION_DAYS for all categories: {e}")
+        return {}
+
+
+def _serialize(row) -> str:
+    record = {}
+    for key, value in row._mapping.items():
+        record[key] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _deserialize(line: str) -> Dict[str, Any]:
+    record = json.loads(line)
+    for key in _DATETIME_COLUMNS:
+        if record.get(key):
+            record[key] = datetime.fromisoformat(record[key])
+    # Колонки, которых уже нет в схеме, не восстанавливаем
+    return {key: value for key, value in record.items() if key in news_table.columns or key in _BODY_COLUMNS}
+
+
+def _split_record(record: Dict[str, Any]):
+    """Разделяет запись архива на строку news_items и строку news_bodies"""
+    news = {key: value for key, value in record.items() if key not in _BODY_COLUMNS}
+    if news.get('summary') is None:
+        # Архивы до выноса текста в news_bodies анонса не содержат
+        news['summary'] = make_summary(record.get('content'))
+    body = {
+        'news_id': record['id'],
+        'content': record.get('content') or "",
+        'content_html': record.get('content_html')
+    }
+    return news, body
+
+
+def delete_news(db, ids: List[int], now: Optional[datetime] = None):
+    """
+    Удаляет новости с текстами и фиксирует удаление одной транзакцией
+    Клиенты /api/news/changes узнают об удалении из news_tombstones, ленты
+    других воркеров - по NOTIFY, кэши этого процесса - по NEWS_DELETED
+    """
+    if not ids:
+        return
+    changes.record_tombstones(db, ids, now)
+    db.execute(delete(bodies_table).where(bodies_table.c.news_id.in_(ids)))
+    db.execute(delete(news_table).where(news_table.c.id.in_(ids)))
+    pg_notify.notify(db, pg_notify.FEED_CHANNEL, str(os.getpid()))
+    db.commit()
+    news_events.emit(news_events.NEWS_DELETED, ids)
+
+
+class RetentionManager:
+    """Архивация устаревших новостей и восстановление из архива"""
+
+    def __init__(
+        self,
+        default_days: int = RETENTION_DAYS,
+        category_days: Optional[Dict[str, int]] = None,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        archive_dir: str = ARCHIVE_DIR
+    ):
+        self.default_days = default_days
+        self.category_days = category_ttls() if category_days is None else category_days
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir
+
+        self.runs = 0
+        self.archived = 0
+        self.restored = 0
+        self.last_run: Dict[str, Any] = {}
+
+    def ttl_for(self, category: str) -> int:
+        return self.category_days.get(category, self.default_days)
+
+    # --- Архивация ---
+
+    def archive_expired(self, now: Optional[datetime] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Архивирует и удаляет новости старше срока хранения
+        Возвращает количество заархивированных (при dry_run - подлежащих архивации) новостей по категориям
+        """
+        now = now or datetime.utcnow()
+        report: Dict[str, int] = {}
+
+        db = get_db_session()
+        try:
+            categories = [row[0] for row in db.query(NewsItem.category).distinct().all()]
+        finally:
+            db.close()
+
+        for category in categories:
+            days = self.ttl_for(category)
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            if dry_run:
+                db = get_db_session()
+                try:
+                    report[category] = db.query(NewsItem).filter(
+                        NewsItem.category == category, NewsItem.publish_date < cutoff
+                    ).count()
+                finally:
+                    db.close()
+            else:
+                report[category] = self._archive_category(category, cutoff, now)
+
+        if not dry_run:
+            db = get_db_session()
+            try:
+                purged = changes.purge_tombstones(db, now)
+                db.commit()
+            finally:
+                db.close()
+            if purged:
+                logger.info(f"Purged {purged} news tombstones older than {CHANGES_TOMBSTONE_DAYS} days")
+            self.runs += 1
+            self.archived += sum(report.values())
+            self.last_run = {"finished_at": datetime.utcnow().isoformat(), "archived": report}
+        logger.info(f"Retention {'dry run' if dry_run else 'run'}: {report}")
+        return report
+
+    def archive_older_than(self, cutoff: datetime, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Архивирует все новости с датой публикации раньше cutoff независимо от сроков категорий
+        (используется при отключении устаревших секций news_items)
+        """
+        now = now or datetime.utcnow()
+        db = get_db_session()
+        try:
+            categories = [row[0] for row in db.query(NewsItem.category).distinct().all()]
+        finally:
+            db.close()
+
+        report = {category: self._archive_category(category, cutoff, now) for category in categories}
+        self.archived += sum(report.values())
+        return report
+
+    def _archive_category(self, category: str, cutoff: datetime, now: datetime) -> int:
+        path = os.path.join(self.archive_dir, f"news_{category}_{now:%Y%m%d-%H%M%S}.jsonl.gz")
+        archived = 0
+        after_id = 0
+
+        db = get_db_session()
+        archive = None
+        try:
+            while True:
+                rows = db.execute(
+                    select(news_table, bodies_table.c.content, bodies_table.c.content_html)
+                    .select_from(news_table.outerjoin(bodies_table, bodies_table.c.news_id == news_table.c.id))
+                    .where(
+                        news_table.c.category == category,
+                        news_table.c.publish_date < cutoff,
+                        news_table.c.id > after_id
+                    )
+                    .order_by(news_table.c.id)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    break
+
+                if archive is None:
+                    os.makedirs(self.archive_dir, exist_ok=True)
+                    archive = gzip.open(path, "at", encoding="utf-8")
+
+                # Сначала пакет попадает в архив на диск, потом удаляется из базы
+                for row in rows:
+                    archive.write(_serialize(row) + "\n")
+                archive.flush()
+                os.fsync(archive.fileno())
+
+                ids = [row.id for row in rows]
+                delete_news(db, ids, now)
+
+                archived += len(ids)
+                after_id = ids[-1]
+        finally:
+            if archive is not None:
+                archive.close()
+            db.close()
+
+        if archived:
+            logger.info(f"Archived {archived} {category} news older than {cutoff:%Y-%m-%d} to {path}")
+        return archived
+
+    # --- Восстановление ---
+
+    def archive_files(self, category: Optional[str] = None) -> List[str]:
+        pattern = f"news_{category}_*.jsonl.gz" if category else "news_*.jsonl.gz"
+        return sorted(glob.glob(os.path.join(self.archive_dir, pattern)))
+
+    def _read_archive(self, paths: Iterable[str]):
+        for path in paths:
+            with gzip.open(path, "rt", encoding="utf-8") as archive:
+                for line in archive:
+                    if line.strip():
+                        yield _deserialize(line)
+
+    def restore(
+        self,
+        paths: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Dict[str, int]:
+        """
+        Возвращает в базу новости из архивов (по умолчанию - из всех файлов ARCHIVE_DIR)
+        Новости с уже существующим ID (в том числе повторы из нескольких архивов) или без источника пропускаются
+        """
+        report = {"restored": 0, "existing": 0, "missing_source": 0}
+        paths = paths or self.archive_files(category)
+
+        db = get_db_session()
+        try:
+            source_ids = {row[0] for row in db.query(NewsSource.id).all()}
+            batch: List[Dict[str, Any]] = []
+
+            def flush():
+                if not batch:
+                    return
+                existing = {
+                    row[0] for row in db.query(NewsItem.id).filter(NewsItem.id.in_([r['id'] for r in batch])).all()
+                }
+                # Новость, заархивированная повторно (после восстановления), есть в нескольких файлах
+                records, seen = [], set(existing)
+                for record in batch:
+                    if record['id'] not in seen:
+                        seen.add(record['id'])
+                        records.append(record)
+                if records:
+                    # Core insert идет мимо ORM - секции для старых месяцев создаем сами
+                    partition_manager.ensure_months(
+                        db.connection(), [month_start(record['publish_date']) for record in records]
+                    )
+                    rows = [_split_record(record) for record in records]
+                    # Восстановленные новости снова видны в /api/news/changes как измененные сейчас
+                    restored_at = datetime.utcnow()
+                    db.execute(insert(news_table), [dict(news, updated_at=restored_at) for news, _ in rows])
+                    db.execute(insert(bodies_table), [body for _, body in rows])
+                    write_legacy_bodies(db.connection(), [body for _, body in rows])
+                    changes.clear_tombstones(db, [record['id'] for record in records])
+                    pg_notify.notify(db, pg_notify.FEED_CHANNEL, str(os.getpid()))
+                    db.commit()
+                    news_events.emit(news_events.NEWS_RESTORED, [record['id'] for record in records])
+                report["restored"] += len(records)
+                report["existing"] += len(batch) - len(records)
+                batch.clear()
+
+            for record in self._read_archive(paths):
+                if category and record.get('category') != category:
+                    continue
+                publish_date = record.get('publish_date')
+                if date_from and (not publish_date or publish_date < date_from):
+                    continue
+                if date_to and (not publish_date or publish_date >= date_to):
+                    continue
+                if record.get('source_id') not in source_ids:
+                    report["missing_source"] += 1
+                    continue
+
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    flush()
+            flush()
+        finally:
+            db.close()
+
+        self.restored += report["restored"]
+        logger.info(f"Restore from {len(paths)} archive files: {report}")
+        return report
+
+    # --- Фоновая задача ---
+
+    async def run_periodically(self, interval: int = RETENTION_INTERVAL):
+        """
+        Запускает архивацию раз в interval секунд (выполняется в отдельном потоке)
+        """
+        if not RETENTION_ENABLED:
+            logger.info("Retention is disabled, not starting")
+            return
+
+        logger.info(f"Starting retention (default: {self.default_days} days, per category: {self.category_days})")
+        while True:
+            try:
+                await asyncio.to_thread(self.archive_expired)
+            except Exception as e:
+                logger.error(f"Error in retention run: {e}")
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": RETENTION_ENABLED,
+            "default_days": self.default_days,
+            "category_days": self.category_days,
+            "runs": self.runs,
+            "archived": self.archived,
+            "restored": self.restored,
+            "last_run": self.last_run
+        }
+
+
+# Глобальный экземпляр
+retention_manager = RetentionManager()
+register_metrics("retention", retention_manager.get_stats)
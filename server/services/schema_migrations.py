@@ -0,0 +1,485 @@
+"""
+Версионные миграции схемы базы данных
+
+Миграции лежат в migrations/NNN_name.py. upgrade() и downgrade() возвращают
+список шагов: SQL-строки или операции из этого модуля (add_column,
+create_index, backfill и т.д.). Примененные версии записываются в таблицу
+schema_version, поэтому каждая миграция выполняется один раз - при деплое
+командой scripts/migrate.py, а не при старте каждого воркера.
+
+Операции идемпотентны (колонка/индекс уже есть - шаг пропускается), поэтому
+миграцию, прерванную на середине, можно просто запустить повторно. Это важно
+для CREATE INDEX CONCURRENTLY и пакетных обновлений: они выполняются вне
+общей транзакции, чтобы не блокировать таблицу на время работы.
+
+Миграция может определить deferred(engine) - причину, по которой ее пока нельзя
+применять (выключена настройка, не та СУБД, не завершена раскатка). Такая
+миграция пропускается без записи в schema_version и применяется первым же
+upgrade, когда причина исчезнет; следующие за ней миграции применяются как обычно.
+"""
+import importlib.util
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'migrations')
+VERSION_TABLE = "schema_version"
+# Ключ pg_advisory_lock: одновременно миграции выполняет только один процесс
+ADVISORY_LOCK_KEY = 7_302_026
+
+_FILE_PATTERN = re.compile(r"^(\d{3})_(\w+)\.py$")
+
+
+# --- Операции ---
+
+class Operation:
+    """Шаг миграции; transactional=False - выполняется в режиме autocommit"""
+    transactional = True
+
+    def apply(self, connection: Connection):
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+
+class RawSql(Operation):
+    def __init__(self, sql: str):
+        self.sql = sql
+
+    def apply(self, connection: Connection):
+        connection.execute(text(self.sql))
+
+    def describe(self) -> str:
+        return " ".join(self.sql.split())[:80]
+
+
+class AddColumn(Operation):
+    def __init__(self, table: str, column: str, ddl: str):
+        self.table, self.column, self.ddl = table, column, ddl
+
+    def apply(self, connection: Connection):
+        columns = {column['name'] for column in inspect(connection).get_columns(self.table)}
+        if self.column in columns:
+            logger.info(f"Column {self.table}.{self.column} already exists, skipping")
+            return
+        connection.execute(text(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl}"))
+
+    def describe(self) -> str:
+        return f"add column {self.table}.{self.column}"
+
+
+class DropColumn(Operation):
+    """Удаляет одну или несколько колонок в одной транзакции (отсутствующие пропускаются)"""
+
+    def __init__(self, table: str, *columns: str):
+        self.table, self.columns = table, columns
+
+    def apply(self, connection: Connection):
+        existing = {column['name'] for column in inspect(connection).get_columns(self.table)}
+        for column in self.columns:
+            if column in existing:
+                connection.execute(text(f"ALTER TABLE {self.table} DROP COLUMN {column}"))
+
+    def describe(self) -> str:
+        return f"drop column {', '.join(f'{self.table}.{column}' for column in self.columns)}"
+
+
+class DropNotNull(Operation):
+    """
+    Снимает NOT NULL с колонки. SQLite этого не умеет - колонка пересоздается
+    через временную (ddl - ее тип) с копированием значений
+    """
+
+    def __init__(self, table: str, column: str, ddl: str):
+        self.table, self.column, self.ddl = table, column, ddl
+
+    def apply(self, connection: Connection):
+        columns = {column['name']: column for column in inspect(connection).get_columns(self.table)}
+        column = columns.get(self.column)
+        if column is None or column['nullable']:
+            logger.info(f"Column {self.table}.{self.column} is missing or already nullable, skipping")
+            return
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"ALTER TABLE {self.table} ALTER COLUMN {self.column} DROP NOT NULL"))
+            return
+
+        temporary = f"{self.column}_nullable"
+        if temporary not in columns:
+            connection.execute(text(f"ALTER TABLE {self.table} ADD COLUMN {temporary} {self.ddl}"))
+        connection.execute(text(f"UPDATE {self.table} SET {temporary} = {self.column}"))
+        connection.execute(text(f"ALTER TABLE {self.table} DROP COLUMN {self.column}"))
+        connection.execute(text(f"ALTER TABLE {self.table} RENAME COLUMN {temporary} TO {self.column}"))
+
+    def describe(self) -> str:
+        return f"drop not null {self.table}.{self.column}"
+
+
+def _relkind(connection: Connection, name: str) -> Optional[str]:
+    """Тип объекта PostgreSQL: p - секционированная таблица, I - индекс секционированной таблицы"""
+    return connection.execute(text("SELECT relkind FROM pg_class WHERE relname = :name"), {"name": name}).scalar()
+
+
+class CreateIndex(Operation):
+    """
+    Индекс без блокировки записи: на PostgreSQL - CREATE INDEX CONCURRENTLY
+    Невалидный индекс, оставшийся от прерванной сборки, пересоздается
+    """
+
+    def __init__(self, name: str, table: str, columns: List[str], unique: bool = False,
+                 where: Optional[str] = None, concurrently: bool = True):
+        self.name, self.table, self.columns = name, table, columns
+        self.unique, self.where = unique, where
+        self.transactional = not concurrently
+
+    def apply(self, connection: Connection):
+        postgres = connection.dialect.name == "postgresql"
+        concurrently = "CONCURRENTLY " if postgres and not self.transactional else ""
+        # Секционированная таблица (миграция 009) не поддерживает CONCURRENTLY
+        if concurrently and _relkind(connection, self.table) == "p":
+            concurrently = ""
+
+        if postgres:
+            valid = connection.execute(text(
+                "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"
+            ), {"name": self.name}).scalar()
+            if valid is False:
+                logger.warning(f"Index {self.name} is invalid (interrupted build), rebuilding")
+                connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {self.name}"))
+
+        unique = "UNIQUE " if self.unique else ""
+        where = f" WHERE {self.where}" if self.where else ""
+        connection.execute(text(
+            f"CREATE {unique}INDEX {concurrently}IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({', '.join(self.columns)}){where}"
+        ))
+
+    def describe(self) -> str:
+        return f"create index {self.name}"
+
+
+class DropIndex(Operation):
+    def __init__(self, name: str, concurrently: bool = True):
+        self.name = name
+        self.transactional = not concurrently
+
+    def apply(self, connection: Connection):
+        concurrently = "CONCURRENTLY " if connection.dialect.name == "postgresql" and not self.transactional else ""
+        if concurrently and _relkind(connection, self.name) == "I":
+            concurrently = ""
+        connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {self.name}"))
+
+    def describe(self) -> str:
+        return f"drop index {self.name}"
+
+
+def key_ranges(connection: Connection, table: str, key: str, batch_size: int):
+    """Диапазоны [start, end) первичного ключа таблицы по batch_size значений"""
+    bounds = connection.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).first()
+    if not bounds or bounds[0] is None:
+        return
+    low, high = bounds
+    for start in range(low, high + 1, batch_size):
+        yield start, start + batch_size
+
+
+class Backfill(Operation):
+    """
+    UPDATE большой таблицы диапазонами первичного ключа с коммитом после каждого пакета,
+    чтобы не держать долгую транзакцию и блокировки строк
+    """
+    transactional = False
+
+    def __init__(self, table: str, set_clause: str, where: Optional[str] = None,
+                 batch_size: int = 5000, pause: float = 0.0, key: str = "id"):
+        self.table, self.set_clause, self.where = table, set_clause, where
+        self.batch_size, self.pause, self.key = batch_size, pause, key
+
+    def apply(self, connection: Connection):
+        where = f" AND ({self.where})" if self.where else ""
+        updated = 0
+        # Соединение в режиме autocommit - каждый пакет фиксируется сразу
+        for start, end in key_ranges(connection, self.table, self.key, self.batch_size):
+            result = connection.execute(text(
+                f"UPDATE {self.table} SET {self.set_clause} "
+                f"WHERE {self.key} >= :start AND {self.key} < :end{where}"
+            ), {"start": start, "end": end})
+            updated += result.rowcount or 0
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(f"Backfill {self.table}: {updated} rows updated")
+
+    def describe(self) -> str:
+        return f"backfill {self.table} set {self.set_clause}"
+
+
+class BackfillWith(Operation):
+    """
+    Backfill, в котором значение колонки вычисляет функция Python от SQL-выражения
+    source по строке - чтобы заполненные строки совпадали с записанными приложением
+    """
+    transactional = False
+
+    def __init__(self, table: str, column: str, source: str, function: Callable[[Any], Any],
+                 where: Optional[str] = None, batch_size: int = 5000, pause: float = 0.0, key: str = "id"):
+        self.table, self.column, self.source, self.function = table, column, source, function
+        self.where, self.batch_size, self.pause, self.key = where, batch_size, pause, key
+
+    def apply(self, connection: Connection):
+        where = f" AND ({self.where})" if self.where else ""
+        updated = 0
+        for start, end in key_ranges(connection, self.table, self.key, self.batch_size):
+            rows = connection.execute(text(
+                f"SELECT {self.key}, {self.source} FROM {self.table} "
+                f"WHERE {self.key} >= :start AND {self.key} < :end{where}"
+            ), {"start": start, "end": end}).all()
+            if rows:
+                connection.execute(
+                    text(f"UPDATE {self.table} SET {self.column} = :value WHERE {self.key} = :key"),
+                    [{"key": row[0], "value": self.function(row[1])} for row in rows]
+                )
+            updated += len(rows)
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(f"Backfill {self.table}.{self.column}: {updated} rows updated")
+
+    def describe(self) -> str:
+        return f"backfill {self.table}.{self.column} from {self.source}"
+
+
+class CopyRows(Operation):
+    """
+    INSERT ... SELECT из большой таблицы в другую пакетами по первичному ключу источника
+    Колонки columns одноименные в обеих таблицах, key источника пишется в target_key.
+    Уже скопированные строки пропускаются; если колонок источника уже нет
+    (миграция прервалась после их удаления) - шаг пропускается
+    """
+    transactional = False
+
+    def __init__(self, source: str, target: str, columns: List[str], target_key: str,
+                 key: str = "id", batch_size: int = 5000, pause: float = 0.0):
+        self.source, self.target, self.columns = source, target, columns
+        self.target_key, self.key = target_key, key
+        self.batch_size, self.pause = batch_size, pause
+
+    def apply(self, connection: Connection):
+        existing = {column['name'] for column in inspect(connection).get_columns(self.source)}
+        missing = [column for column in self.columns if column not in existing]
+        if missing:
+            logger.info(f"Columns {self.source}.{', '.join(missing)} no longer exist, skipping copy")
+            return
+
+        columns = ", ".join(self.columns)
+        source_columns = ", ".join(f"s.{column}" for column in self.columns)
+        copied = 0
+        for start, end in key_ranges(connection, self.source, self.key, self.batch_size):
+            result = connection.execute(text(
+                f"INSERT INTO {self.target} ({self.target_key}, {columns}) "
+                f"SELECT s.{self.key}, {source_columns} FROM {self.source} s "
+                f"WHERE s.{self.key} >= :start AND s.{self.key} < :end "
+                f"AND NOT EXISTS (SELECT 1 FROM {self.target} t WHERE t.{self.target_key} = s.{self.key})"
+            ), {"start": start, "end": end})
+            copied += result.rowcount or 0
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(f"Copy {self.source} -> {self.target}: {copied} rows copied")
+
+    def describe(self) -> str:
+        return f"copy {self.source}({', '.join(self.columns)}) to {self.target}"
+
+
+class CreateAll(Operation):
+    """Создает отсутствующие таблицы и индексы по моделям db.py (базовая схема)"""
+
+    def apply(self, connection: Connection):
+        from db import Base
+        Base.metadata.create_all(bind=connection, checkfirst=True)
+
+    def describe(self) -> str:
+        return "create missing tables"
+
+
+add_column = AddColumn
+drop_column = DropColumn
+drop_not_null = DropNotNull
+create_index = CreateIndex
+drop_index = DropIndex
+backfill = Backfill
+backfill_with = BackfillWith
+copy_rows = CopyRows
+create_all = CreateAll
+
+
+# --- Раннер ---
+
+class Migration:
+    def __init__(self, version: str, name: str, path: str):
+        self.version, self.name, self.path = version, name, path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    def steps(self, direction: str) -> List[Any]:
+        function: Optional[Callable] = getattr(self.module, direction, None)
+        return list(function() or []) if function else []
+
+    def deferred(self, engine: Engine) -> Optional[str]:
+        """
+        Причина, по которой миграцию пока нельзя применять (deferred(engine) в модуле миграции);
+        отложенная миграция не записывается в schema_version и применяется при следующем upgrade
+        """
+        function: Optional[Callable] = getattr(self.module, "deferred", None)
+        return function(engine) if function else None
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILE_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    return migrations
+
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            "version VARCHAR(16) PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL, "
+            "duration_ms INTEGER)"
+        ))
+
+
+def applied_versions(engine: Engine) -> Dict[str, datetime]:
+    if not inspect(engine).has_table(VERSION_TABLE):
+        return {}
+    with engine.connect() as connection:
+        rows = connection.execute(text(f"SELECT version, applied_at FROM {VERSION_TABLE}")).all()
+    return {row[0]: row[1] for row in rows}
+
+
+def pending_migrations(engine: Engine, directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Неприменные миграции, кроме отложенных"""
+    applied = applied_versions(engine)
+    return [
+        migration for migration in discover(directory)
+        if migration.version not in applied and not migration.deferred(engine)
+    ]
+
+
+def _run_steps(engine: Engine, steps: List[Any]):
+    for step in steps:
+        if isinstance(step, str):
+            step = RawSql(step)
+        logger.info(f"  - {step.describe()}")
+        if step.transactional:
+            with engine.begin() as connection:
+                step.apply(connection)
+        else:
+            with engine.connect() as connection:
+                connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+                step.apply(connection)
+
+
+class _MigrationLock:
+    """pg_advisory_lock на время работы раннера (на SQLite не нужен - запись и так одна)"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.connection = None
+
+    def __enter__(self):
+        if self.engine.dialect.name == "postgresql":
+            self.connection = self.engine.connect()
+            self.connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.connection is not None:
+            self.connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            self.connection.close()
+
+
+def upgrade(engine: Engine, target: Optional[str] = None, directory: str = MIGRATIONS_DIR) -> List[str]:
+    """
+    Применяет неприменные миграции по порядку (до target включительно)
+    Возвращает список примененных версий
+    """
+    _ensure_version_table(engine)
+    applied = []
+    with _MigrationLock(engine):
+        applied_before = applied_versions(engine)
+        for migration in discover(directory):
+            if migration.version in applied_before:
+                continue
+            if target and migration.version > target:
+                break
+            reason = migration.deferred(engine)
+            if reason:
+                logger.info(f"Migration {migration.version}_{migration.name} deferred: {reason}")
+                continue
+            logger.info(f"Applying migration {migration.version}_{migration.name}")
+            started_at = time.monotonic()
+            _run_steps(engine, migration.steps("upgrade"))
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"INSERT INTO {VERSION_TABLE} (version, name, applied_at, duration_ms) "
+                    "VALUES (:version, :name, :applied_at, :duration_ms)"
+                ), {
+                    "version": migration.version,
+                    "name": migration.name,
+                    "applied_at": datetime.utcnow(),
+                    "duration_ms": int((time.monotonic() - started_at) * 1000)
+                })
+            applied.append(migration.version)
+    return applied
+
+
+def downgrade(engine: Engine, target: str, directory: str = MIGRATIONS_DIR) -> List[str]:
+    """
+    Откатывает примененные миграции с версиями больше target (в обратном порядке)
+    """
+    _ensure_version_table(engine)
+    reverted = []
+    with _MigrationLock(engine):
+        applied = applied_versions(engine)
+        for migration in reversed(discover(directory)):
+            if migration.version <= target or migration.version not in applied:
+                continue
+            logger.info(f"Reverting migration {migration.version}_{migration.name}")
+            _run_steps(engine, migration.steps("downgrade"))
+            with engine.begin() as connection:
+                connection.execute(text(f"DELETE FROM {VERSION_TABLE} WHERE version = :version"),
+                                   {"version": migration.version})
+            reverted.append(migration.version)
+    return reverted
+
+
+def status(engine: Engine, directory: str = MIGRATIONS_DIR) -> List[Dict[str, Any]]:
+    applied = applied_versions(engine)
+    return [
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "applied_at": applied[migration.version].isoformat() if isinstance(applied.get(migration.version), datetime)
+            else applied.get(migration.version),
+            "deferred": None if migration.version in applied else migration.deferred(engine)
+        }
+        for migration in discover(directory)
+    ]
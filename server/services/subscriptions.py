@@ -0,0 +1,109 @@
+"""
+Подписки чатов бота на категории новостей
+"""
+import logging
+from typing import List, Optional
+
+from db import get_db_session, ChatSubscription
+
+logger = logging.getLogger(__name__)
+
+# Подписка на 'all' получает новости всех категорий
+ALL_CATEGORIES = "all"
+SUBSCRIPTION_CATEGORIES = ['gifts', 'crypto', 'nft', 'tech', 'community', 'general', ALL_CATEGORIES]
+
+
+def subscribe(chat_id: int, category: str) -> bool:
+    """
+    Подписывает чат на категорию
+    Возвращает False, если подписка уже была
+    """
+    db = get_db_session()
+    try:
+        exists = db.query(ChatSubscription.id).filter(
+            ChatSubscription.chat_id == chat_id,
+            ChatSubscription.category == category
+        ).first()
+        if exists:
+            return False
+        
+        db.add(ChatSubscription(chat_id=chat_id, category=category))
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def unsubscribe(chat_id: int, category: Optional[str] = None) -> int:
+    """
+    Отписывает чат от категории (или от всех, если категория не указана)
+    Возвращает количество удаленных подписок
+    """
+    db = get_db_session()
+    try:
+        query = db.query(ChatSubscription).filter(ChatSubscription.chat_id == chat_id)
+        if category:
+            query = query.filter(ChatSubscription.category == category)
+        removed = query.delete(synchronize_session=False)
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def get_chat_subscriptions(chat_id: int) -> List[str]:
+    """
+    Список категорий, на которые подписан чат
+    """
+    db = get_db_session()
+    try:
+        rows = db.query(ChatSubscription.category).filter(
+            ChatSubscription.chat_id == chat_id
+        ).order_by(ChatSubscription.category).all()
+        return [row[0] for row in rows]
+    finally:
+        db.close()
+
+
+def remove_chats(chat_ids: List[int]) -> int:
+    """
+    Удаляет все подписки чатов (бот заблокирован или чат удален)
+    """
+    if not chat_ids:
+        return 0
+    
+    db = get_db_session()
+    try:
+        removed = db.query(ChatSubscription).filter(
+            ChatSubscription.chat_id.in_(chat_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        logger.info(f"Removed {removed} subscriptions of {len(chat_ids)} unreachable chats")
+        return removed
+    finally:
+        db.close()
+
+
+def fetch_subscriber_page(category: str, after_chat_id: Optional[int], page_size: int) -> List[int]:
+    """
+    Страница chat_id подписчиков категории (keyset-пагинация по chat_id)
+    Для конкретной категории исключаются чаты с подпиской 'all' - они получают общее сообщение
+    """
+    db = get_db_session()
+    try:
+        query = db.query(ChatSubscription.chat_id).filter(ChatSubscription.category == category)
+        
+        if category != ALL_CATEGORIES:
+            all_subscribers = db.query(ChatSubscription.chat_id).filter(
+                ChatSubscription.category == ALL_CATEGORIES
+            )
+            query = query.filter(~ChatSubscription.chat_id.in_(all_subscribers))
+        
+        if after_chat_id is not None:
+            query = query.filter(ChatSubscription.chat_id > after_chat_id)
+        
+        rows = query.order_by(ChatSubscription.chat_id).limit(page_size).all()
+        return [row[0] for row in rows]
+    finally:
+        db.close()
+
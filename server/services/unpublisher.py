@@ -0,0 +1,176 @@
+"""
+Массовое снятие новостей с публикации
+
+Новости выбираются по списку ID, источнику, категории или периоду публикации.
+Посты группируются по каналам и пачками (до 100 сообщений на вызов
+deleteMessages) удаляются из канала; поля публикации снятых новостей
+очищаются одним UPDATE на пачку.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from db import get_db_session, NewsItem
+from services.auto_publisher import auto_publisher, DELETE_MESSAGES_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+def _select_news_ids(
+    db,
+    news_ids: Optional[List[int]] = None,
+    source_id: Optional[int] = None,
+    category: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> List[int]:
+    query = db.query(NewsItem.id).filter(NewsItem.is_published_to_channel == True)
+    if news_ids:
+        query = query.filter(NewsItem.id.in_(news_ids))
+    if source_id is not None:
+        query = query.filter(NewsItem.source_id == source_id)
+    if category:
+        query = query.filter(NewsItem.category == category)
+    if date_from:
+        query = query.filter(NewsItem.published_to_channel_at >= date_from)
+    if date_to:
+        query = query.filter(NewsItem.published_to_channel_at < date_to)
+    return [row[0] for row in query.all()]
+
+
+def _collect_posts(db, news_ids: List[int]) -> List[Dict[str, Any]]:
+    """
+    Посты выбранных новостей: канал, сообщения и все новости поста
+    (дайджест - несколько новостей с общими сообщениями, их снимаем вместе)
+    """
+    rows = db.query(
+        NewsItem.id, NewsItem.telegram_chat_id, NewsItem.telegram_message_id, NewsItem.telegram_message_ids
+    ).filter(NewsItem.id.in_(news_ids)).all()
+
+    keys = {(row.telegram_chat_id, row.telegram_message_id) for row in rows if row.telegram_message_id}
+    if keys:
+        # Новости тех же постов, не попавшие под фильтр
+        shared_rows = db.query(
+            NewsItem.id, NewsItem.telegram_chat_id, NewsItem.telegram_message_id, NewsItem.telegram_message_ids
+        ).filter(
+            NewsItem.is_published_to_channel == True,
+            NewsItem.telegram_message_id.in_({message_id for _, message_id in keys})
+        ).all()
+        rows = list({row.id: row for row in list(rows) + shared_rows}.values())
+
+    posts: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        if row.telegram_message_id and (row.telegram_chat_id, row.telegram_message_id) not in keys:
+            continue
+        key = (row.telegram_chat_id, row.telegram_message_id or f"news-{row.id}")
+        post = posts.setdefault(key, {
+            'chat_id': row.telegram_chat_id,
+            'message_ids': list(row.telegram_message_ids or ([row.telegram_message_id] if row.telegram_message_id else [])),
+            'news_ids': []
+        })
+        post['news_ids'].append(row.id)
+    return list(posts.values())
+
+
+def _chunk_posts(posts: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Делит посты одного канала на пачки не больше DELETE_MESSAGES_LIMIT сообщений
+    (альбом не разрывается между пачками)
+    """
+    chunks, current, size = [], [], 0
+    for post in posts:
+        count = len(post['message_ids'])
+        if current and size + count > DELETE_MESSAGES_LIMIT:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(post)
+        size += count
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _clear_publish_fields(db, news_ids: List[int]):
+    db.query(NewsItem).filter(NewsItem.id.in_(news_ids)).update({
+        NewsItem.is_published_to_channel: False,
+        NewsItem.published_to_channel_at: None,
+        NewsItem.telegram_message_id: None,
+        NewsItem.telegram_message_ids: None,
+        NewsItem.telegram_chat_id: None
+    }, synchronize_session=False)
+    db.commit()
+
+
+def bulk_unpublish(
+    news_ids: Optional[List[int]] = None,
+    source_id: Optional[int] = None,
+    category: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Снимает с публикации новости, подходящие под фильтры
+    progress вызывается после каждой пачки с текущим отчетом
+    Возвращает отчет: сколько постов и новостей снято, какие сообщения удалить не удалось
+    """
+    if not any([news_ids, source_id is not None, category, date_from, date_to]):
+        raise ValueError("at least one filter is required")
+    
+    report = {
+        'total_posts': 0,
+        'processed_posts': 0,
+        'unpublished_news_ids': [],
+        'deleted_messages': 0,
+        'failed_message_ids': [],
+        'chunks': 0
+    }
+
+    db = get_db_session()
+    try:
+        selected_ids = _select_news_ids(db, news_ids, source_id, category, date_from, date_to)
+        if not selected_ids:
+            return report
+
+        posts = _collect_posts(db, selected_ids)
+        report['total_posts'] = len(posts)
+
+        by_chat = defaultdict(list)
+        for post in posts:
+            by_chat[post['chat_id']].append(post)
+
+        for chat_id, chat_posts in by_chat.items():
+            for chunk in _chunk_posts(chat_posts):
+                message_ids = [message_id for post in chunk for message_id in post['message_ids']]
+                try:
+                    failed_ids = set(auto_publisher.delete_channel_messages(message_ids, chat_id))
+                except Exception as e:
+                    logger.error(f"Error deleting messages in {chat_id or auto_publisher.channel_id}: {e}")
+                    failed_ids = set(message_ids)
+
+                # Снимаем только посты, удаленные полностью
+                cleared_ids = [
+                    news_id for post in chunk
+                    if not failed_ids.intersection(post['message_ids'])
+                    for news_id in post['news_ids']
+                ]
+                if cleared_ids:
+                    _clear_publish_fields(db, cleared_ids)
+
+                report['chunks'] += 1
+                report['processed_posts'] += len(chunk)
+                report['unpublished_news_ids'].extend(cleared_ids)
+                report['deleted_messages'] += len(message_ids) - len(failed_ids)
+                report['failed_message_ids'].extend(sorted(failed_ids))
+
+                logger.info(
+                    f"Unpublish progress: {report['processed_posts']}/{report['total_posts']} posts, "
+                    f"{len(report['failed_message_ids'])} failed messages"
+                )
+                if progress:
+                    progress(report)
+
+        return report
+    finally:
+        db.close()
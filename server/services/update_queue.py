@@ -0,0 +1,169 @@
+"""
+Очередь входящих обновлений Telegram с пулом асинхронных воркеров
+
+Webhook только кладет обновление в очередь и сразу отвечает 200,
+обработка (запросы к базе, отправка сообщений) идет в воркерах.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS, WEBHOOK_DEDUP_WINDOW
+from services.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних замеров держим для расчета среднего и p95
+LATENCY_SAMPLES = 1000
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+QUEUE_FULL = "full"
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с дедупликацией по update_id"""
+    
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]],
+        maxsize: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+        dedup_window: int = WEBHOOK_DEDUP_WINDOW
+    ):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers_count = max(1, workers)
+        self.dedup_window = dedup_window
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._recent_ids: deque = deque()
+        self._recent_set = set()
+        
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self._wait_times: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._process_times: deque = deque(maxlen=LATENCY_SAMPLES)
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+    
+    async def start(self):
+        """
+        Запускает воркеры (вызывается при старте приложения)
+        """
+        if self.running:
+            return
+        
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(number))
+            for number in range(self.workers_count)
+        ]
+        logger.info(f"Update queue started: {self.workers_count} workers, queue size {self.maxsize}")
+    
+    async def stop(self, timeout: float = 10):
+        """
+        Дожидается обработки очереди и останавливает воркеры
+        """
+        if not self.running:
+            return
+        
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue stopped with {self._queue.qsize()} unprocessed updates")
+        
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Update queue stopped")
+    
+    def _is_duplicate(self, update_id: Optional[int]) -> bool:
+        return update_id is not None and update_id in self._recent_set
+    
+    def _remember(self, update_id: Optional[int]):
+        if update_id is None:
+            return
+        self._recent_ids.append(update_id)
+        self._recent_set.add(update_id)
+        while len(self._recent_ids) > self.dedup_window:
+            self._recent_set.discard(self._recent_ids.popleft())
+    
+    def enqueue(self, update: Dict[str, Any]) -> str:
+        """
+        Кладет обновление в очередь без ожидания
+        Возвращает QUEUED, DUPLICATE (уже видели этот update_id) или QUEUE_FULL
+        """
+        self.received += 1
+        update_id = update.get("update_id")
+        
+        if self._is_duplicate(update_id):
+            self.duplicates += 1
+            return DUPLICATE
+        
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            # update_id не запоминаем - Telegram пришлет его повторно
+            self.rejected += 1
+            return QUEUE_FULL
+        
+        self._remember(update_id)
+        return QUEUED
+    
+    async def _worker(self, number: int):
+        while True:
+            enqueued_at, update = await self._queue.get()
+            started_at = time.monotonic()
+            self._wait_times.append(started_at - enqueued_at)
+            
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Worker {number} failed to process update {update.get('update_id')}: {e}")
+            finally:
+                self._process_times.append(time.monotonic() - started_at)
+                self._queue.task_done()
+    
+    @staticmethod
+    def _summary(samples: deque) -> Dict[str, float]:
+        if not samples:
+            return {"avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(samples)
+        return {
+            "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2)
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Текущее состояние очереди: глубина, счетчики и задержки
+        """
+        return {
+            "running": self.running,
+            "workers": self.workers_count,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.maxsize,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "wait_latency": self._summary(self._wait_times),
+            "processing_latency": self._summary(self._process_times)
+        }
+    
+    def register_metrics(self, name: str = "webhook_queue"):
+        register_metrics(name, self.get_stats)
@@ -0,0 +1,65 @@
+"""
+Общие настройки тестов: модули сервера импортируются так же, как при запуске из server/
+
+База - временный файл SQLite (DATABASE_URL задается до импорта модулей
+сервера); фикстура database создает таблицы и очищает их после теста.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TEST_DIR = tempfile.mkdtemp(prefix="server_tests_")
+# Не setdefault: фикстура database очищает таблицы, рабочая база и бот не должны подхватиться
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}",
+    "DATABASE_READ_URL": "",
+    "ARCHIVE_DIR": os.path.join(_TEST_DIR, "archive"),
+    "TOKEN": "test-token",
+    "CHANNEL_ID": "@test_channel",
+    "CACHE_BACKEND": "memory",
+})
+
+
+@pytest.fixture
+def database():
+    import db
+    db.create_tables()
+    yield db
+    with db.get_engine().begin() as connection:
+        for table in reversed(db.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def source(database):
+    session = database.SessionLocal()
+    news_source = database.NewsSource(name="Test source", url="https://example.com", source_type="rss", category="nft")
+    session.add(news_source)
+    session.commit()
+    source_id = news_source.id
+    session.close()
+    return source_id
+
+
+@pytest.fixture
+def make_news(database, source):
+    """Создает новость с текстом и возвращает ее ID"""
+    def make(title="News", category="nft", content="Text", publish_date=None, **fields):
+        session = database.SessionLocal()
+        item = database.NewsItem(
+            source_id=source, title=title, category=category,
+            link=fields.pop("link", f"https://example.com/{title}"),
+            publish_date=publish_date or datetime.utcnow(), **fields
+        )
+        item.content = content
+        session.add(item)
+        session.commit()
+        news_id = item.id
+        session.close()
+        return news_id
+    return make
@@ -0,0 +1,285 @@
+"""
+Тесты бэкендов общего кэша (services.cache): MemoryCache и RedisCache на
+встроенном сервере redislite
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.cache import MemoryCache, RedisCache, NEWS_TAG
+
+
+@pytest.fixture(scope="module")
+def redis_server(tmp_path_factory):
+    # Не importorskip: без redislite (requirements-dev.txt) половина тестов молча пропускалась бы
+    import redislite
+    server = redislite.Redis(str(tmp_path_factory.mktemp("redis") / "cache.rdb"))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def redis_client(redis_server):
+    redis_server.flushall()
+    return redis_server
+
+
+def make_memory(_):
+    return MemoryCache(max_entries=100)
+
+
+def make_redis(request):
+    return RedisCache(prefix="test:", client=request.getfixturevalue("redis_client"))
+
+
+@pytest.fixture(params=[make_memory, make_redis], ids=["memory", "redis"])
+def backend(request):
+    return request.param(request)
+
+
+class RacingClient:
+    """Клиент Redis, в котором другой процесс сбрасывает тег между WATCH и MULTI"""
+
+    def __init__(self, client, on_multi):
+        self._client = client
+        self._on_multi = on_multi
+
+    def pipeline(self, *args, **kwargs):
+        pipe = self._client.pipeline(*args, **kwargs)
+        multi = pipe.multi
+
+        def racing_multi():
+            self._on_multi()
+            multi()
+
+        pipe.multi = racing_multi
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# --- get/set и TTL ---
+
+def test_get_set_roundtrip(backend):
+    assert backend.get("page") is None
+    assert backend.set("page", {"data": [1, 2], "total": 2}, 60)
+    assert backend.get("page") == {"data": [1, 2], "total": 2}
+    assert backend.get_many(["page", "missing"]) == {"page": {"data": [1, 2], "total": 2}}
+    assert backend.hits == 2 and backend.misses == 2
+
+
+def test_entry_expires_after_ttl(backend):
+    backend.set("short", "value", 0.1)
+    backend.set("long", "value", 60)
+    time.sleep(0.25)
+    assert backend.get("short") is None
+    assert backend.get("long") == "value"
+
+
+def test_delete(backend):
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.delete("a")
+    assert backend.get("a") is None
+    assert backend.get("b") == 2
+
+
+def test_get_or_set_computes_once(backend):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "rendered"
+
+    assert backend.get_or_set("render", compute, 60, tags=(NEWS_TAG,)) == "rendered"
+    assert backend.get_or_set("render", compute, 60, tags=(NEWS_TAG,)) == "rendered"
+    assert len(calls) == 1
+
+
+def test_none_is_not_cached(backend):
+    calls = []
+
+    def compute():
+        calls.append(1)
+
+    backend.get_or_set("empty", compute, 60)
+    backend.get_or_set("empty", compute, 60)
+    assert len(calls) == 2
+
+
+def test_memory_lru_eviction():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    cache.get("a")
+    cache.set("c", 3, 60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+# --- Теги ---
+
+def test_invalidate_tags_removes_tagged_entries(backend):
+    backend.set("feed", "page", 60, tags=(NEWS_TAG,))
+    backend.set("source", "name", 60, tags=("sources",))
+    backend.invalidate_tags(NEWS_TAG)
+    assert backend.get("feed") is None
+    assert backend.get("source") == "name"
+    assert backend.tag_versions([NEWS_TAG, "sources"]) == (1, 0)
+
+
+def test_set_with_stale_versions_is_skipped(backend):
+    versions = backend.tag_versions([NEWS_TAG])
+    backend.invalidate_tags(NEWS_TAG)
+    assert not backend.set("feed", "stale", 60, tags=(NEWS_TAG,), versions=versions)
+    assert backend.get("feed") is None
+    assert backend.stale_sets == 1
+
+    assert backend.set("feed", "fresh", 60, tags=(NEWS_TAG,), versions=backend.tag_versions([NEWS_TAG]))
+    assert backend.get("feed") == "fresh"
+
+
+def test_redis_invalidation_between_watch_and_exec(redis_client):
+    """Сброс тега после проверки версий, но до EXEC: WATCH отменяет запись"""
+    other = RedisCache(prefix="test:", client=redis_client)
+    cache = RedisCache(
+        prefix="test:", client=RacingClient(redis_client, lambda: other.invalidate_tags(NEWS_TAG))
+    )
+
+    versions = cache.tag_versions([NEWS_TAG])
+    assert not cache.set("feed", "stale", 60, tags=(NEWS_TAG,), versions=versions)
+    assert cache.stale_sets == 1
+    assert other.get("feed") is None
+    assert other.tag_versions([NEWS_TAG]) == (1,)
+
+
+def test_memory_tag_sets_follow_expiry_and_eviction():
+    cache = MemoryCache(max_entries=2)
+    for i in range(5):
+        cache.set(f"feed:{i}", i, 60, tags=(NEWS_TAG, f"page:{i}"))
+    cache.set("short", 1, 0.01, tags=("short",))
+    time.sleep(0.02)
+    cache.get("short")
+    assert cache._tags == {NEWS_TAG: {"feed:4"}, "page:4": {"feed:4"}}
+
+
+# --- Блокировки ---
+
+def test_lock_excludes_other_holders(backend):
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with backend.lock("feed") as acquired:
+            assert acquired
+            holding.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(5)
+    try:
+        with backend.lock("feed", timeout=0.1) as acquired:
+            assert not acquired
+        with backend.lock("other", timeout=0.1) as acquired:
+            assert acquired
+    finally:
+        release.set()
+        thread.join()
+
+    with backend.lock("feed", timeout=0.1) as acquired:
+        assert acquired
+
+
+def test_alock_serializes_coroutines(backend):
+    active, overlaps = [], []
+
+    async def compute():
+        async with backend.alock("feed") as acquired:
+            assert acquired
+            overlaps.append(len(active))
+            active.append(1)
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def main():
+        await asyncio.gather(*[compute() for _ in range(5)])
+
+    asyncio.run(main())
+    assert overlaps == [0] * 5
+
+
+def test_alock_times_out(backend):
+    async def main():
+        async with backend.alock("feed"):
+            async def contender():
+                async with backend.alock("feed", timeout=0.1) as acquired:
+                    return acquired
+            return await contender()
+
+    assert asyncio.run(main()) is False
+
+
+def test_memory_locks_are_released():
+    cache = MemoryCache()
+
+    async def main():
+        async def compute(key):
+            async with cache.alock(key):
+                await asyncio.sleep(0.001)
+        await asyncio.gather(*[compute(f"feed:{i % 3}") for i in range(30)])
+
+    asyncio.run(main())
+    with cache.lock("feed"):
+        assert list(cache._locks) == ["feed"]
+    assert cache._locks == {} and cache._async_locks == {}
+
+
+def test_aget_or_set_coalesces_concurrent_misses(backend):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"total": 1}
+
+    async def main():
+        return await asyncio.gather(*[backend.aget_or_set("feed", compute, 60) for _ in range(10)])
+
+    assert asyncio.run(main()) == [{"total": 1}] * 10
+    assert len(calls) == 1
+    assert backend.coalesced == 9
+
+
+# --- Token bucket ---
+
+def test_take_tokens(backend):
+    assert backend.take_tokens("channel", rate=10, capacity=2) == 0
+    assert backend.take_tokens("channel", rate=10, capacity=2) == 0
+    wait = backend.take_tokens("channel", rate=10, capacity=2)
+    assert 0 < wait <= 0.1
+    assert backend.take_tokens("other", rate=10, capacity=2) == 0
+
+    time.sleep(wait + 0.02)
+    assert backend.take_tokens("channel", rate=10, capacity=2) == 0
+
+
+def test_redis_buckets_are_shared(redis_client):
+    first = RedisCache(prefix="test:", client=redis_client)
+    second = RedisCache(prefix="test:", client=redis_client)
+    assert first.take_tokens("fanout", rate=1, capacity=1) == 0
+    assert second.take_tokens("fanout", rate=1, capacity=1) > 0
+
+
+def test_redis_unavailable_degrades_to_local():
+    cache = RedisCache(url="redis://127.0.0.1:1/0", prefix="test:")
+    assert cache.get("feed") is None
+    assert not cache.set("feed", "page", 60)
+    assert cache.take_tokens("fanout", rate=1, capacity=1) == 0
+    assert cache.take_tokens("fanout", rate=1, capacity=1) > 0
+    with cache.lock("feed", timeout=0.1) as acquired:
+        assert not acquired
+    assert cache.errors >= 4
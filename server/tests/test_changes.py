@@ -0,0 +1,125 @@
+"""
+Тесты дельта-синхронизации ленты (services.changes, /api/news/changes):
+токен, новые и измененные новости, удаления, постраничная выдача и reset
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from api.news import router as news_router
+from services import changes
+from services.changes import ChangesCursor
+from services.retention import delete_news
+
+app = FastAPI()
+app.include_router(news_router, prefix="/api")
+
+
+def get_changes(**params):
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/api/news/changes", params=params)
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def settled(monkeypatch):
+    """Изменения отдаются сразу, без окна CHANGES_SETTLE_SECONDS"""
+    monkeypatch.setattr(changes, "CHANGES_SETTLE_SECONDS", 0)
+
+
+def hour_ago_token():
+    return ChangesCursor.at(datetime.utcnow() - timedelta(hours=1)).encode()
+
+
+def test_token_round_trip():
+    moment = datetime(2026, 5, 1, 12, 0)
+    cursor = ChangesCursor(moment, 7, moment + timedelta(seconds=1), 3, moment - timedelta(days=1))
+
+    decoded = ChangesCursor.decode(cursor.encode())
+
+    assert (decoded.updated_at, decoded.news_id, decoded.deleted_at, decoded.tombstone_id, decoded.known) == \
+        (cursor.updated_at, 7, cursor.deleted_at, 3, cursor.known)
+    with pytest.raises(changes.InvalidToken):
+        ChangesCursor.decode("not a token")
+
+
+def test_invalid_token_is_bad_request(database):
+    assert get_changes(since="not a token").status_code == 400
+
+
+def test_first_request_returns_only_token(make_news):
+    make_news(title="Existing")
+
+    body = get_changes().json()
+
+    assert (body["inserted"], body["updated"], body["deleted"], body["has_more"]) == ([], [], [], False)
+    assert ChangesCursor.decode(body["next"]).known <= datetime.utcnow()
+
+
+def test_inserted_updated_and_deleted(make_news, database, settled):
+    day_ago = datetime.utcnow() - timedelta(days=1)
+    # Известная клиенту новость, у которой после токена изменились просмотры
+    known = make_news(title="Known", created_at=day_ago, views_count=5)
+    removed = make_news(title="Removed", created_at=day_ago, updated_at=day_ago)
+    untouched = make_news(title="Untouched", created_at=day_ago, updated_at=day_ago)
+    token = hour_ago_token()
+    fresh = make_news(title="Fresh")
+    session = database.SessionLocal()
+    delete_news(session, [removed])
+    session.close()
+
+    body = get_changes(since=token).json()
+
+    assert [item["id"] for item in body["inserted"]] == [fresh]
+    assert body["inserted"][0]["title"] == "Fresh"
+    assert [(item["id"], item["views_count"]) for item in body["updated"]] == [(known, 5)]
+    assert body["deleted"] == [removed]
+    assert untouched not in [item["id"] for item in body["updated"]]
+    # Следующий токен продолжает с горизонта - повтор пуст
+    repeat = get_changes(since=body["next"]).json()
+    assert (repeat["inserted"], repeat["updated"], repeat["deleted"]) == ([], [], [])
+
+
+def test_recent_changes_wait_for_settle_window(make_news):
+    token = hour_ago_token()
+    make_news(title="Just saved")
+
+    assert get_changes(since=token).json()["inserted"] == []
+
+
+def test_pages_keep_new_news_inserted(make_news, settled):
+    token = hour_ago_token()
+    created = [make_news(title=f"Fresh {index}") for index in range(3)]
+
+    first = get_changes(since=token, limit=2).json()
+    second = get_changes(since=first["next"], limit=2).json()
+
+    assert first["has_more"] and not second["has_more"]
+    # Курсор known не сдвигается до последней страницы - вторая страница тоже новые новости
+    assert [item["id"] for item in first["inserted"] + second["inserted"]] == created
+    assert second["updated"] == []
+
+
+def test_category_filter(make_news, settled):
+    token = hour_ago_token()
+    make_news(title="Nft news")
+    crypto = make_news(title="Crypto news", category="crypto")
+
+    body = get_changes(since=token, category="crypto").json()
+
+    assert [item["id"] for item in body["inserted"]] == [crypto]
+
+
+def test_expired_token_requires_reset(make_news):
+    make_news(title="Existing")
+    expired = ChangesCursor.at(datetime.utcnow() - timedelta(days=changes.CHANGES_TOMBSTONE_DAYS + 1))
+
+    body = get_changes(since=expired.encode()).json()
+
+    assert body["reset"]
+    assert body["inserted"] == []
+    assert ChangesCursor.decode(body["next"]).known > expired.known
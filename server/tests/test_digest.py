@@ -0,0 +1,149 @@
+"""
+Тесты режима дайджеста (AutoPublisher, mode=digest): сколько новостей
+помещается в пост, фото вошедших новостей, учет в задаче и продолжение,
+пока в очереди остаются новости
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.auto_publisher import AutoPublisher
+from services.jobs import Job
+from services.post_renderer import MESSAGE_LIMIT, CAPTION_LIMIT
+
+
+def make_publisher(**settings):
+    settings = {"channel_id": "@digest", "mode": "digest", "digest_size": 10, "min_spacing": 0,
+                "rate_per_minute": 0, **settings}
+    return AutoPublisher(**settings)
+
+
+@pytest.fixture
+def sent_posts(monkeypatch):
+    posts = []
+
+    def send_post(self, content, media_list):
+        posts.append((content, media_list))
+        return [len(posts)]
+
+    monkeypatch.setattr(AutoPublisher, "_send_post", send_post)
+    return posts
+
+
+def published_ids(database):
+    session = database.SessionLocal()
+    try:
+        return sorted(
+            news_id for (news_id,) in
+            session.query(database.NewsItem.id).filter(database.NewsItem.is_published_to_channel == True)
+        )
+    finally:
+        session.close()
+
+
+def unpublished(publisher):
+    return publisher.get_unpublished_news(publisher.digest_size)
+
+
+def test_render_digest_stops_at_limit(make_news):
+    for index in range(10):
+        make_news(title=f"{index} " + "x" * 900)
+    publisher = make_publisher()
+    news_items = unpublished(publisher)
+
+    text, included = publisher.render_digest(news_items, MESSAGE_LIMIT)
+
+    assert len(text) <= MESSAGE_LIMIT
+    assert 1 < len(included) < len(news_items)
+    assert included == news_items[:len(included)]
+
+
+def test_render_digest_shortens_single_long_title(make_news):
+    make_news(title="y" * 3000, link="https://example.com/long")
+    publisher = make_publisher()
+
+    text, included = publisher.render_digest(unpublished(publisher), CAPTION_LIMIT)
+
+    assert len(included) == 1
+    assert len(text) <= CAPTION_LIMIT
+    assert "…" in text
+
+
+def test_digest_with_photos_uses_caption_limit(make_news, sent_posts, database):
+    for index in range(5):
+        make_news(title=f"text only {index} " + "b" * 400, publish_date=datetime.utcnow() - timedelta(minutes=index + 1))
+    make_news(title="with photo " + "a" * 400, image_url="https://example.com/1.jpg")
+    publisher = make_publisher()
+    job = Job("publish", "publish:test")
+
+    published = asyncio.run(publisher.publish_digest(unpublished(publisher), job))
+
+    content, media = sent_posts[0]
+    assert len(content) <= CAPTION_LIMIT
+    assert published < 6
+    assert media == [{"type": "photo", "url": "https://example.com/1.jpg"}]
+    # В задаче учитываются только вошедшие в пост новости
+    assert (job.queued, job.sent, job.failed) == (published, published, 0)
+    assert len(published_ids(database)) == published
+
+
+def test_late_photo_does_not_shrink_text_digest(make_news, sent_posts):
+    for index in range(6):
+        make_news(title=f"text {index} " + "c" * 900)
+    # Самая старая новость с фото в текстовый дайджест не входит
+    make_news(title="old photo", image_url="https://example.com/old.jpg", publish_date=datetime.utcnow() - timedelta(days=1))
+    publisher = make_publisher()
+
+    published = asyncio.run(publisher.publish_digest(unpublished(publisher)))
+
+    content, media = sent_posts[0]
+    assert media == []
+    assert len(content) > CAPTION_LIMIT
+    assert 1 < published < 6
+
+
+def test_failed_digest_counts_only_included_news(make_news, monkeypatch):
+    for index in range(10):
+        make_news(title=f"{index} " + "x" * 900)
+    monkeypatch.setattr(AutoPublisher, "_send_post", lambda self, content, media_list: [])
+    publisher = make_publisher()
+    news_items = unpublished(publisher)
+    job = Job("publish", "publish:test")
+
+    assert asyncio.run(publisher.publish_digest(news_items, job)) == 0
+
+    fitted = len(publisher.render_digest(news_items, MESSAGE_LIMIT)[1])
+    assert (job.queued, job.sent, job.failed) == (fitted, 0, fitted)
+
+
+def test_batch_reports_leftovers(make_news, sent_posts):
+    for index in range(5):
+        make_news(title=f"{index} " + "x" * 1500)
+    publisher = make_publisher()
+
+    published = asyncio.run(publisher.publish_batch(force=True))
+
+    # Пакет не заполнен (5 из 10), но не все новости поместились в пост
+    assert 0 < published < 5
+    assert publisher.last_batch["has_more"]
+
+
+def test_loop_publishes_leftovers_without_new_signal(make_news, sent_posts, database):
+    news_ids = [make_news(title=f"{index} " + "x" * 1500) for index in range(5)]
+    publisher = make_publisher()
+    publisher.enabled = True
+
+    async def main():
+        task = asyncio.ensure_future(publisher.start_auto_publishing())
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and published_ids(database) != sorted(news_ids):
+            await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(main())
+
+    assert published_ids(database) == sorted(news_ids)
+    assert len(sent_posts) > 1
+
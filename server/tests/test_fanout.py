@@ -0,0 +1,110 @@
+"""
+Тесты рассылки подписчикам (services.fanout): сообщения по категориям,
+повтор после 429 и отписка чатов, заблокировавших бота
+"""
+import asyncio
+
+import pytest
+
+from services import fanout, subscriptions
+from services.fanout import FanoutEngine
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def json(self, content_type=None):
+        return self.data
+
+
+class FakeSession:
+    """aiohttp.ClientSession: ответ sendMessage по chat_id из replies (по умолчанию - ok)"""
+
+    def __init__(self, replies=None, **kwargs):
+        self.replies = {chat_id: list(answers) for chat_id, answers in (replies or {}).items()}
+        self.sent = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def close(self):
+        pass
+
+    def post(self, url, json):
+        self.sent.append((json["chat_id"], json["text"]))
+        answers = self.replies.get(json["chat_id"])
+        return FakeResponse(answers.pop(0) if answers else {"ok": True})
+
+
+BLOCKED = {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+NOT_FOUND = {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+TOO_MANY = {"ok": False, "error_code": 429, "parameters": {"retry_after": 0}}
+
+
+def make_engine(**settings):
+    return FanoutEngine(**{"mode": "instant", "concurrency": 3, "rate": 1000, "page_size": 2, **settings})
+
+
+def news(title, category):
+    return {"title": title, "link": f"https://example.com/{title}", "category": category}
+
+
+@pytest.fixture
+def subscribers(database):
+    for chat_id in (1, 2, 3, 4, 5):
+        subscriptions.subscribe(chat_id, "nft")
+    subscriptions.subscribe(6, subscriptions.ALL_CATEGORIES)
+    # Подписчик 'all' получает только общее сообщение
+    subscriptions.subscribe(6, "nft")
+
+
+def test_blocked_chats_are_unsubscribed(subscribers):
+    engine = make_engine()
+    session = FakeSession({3: [BLOCKED], 4: [NOT_FOUND], 5: [TOO_MANY]})
+
+    result = asyncio.run(engine.deliver_to_category("nft", "text", session))
+
+    assert sorted(chat_id for chat_id, text in session.sent) == [1, 2, 3, 4, 5, 5]
+    assert (result.sent, result.failed, result.retried) == (3, 0, 1)
+    assert sorted(result.blocked) == [3, 4]
+    assert engine.unsubscribed == 2
+    assert subscriptions.get_chat_subscriptions(3) == []
+    assert subscriptions.get_chat_subscriptions(4) == []
+    assert subscriptions.get_chat_subscriptions(5) == ["nft"]
+
+
+def test_deliver_sends_category_and_all_messages(subscribers, monkeypatch):
+    session = FakeSession({2: [BLOCKED]})
+    monkeypatch.setattr(fanout.aiohttp, "ClientSession", lambda **kwargs: session)
+    engine = make_engine()
+
+    report = asyncio.run(engine.deliver([news("Punk", "nft"), news("Chip", "tech")]))
+
+    received = {}
+    for chat_id, text in session.sent:
+        received.setdefault(chat_id, []).append(text)
+    assert report["nft"]["sent"] == 4
+    assert report["nft"]["blocked"] == 1
+    assert report["all"]["sent"] == 1
+    assert len(received[6]) == 1
+    assert "Punk" in received[6][0] and "Chip" in received[6][0]
+    assert "Chip" not in received[1][0]
+
+
+def test_repeated_429_counts_as_failure(subscribers):
+    engine = make_engine()
+    session = FakeSession({1: [TOO_MANY] * (fanout.MAX_RETRIES + 1)})
+
+    result = asyncio.run(engine.send_to_chats([1], "text", session))
+
+    assert (result.sent, result.failed, result.retried) == (0, 1, fanout.MAX_RETRIES)
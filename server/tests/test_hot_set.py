@@ -0,0 +1,136 @@
+"""
+Тесты набора последних новостей в памяти (services.hot_set): какие запросы
+он покрывает, добавление новостей по событию и переход в неготовое состояние
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from api import news as news_api
+from services import hot_set as hot_set_module
+from services.cache import cache, NEWS_TAG, SOURCES_TAG
+from services.hot_set import HotSet
+from services.news_events import news_payload
+
+START = datetime(2026, 5, 1, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+    yield
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+
+
+@pytest.fixture
+def feed(make_news):
+    """5 новостей nft и 2 crypto, каждая следующая на час новее"""
+    news_ids = {}
+    for index in range(7):
+        category = "nft" if index < 5 else "crypto"
+        news_ids[index] = make_news(title=f"{category} {index}", category=category,
+                                    publish_date=START + timedelta(hours=index))
+    return news_ids
+
+
+def payload(database, news_id):
+    session = database.SessionLocal()
+    try:
+        return news_payload(session.get(database.NewsItem, news_id))
+    finally:
+        session.close()
+
+
+def titles(items):
+    return [item.title for item in items]
+
+
+def test_covers_only_buffered_positions(feed):
+    hot = HotSet(size=3)
+    assert hot.latest("nft", 2) is None
+    assert hot.warm()
+
+    assert titles(hot.latest("nft", 3)) == ["nft 4", "nft 3", "nft 2"]
+    assert titles(hot.latest(None, 2)) == ["crypto 6", "crypto 5"]
+    # Категория целиком в буфере - покрыт любой запрос, даже за ее концом
+    assert titles(hot.latest("crypto", 10)) == ["crypto 6", "crypto 5"]
+    assert hot._latest("crypto", 10, 5) == ([], 2)
+    # Дальше буфера в категории есть новости - в базу
+    assert hot.latest("nft", 4) is None
+    assert hot.feed_page("nft", 2, 2, 2) is None
+    assert (hot.served, hot.fallbacks) == (3, 3)
+
+
+def test_feed_page_matches_database_response(feed, monkeypatch):
+    hot = HotSet(size=3)
+    hot.warm()
+
+    hot_page = json.loads(hot.feed_page("nft", 0, 2, 1))
+    # Тот же запрос мимо набора (глобальный набор не загружен)
+    monkeypatch.setattr(news_api, "hot_set", HotSet(size=3))
+    db_page = asyncio.run(news_api.get_news(category="nft", limit=2, offset=0, page=1))
+
+    assert hot_page == db_page.model_dump(mode="json")
+    assert (hot_page["total"], hot_page["pages"]) == (5, 3)
+
+
+def test_saved_news_are_added_in_date_order(feed, make_news, database):
+    hot = HotSet(size=3)
+    hot.warm()
+    newest = make_news(title="nft newest", publish_date=START + timedelta(days=1))
+    # Сохранена позже, но опубликована раньше буфера nft
+    older = make_news(title="nft older", publish_date=START + timedelta(hours=3, minutes=30))
+
+    hot.handle_news_saved([payload(database, newest), payload(database, older)])
+    # Повторное событие о той же новости не дублирует ее
+    hot.handle_news_saved([payload(database, newest)])
+
+    assert titles(hot.latest("nft", 3)) == ["nft newest", "nft 4", "nft older"]
+    assert hot._totals["nft"] == 7
+    assert hot.added == 2
+
+
+def test_new_source_makes_set_not_ready(feed, database):
+    hot = HotSet(size=3)
+    hot.warm()
+    session = database.SessionLocal()
+    source = database.NewsSource(name="New source", url="https://new.example.com", source_type="rss")
+    session.add(source)
+    session.commit()
+    item = dict(payload(database, feed[0]), id=1000, source_id=source.id)
+    session.close()
+
+    hot.handle_news_saved([item])
+
+    assert not hot.ready
+    assert hot.latest("nft", 1) is None
+    assert hot.warm()
+    assert hot.latest("nft", 1) is not None
+
+
+def test_deletion_makes_set_not_ready(feed):
+    hot = HotSet(size=3)
+    hot.warm()
+
+    hot.handle_news_changed([feed[6]])
+
+    assert hot.latest("crypto", 1) is None
+
+
+def test_change_during_warm_is_not_applied(feed, monkeypatch):
+    hot = HotSet(size=3)
+    original_session = hot_set_module.get_db_session
+
+    def session_with_concurrent_change():
+        # Новость сохранена другим потоком, пока набор загружается
+        hot.handle_news_changed([])
+        return original_session()
+
+    monkeypatch.setattr(hot_set_module, "get_db_session", session_with_concurrent_change)
+    assert not hot.warm()
+    assert hot.latest("nft", 1) is None
+
+    monkeypatch.setattr(hot_set_module, "get_db_session", original_session)
+    assert hot.warm()
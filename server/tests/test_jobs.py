@@ -0,0 +1,139 @@
+"""
+Тесты реестра фоновых задач (services.jobs): объединение одинаковых запросов
+в одном и в разных воркерах, статус из базы, потерянные задачи и история
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from services.jobs import JobRegistry, DONE, FAILED, RUNNING
+
+
+def make_registry(**settings):
+    return JobRegistry(**{"progress_interval": 0.01, **settings})
+
+
+def test_same_key_is_coalesced(database):
+    registry = make_registry()
+    runs = []
+
+    async def run(job):
+        runs.append(job.id)
+        job.add_queued(2)
+        await asyncio.sleep(0.05)
+        job.add_sent(2)
+        return {"@channel": 2}
+
+    async def main():
+        first, created = await registry.submit("publish", "publish:all", run)
+        second, coalesced = await registry.submit("publish", "publish:all", run)
+        assert (created, coalesced) == (True, False)
+        assert second is first
+        assert await second.wait() == {"@channel": 2}
+        return first
+
+    job = asyncio.run(main())
+
+    assert len(runs) == 1
+    assert (job.status, job.requests, job.sent) == (DONE, 2, 2)
+    assert registry.get_stats() == {"submitted": 1, "coalesced": 1, "running": 0}
+
+
+def test_coalescing_and_status_across_workers(database):
+    # Два реестра с общей базой - два воркера
+    worker_a, worker_b = make_registry(), make_registry()
+    release = asyncio.Event()
+
+    async def run(job):
+        job.add_queued(3)
+        job.add_sent()
+        await release.wait()
+        job.add_sent(2)
+        return 3
+
+    async def main():
+        job, created = await worker_a.submit("publish", "publish:all", run)
+        remote, remote_created = await worker_b.submit("publish", "publish:all", run)
+        assert created and not remote_created
+        assert remote.id == job.id
+
+        await asyncio.sleep(0.05)
+        # Прогресс виден воркеру, который задачу не выполняет
+        progress = await worker_b.get(job.id)
+        assert (progress.status, progress.queued, progress.sent, progress.requests) == (RUNNING, 3, 1, 2)
+
+        release.set()
+        await job.wait()
+        return job.id
+
+    job_id = asyncio.run(main())
+
+    finished = asyncio.run(worker_b.get(job_id))
+    assert (finished.status, finished.sent, finished.result) == (DONE, 3, 3)
+    # Ключ освобожден - следующий запрос запускает новую задачу
+    next_job, created = asyncio.run(worker_b.submit("publish", "publish:all", lambda job: asyncio.sleep(0)))
+    assert created and next_job.id != job_id
+
+
+def test_remote_wait_polls_database(database, monkeypatch):
+    from services import jobs
+    monkeypatch.setattr(jobs, "PROGRESS_INTERVAL", 0.01)
+    worker_a, worker_b = make_registry(), make_registry()
+
+    async def run(job):
+        await asyncio.sleep(0.05)
+        job.add_sent(4)
+        return 4
+
+    async def main():
+        await worker_a.submit("publish", "publish:all", run)
+        remote, _ = await worker_b.submit("publish", "publish:all", run)
+        assert await remote.wait() == 4
+        return remote
+
+    remote = asyncio.run(main())
+    assert (remote.status, remote.sent) == (DONE, 4)
+
+
+def test_lost_job_releases_key(database):
+    session = database.SessionLocal()
+    session.add(database.BackgroundJob(
+        id="lost", kind="publish", key="publish:all", active_key="publish:all", status=RUNNING,
+        created_at=datetime.utcnow(), heartbeat_at=datetime.utcnow() - timedelta(minutes=5)
+    ))
+    session.commit()
+    session.close()
+    registry = make_registry(stale_after=60)
+
+    async def main():
+        job, created = await registry.submit("publish", "publish:all", lambda job: asyncio.sleep(0))
+        await job.wait()
+        return job, created
+
+    job, created = asyncio.run(main())
+
+    assert created and job.id != "lost"
+    lost = asyncio.run(registry.get("lost"))
+    assert lost.status == FAILED
+    assert lost.error
+
+
+def test_failed_job_and_history_limit(database):
+    registry = make_registry(history_size=2)
+
+    async def fail(job):
+        raise RuntimeError("bot was banned")
+
+    async def main():
+        job_ids = []
+        for index in range(4):
+            job, _ = await registry.submit("publish", f"publish:{index}", fail)
+            await job.wait()
+            job_ids.append(job.id)
+        return job_ids
+
+    job_ids = asyncio.run(main())
+
+    assert asyncio.run(registry.get(job_ids[0])) is None
+    last = asyncio.run(registry.get(job_ids[-1]))
+    assert (last.status, last.error) == (FAILED, "bot was banned")
+    assert asyncio.run(registry.get("missing")) is None
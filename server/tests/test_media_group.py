@@ -0,0 +1,92 @@
+"""
+Тесты отправки альбомов (AutoPublisher._send_media_group): разбиение на части
+по MEDIA_GROUP_LIMIT, хвост из одного медиа и удаление уже отправленных частей
+"""
+import json
+
+import pytest
+
+from services.auto_publisher import AutoPublisher, MEDIA_GROUP_LIMIT
+from services.media_registry import MediaRegistry
+
+
+def photos(count):
+    return [{"type": "photo", "url": f"https://example.com/{index}.jpg"} for index in range(count)]
+
+
+class FakeTelegram:
+    """Bot API: запоминает вызовы, выдает сообщения с растущими ID; fail_on - номер неудачного вызова"""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.next_message_id = 1
+
+    def message(self, file_id):
+        message = {"message_id": self.next_message_id, "photo": [{"file_id": file_id, "file_unique_id": file_id}]}
+        self.next_message_id += 1
+        return message
+
+    def __call__(self, publisher, method, data):
+        self.calls.append((method, data))
+        if method == "deleteMessages" or len(self.calls) == self.fail_on:
+            return True if method == "deleteMessages" else None
+        if method == "sendMediaGroup":
+            return [self.message(f"F-{entry['media']}") for entry in json.loads(data["media"])]
+        return self.message(f"F-{data['photo']}")
+
+
+@pytest.fixture
+def telegram(monkeypatch, database):
+    from services import auto_publisher
+    monkeypatch.setattr(auto_publisher, "media_registry", MediaRegistry())
+
+    def install(fail_on=None):
+        fake = FakeTelegram(fail_on)
+        monkeypatch.setattr(AutoPublisher, "_api_request", lambda self, method, data: fake(self, method, data))
+        return fake
+    return install
+
+
+def test_album_with_single_item_tail(telegram):
+    fake = telegram()
+
+    message_ids = AutoPublisher(channel_id="@test")._send_media_group("caption", photos(MEDIA_GROUP_LIMIT + 1))
+
+    assert [method for method, data in fake.calls] == ["sendMediaGroup", "sendPhoto"]
+    first_group = json.loads(fake.calls[0][1]["media"])
+    assert len(first_group) == MEDIA_GROUP_LIMIT
+    # Подпись только у первого элемента первой части
+    assert first_group[0]["caption"] == "caption"
+    assert all("caption" not in entry for entry in first_group[1:])
+    assert fake.calls[1][1]["caption"] == ""
+    assert message_ids == list(range(1, MEDIA_GROUP_LIMIT + 2))
+
+
+def test_album_split_into_groups(telegram):
+    fake = telegram()
+
+    message_ids = AutoPublisher(channel_id="@test")._send_media_group("caption", photos(MEDIA_GROUP_LIMIT + 3))
+
+    assert [method for method, data in fake.calls] == ["sendMediaGroup", "sendMediaGroup"]
+    assert len(json.loads(fake.calls[1][1]["media"])) == 3
+    assert len(message_ids) == MEDIA_GROUP_LIMIT + 3
+
+
+def test_failed_chunk_removes_sent_messages(telegram):
+    # Вторая часть не отправилась
+    fake = telegram(fail_on=2)
+
+    message_ids = AutoPublisher(channel_id="@test")._send_media_group("caption", photos(MEDIA_GROUP_LIMIT + 5))
+
+    assert message_ids == []
+    method, data = fake.calls[-1]
+    assert method == "deleteMessages"
+    assert json.loads(data["message_ids"]) == list(range(1, MEDIA_GROUP_LIMIT + 1))
+
+
+def test_failed_first_chunk_deletes_nothing(telegram):
+    fake = telegram(fail_on=1)
+
+    assert AutoPublisher(channel_id="@test")._send_media_group("caption", photos(3)) == []
+    assert [method for method, data in fake.calls] == ["sendMediaGroup"]
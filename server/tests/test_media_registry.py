@@ -0,0 +1,102 @@
+"""
+Тесты реестра file_id (services.media_registry) и повторной отправки по URL,
+когда Telegram не принимает сохраненный file_id
+"""
+import threading
+
+from services.auto_publisher import AutoPublisher
+from services.media_registry import MediaRegistry
+
+PHOTO_URL = "https://example.com/photo.jpg"
+
+
+def photo_message(file_id, message_id=1):
+    return {"message_id": message_id, "photo": [{"file_id": "small"}, {"file_id": file_id, "file_unique_id": "u"}]}
+
+
+def test_remember_and_forget(database):
+    registry = MediaRegistry()
+    assert registry.get_file_id(PHOTO_URL) is None
+
+    registry.remember(PHOTO_URL, "photo", "F1")
+    assert registry.get_file_id(PHOTO_URL) == "F1"
+    # Другой процесс читает из базы
+    assert MediaRegistry().get_file_id(PHOTO_URL) == "F1"
+
+    registry.forget(PHOTO_URL)
+    assert registry.get_file_id(PHOTO_URL) is None
+    assert MediaRegistry().get_file_id(PHOTO_URL) is None
+
+
+def test_cached_miss_expires(database):
+    registry = MediaRegistry(miss_ttl=60)
+    assert registry.get_file_id(PHOTO_URL) is None
+
+    MediaRegistry().remember(PHOTO_URL, "photo", "F1")
+    # Промах еще свежий - база не читается
+    assert registry.get_file_id(PHOTO_URL) is None
+
+    registry.miss_ttl = 0
+    assert registry.get_file_id(PHOTO_URL) == "F1"
+
+
+def test_cache_is_thread_safe(database):
+    registry = MediaRegistry(cache_size=5)
+    for index in range(10):
+        registry.remember(f"{PHOTO_URL}?{index}", "photo", f"F{index}")
+    errors = []
+
+    def worker(offset):
+        try:
+            for step in range(500):
+                url = f"{PHOTO_URL}?{(offset + step) % 10}"
+                assert registry.get_file_id(url) == f"F{(offset + step) % 10}"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(registry._cache) <= 5
+
+
+def test_stale_file_id_falls_back_to_url(database, monkeypatch):
+    from services import auto_publisher
+    registry = MediaRegistry()
+    registry.remember(PHOTO_URL, "photo", "STALE")
+    monkeypatch.setattr(auto_publisher, "media_registry", registry)
+
+    calls = []
+
+    def api_request(self, method, data):
+        calls.append(data["photo"])
+        return None if data["photo"] == "STALE" else photo_message("FRESH", message_id=7)
+
+    monkeypatch.setattr(AutoPublisher, "_api_request", api_request)
+    message_ids = AutoPublisher(channel_id="@test")._send_single("post", {"type": "photo", "url": PHOTO_URL})
+
+    assert message_ids == [7]
+    assert calls == ["STALE", PHOTO_URL]
+    assert registry.get_file_id(PHOTO_URL) == "FRESH"
+
+
+def test_known_file_id_is_sent_instead_of_url(database, monkeypatch):
+    from services import auto_publisher
+    registry = MediaRegistry()
+    registry.remember(PHOTO_URL, "photo", "F1")
+    monkeypatch.setattr(auto_publisher, "media_registry", registry)
+
+    calls = []
+
+    def api_request(self, method, data):
+        calls.append(data["photo"])
+        return photo_message("F1")
+
+    monkeypatch.setattr(AutoPublisher, "_api_request", api_request)
+    AutoPublisher(channel_id="@test")._send_single("post", {"type": "photo", "url": PHOTO_URL})
+
+    assert calls == ["F1"]
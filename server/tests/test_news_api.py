@@ -0,0 +1,73 @@
+"""
+Тесты маршрутов ленты (api.news): кэш страниц и общее вычисление
+одновременных промахов
+"""
+import asyncio
+
+import pytest
+
+from api import news as news_api
+from services.cache import cache, NEWS_TAG, SOURCES_TAG
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+    yield
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+
+
+def get_page(page=1, category=None):
+    return news_api.get_news(category=category, limit=2, offset=0, page=page)
+
+
+def test_feed_page_from_database(make_news):
+    for index in range(3):
+        make_news(title=f"n{index}")
+
+    response = asyncio.run(get_page())
+
+    assert response.total == 3
+    assert response.pages == 2
+    assert len(response.data) == 2
+    assert response.data[0].source.name == "Test source"
+
+
+def test_coalesced_waiters_survive_cancelled_starter(make_news, monkeypatch):
+    make_news(title="n0")
+    started = []
+    original_load_sources = news_api.load_sources
+
+    async def slow_load_sources(db, source_ids):
+        started.append(db)
+        await asyncio.sleep(0.1)
+        return await original_load_sources(db, source_ids)
+
+    monkeypatch.setattr(news_api, "load_sources", slow_load_sources)
+
+    async def main():
+        starter = asyncio.ensure_future(get_page(page=3))
+        await asyncio.sleep(0.02)
+        waiter = asyncio.ensure_future(get_page(page=3))
+        await asyncio.sleep(0.02)
+        # Клиент, начавший вычисление, отключился
+        starter.cancel()
+        return await waiter
+
+    response = asyncio.run(main())
+
+    assert len(started) == 1
+    assert response.total == 1
+
+
+def test_categories_and_stats(make_news):
+    make_news(title="a", category="nft")
+    make_news(title="b", category="crypto")
+    make_news(title="c", category="crypto")
+
+    categories = asyncio.run(news_api.get_categories())
+    stats = asyncio.run(news_api.get_stats())
+
+    assert sorted(categories["categories"]) == ["crypto", "nft"]
+    assert stats["total_news"] == 3
+    assert stats["categories"] == {"crypto": 2, "nft": 1}
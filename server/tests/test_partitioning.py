@@ -0,0 +1,14 @@
+"""
+Тесты секционирования news_items (services.partitioning): индексы новой
+таблицы строятся по моделям с тем же порядком колонок
+"""
+from db import NewsItem
+from services.partitioning import _index_columns
+
+
+def test_rebuild_keeps_index_order():
+    indexes = {index.name: _index_columns(index) for index in NewsItem.__table__.indexes}
+
+    # Без DESC общая лента на секциях читалась бы сортировкой, а не упорядоченным обходом
+    assert indexes["ix_news_items_publish_date"] == "publish_date DESC"
+    assert indexes["ix_news_items_category_publish_date"] == "category, publish_date"
@@ -0,0 +1,85 @@
+"""
+Тесты рендеринга поста (services.post_renderer): сокращение под лимит
+подписи или сообщения и отбраковка новостей, которые не помещаются
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from services.auto_publisher import AutoPublisher
+from services.post_renderer import render_post, PostRenderError, CAPTION_LIMIT, MESSAGE_LIMIT, DESCRIPTION_LENGTH
+
+
+def news(title="Title", content="Text", link="https://example.com/news", **fields):
+    values = {"id": 1, "category": "nft", "author": None, "reading_time": None,
+              "media": None, "image_url": None, "video_url": None, **fields}
+    return SimpleNamespace(title=title, content=content, link=link, **values)
+
+
+def test_short_post_is_unchanged():
+    text = render_post(news(title="Punks & apes", content="Floor <up>", author="Bob", reading_time=3))
+
+    assert "<b>Punks &amp; apes</b>" in text
+    assert "Floor &lt;up&gt;" in text
+    assert "Автор: Bob" in text
+    assert "3 мин" in text
+
+
+def test_description_is_limited():
+    text = render_post(news(content="a" * 1000))
+
+    assert "a" * (DESCRIPTION_LENGTH - 3) + "..." in text
+    assert "a" * DESCRIPTION_LENGTH not in text
+
+
+def test_caption_limit_shortens_description_first():
+    item = news(title="t" * 600, content="<" * 300, image_url="https://example.com/1.jpg")
+
+    text = render_post(item)
+
+    assert len(text) <= CAPTION_LIMIT
+    # Заголовок целиком, описание сокращено по экранированной длине
+    assert "t" * 600 in text
+    assert text.count("&lt;") < 300
+
+
+def test_long_title_is_shortened_when_description_is_not_enough():
+    text = render_post(news(title="t" * 5000, content=""))
+
+    assert len(text) <= MESSAGE_LIMIT
+    assert "t" * 100 in text
+    assert "...</b>" in text
+
+
+def test_unfittable_post_is_rejected():
+    # Ссылка занимает почти всю подпись - на заголовок остается меньше MIN_TITLE_LENGTH
+    item = news(link="https://example.com/" + "x" * 900, image_url="https://example.com/1.jpg")
+
+    with pytest.raises(PostRenderError):
+        render_post(item)
+
+
+@pytest.mark.parametrize("fields", [{"title": "  "}, {"link": ""}])
+def test_empty_title_or_link_is_rejected(fields):
+    with pytest.raises(PostRenderError):
+        render_post(news(**fields))
+
+
+def test_rejected_news_is_not_published(make_news, database):
+    bad = make_news(title="Bad", link="https://example.com/" + "x" * 900, image_url="https://example.com/1.jpg")
+    good = make_news(title="Good")
+    publisher = AutoPublisher(channel_id="@test")
+    session = database.SessionLocal()
+    try:
+        assert publisher.get_post_content(session, session.get(database.NewsItem, bad)) is None
+        assert publisher.get_post_content(session, session.get(database.NewsItem, good))
+    finally:
+        session.close()
+
+    session = database.SessionLocal()
+    try:
+        assert session.get(database.NewsItem, bad).post_render_error
+        assert session.get(database.NewsItem, good).post_text
+    finally:
+        session.close()
+    assert [item.id for item in publisher.get_unpublished_news()] == [good]
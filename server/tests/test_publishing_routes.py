@@ -0,0 +1,86 @@
+"""
+Тесты маршрутизации публикации по каналам (PublishingManager): первый
+подходящий маршрут, свой интервал канала и независимость конвейеров
+"""
+import asyncio
+import json
+
+from services.auto_publisher import PublishingManager
+
+ROUTES = json.dumps([
+    {"channel_id": "@crypto", "categories": ["crypto"], "interval": 1800},
+    {"channel_id": "@nft", "categories": ["nft", "gifts"], "min_spacing": 30, "limit": 2},
+    {"channel_id": "@all"},
+])
+
+
+def unpublished_ids(pipeline):
+    return sorted(item.id for item in pipeline.get_unpublished_news())
+
+
+def test_news_goes_to_first_matching_route(make_news):
+    crypto = make_news(title="btc", category="crypto")
+    nft = make_news(title="punk", category="nft")
+    tech = make_news(title="chip", category="tech")
+    manager = PublishingManager(ROUTES)
+    crypto_pipeline, nft_pipeline, all_pipeline = manager.pipelines
+
+    assert unpublished_ids(crypto_pipeline) == [crypto]
+    assert unpublished_ids(nft_pipeline) == [nft]
+    # Маршрут без фильтров получает только новости, не попавшие в предыдущие каналы
+    assert unpublished_ids(all_pipeline) == [tech]
+
+
+def test_pipeline_for_routes_by_category(make_news, database):
+    manager = PublishingManager(ROUTES)
+    session = database.SessionLocal()
+    try:
+        news = {
+            category: session.get(database.NewsItem, make_news(title=category, category=category))
+            for category in ("crypto", "gifts", "tech")
+        }
+        assert manager.pipeline_for(news["crypto"]).channel_id == "@crypto"
+        assert manager.pipeline_for(news["gifts"]).channel_id == "@nft"
+        assert manager.pipeline_for(news["tech"]).channel_id == "@all"
+    finally:
+        session.close()
+
+
+def test_route_settings_are_per_channel():
+    crypto_pipeline, nft_pipeline, all_pipeline = PublishingManager(ROUTES).pipelines
+
+    # interval маршрута - период канала, если min_spacing не задан
+    assert crypto_pipeline.interval == 1800
+    assert crypto_pipeline.min_spacing == 1800
+    assert nft_pipeline.min_spacing == 30
+    assert nft_pipeline.limit == 2
+    assert crypto_pipeline.bucket is not nft_pipeline.bucket
+
+
+def test_invalid_routes_fall_back_to_single_channel():
+    manager = PublishingManager("not json")
+    assert [pipeline.channel_id for pipeline in manager.pipelines] == ["@test_channel"]
+
+    manager = PublishingManager(json.dumps([{"categories": ["nft"]}, {"channel_id": "@ok", "unknown": 1}]))
+    assert [pipeline.channel_id for pipeline in manager.pipelines] == ["@ok"]
+
+
+def test_failing_channel_does_not_block_others(monkeypatch):
+    manager = PublishingManager(ROUTES)
+    crypto_pipeline, nft_pipeline, all_pipeline = manager.pipelines
+
+    async def broken(force=False, job=None):
+        raise RuntimeError("bot was banned")
+
+    async def slow(force=False, job=None):
+        await asyncio.sleep(0.05)
+        return 3
+
+    async def fast(force=False, job=None):
+        return 1
+
+    monkeypatch.setattr(crypto_pipeline, "publish_batch", broken)
+    monkeypatch.setattr(nft_pipeline, "publish_batch", slow)
+    monkeypatch.setattr(all_pipeline, "publish_batch", fast)
+
+    assert asyncio.run(manager.publish_all(force=True)) == {"@crypto": 0, "@nft": 3, "@all": 1}
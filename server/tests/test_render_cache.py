@@ -0,0 +1,59 @@
+"""
+Тесты кэша ответов бота (services.render_cache): повторный рендеринг только
+после событий об изменении новостей
+"""
+import pytest
+
+from bot import bot
+from services import news_events
+from services.cache import MemoryCache, cache, NEWS_TAG, SOURCES_TAG
+from services.render_cache import RenderCache
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+    yield
+    cache.invalidate_tags(NEWS_TAG, SOURCES_TAG)
+
+
+def test_rendered_once_until_invalidated():
+    render_cache = RenderCache(ttl=60, backend=MemoryCache())
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f"text {len(renders)}"
+
+    assert render_cache.get_or_render(("news", None, 5), render) == "text 1"
+    assert render_cache.get_or_render(("news", None, 5), render) == "text 1"
+    # Другой лимит - другой ключ
+    assert render_cache.get_or_render(("news", None, 10), render) == "text 2"
+
+    render_cache.invalidate()
+    assert render_cache.get_or_render(("news", None, 5), render) == "text 3"
+    assert (render_cache.hits, render_cache.misses) == (1, 3)
+
+
+def test_render_errors_are_not_cached():
+    render_cache = RenderCache(ttl=60, backend=MemoryCache())
+
+    def broken():
+        raise RuntimeError("database is down")
+
+    with pytest.raises(RuntimeError):
+        render_cache.get_or_render(("stats", None, None), broken)
+    assert render_cache.get_or_render(("stats", None, None), lambda: "stats") == "stats"
+
+
+@pytest.mark.parametrize("event", [news_events.NEWS_SAVED, news_events.NEWS_DELETED, news_events.NEWS_RESTORED])
+def test_news_events_invalidate_bot_answers(make_news, event):
+    make_news(title="First")
+    assert "First" in bot.get_news_summary()
+
+    make_news(title="Second")
+    # Без события ответ берется из кэша
+    assert "Second" not in bot.get_news_summary()
+
+    news_events.emit(event, [])
+    assert "Second" in bot.get_news_summary()
@@ -0,0 +1,110 @@
+"""
+Тесты хранения и архивации (services.retention): сроки по категориям,
+архив в JSONL.gz, записи об удалении и восстановление из архивов
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import changes
+from services.retention import RetentionManager
+
+NOW = datetime(2026, 6, 15, 12, 0)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return RetentionManager(default_days=30, category_days={"nft": 1, "tech": 0}, batch_size=2,
+                            archive_dir=str(tmp_path / "archive"))
+
+
+def ids(database):
+    session = database.SessionLocal()
+    try:
+        return sorted(row[0] for row in session.query(database.NewsItem.id))
+    finally:
+        session.close()
+
+
+def read_archive(path):
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json.loads(line) for line in archive]
+
+
+def test_archives_by_category_ttl(make_news, database, manager):
+    old_nft = [make_news(title=f"nft {index}", publish_date=NOW - timedelta(days=2)) for index in range(3)]
+    fresh_nft = make_news(title="fresh nft", publish_date=NOW - timedelta(hours=1))
+    crypto = make_news(title="crypto", category="crypto", content="Crypto body", publish_date=NOW - timedelta(days=10))
+    old_crypto = make_news(title="old crypto", category="crypto", content="Old body", publish_date=NOW - timedelta(days=40))
+    # Срок 0 - категория не архивируется
+    tech = make_news(title="tech", category="tech", publish_date=NOW - timedelta(days=400))
+
+    assert manager.archive_expired(now=NOW, dry_run=True) == {"nft": 3, "crypto": 1}
+    assert len(ids(database)) == 7
+
+    assert manager.archive_expired(now=NOW) == {"nft": 3, "crypto": 1}
+
+    assert ids(database) == sorted([fresh_nft, crypto, tech])
+    nft_file, = manager.archive_files("nft")
+    assert sorted(record["id"] for record in read_archive(nft_file)) == old_nft
+    crypto_record, = read_archive(manager.archive_files("crypto")[0])
+    assert (crypto_record["id"], crypto_record["content"]) == (old_crypto, "Old body")
+
+    # Клиенты ленты узнают об удалении
+    session = database.SessionLocal()
+    try:
+        tombstones = session.query(database.NewsTombstone.news_id).all()
+        assert sorted(row[0] for row in tombstones) == sorted(old_nft + [old_crypto])
+    finally:
+        session.close()
+
+
+def test_restore_with_filters(make_news, database, manager):
+    first = make_news(title="first", content="First body", publish_date=NOW - timedelta(days=5))
+    second = make_news(title="second", publish_date=NOW - timedelta(days=3))
+    manager.archive_expired(now=NOW)
+    assert ids(database) == []
+
+    report = manager.restore(category="nft", date_from=NOW - timedelta(days=4))
+    assert report == {"restored": 1, "existing": 0, "missing_source": 0}
+    assert ids(database) == [second]
+
+    report = manager.restore()
+    assert report == {"restored": 1, "existing": 1, "missing_source": 0}
+
+    session = database.SessionLocal()
+    try:
+        restored = session.get(database.NewsItem, first)
+        assert restored.content == "First body"
+        assert restored.summary
+        # Восстановленная новость больше не считается удаленной
+        assert session.query(database.NewsTombstone).count() == 0
+    finally:
+        session.close()
+
+
+def test_restore_skips_news_without_source(make_news, database, manager):
+    make_news(title="orphan", publish_date=NOW - timedelta(days=5))
+    manager.archive_expired(now=NOW)
+    session = database.SessionLocal()
+    session.query(database.NewsSource).delete()
+    session.commit()
+    session.close()
+
+    assert manager.restore() == {"restored": 0, "existing": 0, "missing_source": 1}
+
+
+def test_news_archived_twice_is_restored_once(make_news, database, manager):
+    news_id = make_news(title="twice", publish_date=NOW - timedelta(days=5))
+    manager.archive_expired(now=NOW)
+    # Восстановили и снова заархивировали - новость есть в двух файлах
+    manager.restore()
+    manager.archive_expired(now=NOW + timedelta(minutes=1))
+    assert len(manager.archive_files("nft")) == 2
+
+    report = manager.restore()
+
+    assert report["restored"] == 1
+    assert ids(database) == [news_id]
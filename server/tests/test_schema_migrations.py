@@ -0,0 +1,136 @@
+"""
+Тесты раннера миграций (services.schema_migrations): порядок и учет версий,
+отложенные миграции, откат и применение настоящих миграций к пустой базе
+"""
+import textwrap
+
+import pytest
+from sqlalchemy import inspect, text
+
+from db import build_engine
+from services import schema_migrations
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    """Каталог тестовых миграций; write(имя, код) добавляет миграцию"""
+    directory = tmp_path / "migrations"
+    directory.mkdir()
+
+    def write(filename, source):
+        (directory / filename).write_text(textwrap.dedent(source))
+    write.path = str(directory)
+    return write
+
+
+def columns(engine, table):
+    return {column['name'] for column in inspect(engine).get_columns(table)}
+
+
+def test_upgrade_applies_in_order_once(engine, migrations_dir):
+    migrations_dir("001_create_items.py", """
+        def upgrade():
+            return ["CREATE TABLE items (id INTEGER PRIMARY KEY)"]
+
+        def downgrade():
+            return ["DROP TABLE items"]
+    """)
+    migrations_dir("002_add_name.py", """
+        from services.schema_migrations import add_column, drop_column
+
+        def upgrade():
+            # Повтор прерванной миграции: существующая колонка пропускается
+            return [add_column('items', 'name', 'TEXT'), add_column('items', 'name', 'TEXT')]
+
+        def downgrade():
+            return [drop_column('items', 'name')]
+    """)
+    migrations_dir("not_a_migration.py", "raise RuntimeError('must not be imported')")
+
+    assert schema_migrations.upgrade(engine, target="001", directory=migrations_dir.path) == ["001"]
+    assert schema_migrations.upgrade(engine, directory=migrations_dir.path) == ["002"]
+    assert schema_migrations.upgrade(engine, directory=migrations_dir.path) == []
+    assert columns(engine, "items") == {"id", "name"}
+    assert set(schema_migrations.applied_versions(engine)) == {"001", "002"}
+
+    assert schema_migrations.downgrade(engine, "001", directory=migrations_dir.path) == ["002"]
+    assert columns(engine, "items") == {"id"}
+    assert set(schema_migrations.applied_versions(engine)) == {"001"}
+
+
+def test_deferred_migration_is_applied_when_reason_is_gone(engine, migrations_dir, monkeypatch):
+    monkeypatch.setenv("TEST_MIGRATION_READY", "")
+    migrations_dir("001_wait_for_flag.py", """
+        import os
+
+        def deferred(engine):
+            return None if os.environ["TEST_MIGRATION_READY"] else "flag is off"
+
+        def upgrade():
+            return ["CREATE TABLE flagged (id INTEGER PRIMARY KEY)"]
+    """)
+    migrations_dir("002_next.py", """
+        def upgrade():
+            return ["CREATE TABLE next_table (id INTEGER PRIMARY KEY)"]
+    """)
+
+    # Следующая миграция применяется, отложенная не записывается в schema_version
+    assert schema_migrations.upgrade(engine, directory=migrations_dir.path) == ["002"]
+    status = {row["version"]: row for row in schema_migrations.status(engine, directory=migrations_dir.path)}
+    assert status["001"]["applied_at"] is None
+    assert status["001"]["deferred"] == "flag is off"
+    assert [migration.version for migration in schema_migrations.pending_migrations(engine, migrations_dir.path)] == []
+
+    monkeypatch.setenv("TEST_MIGRATION_READY", "1")
+    assert schema_migrations.upgrade(engine, directory=migrations_dir.path) == ["001"]
+    assert inspect(engine).has_table("flagged")
+
+
+
+def test_real_migrations_on_empty_sqlite(engine):
+    applied = schema_migrations.upgrade(engine)
+
+    # Секционирование - только на PostgreSQL
+    assert applied == [migration.version for migration in schema_migrations.discover() if migration.version != "009"]
+    status = {row["version"]: row for row in schema_migrations.status(engine)}
+    assert status["009"]["deferred"] == "news_items is partitioned only on PostgreSQL"
+    assert schema_migrations.upgrade(engine) == []
+
+    # Колонок текста прошлой версии на новой базе не остается
+    assert not {"content", "content_html"} & columns(engine, "news_items")
+    indexes = {index["name"] for index in inspect(engine).get_indexes("news_items")}
+    assert {"ix_news_items_category_publish_date", "ix_news_items_updated_at", "ix_news_items_publish_date"} <= indexes
+
+
+def test_body_columns_dropped_only_after_dual_write(engine, monkeypatch):
+    import config
+    schema_migrations.upgrade(engine)
+    # Состояние раскатки: колонки текста есть, воркер прошлой версии сохранил новость только в них
+    schema_migrations.downgrade(engine, "010")
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO news_sources (id, name, url, source_type, is_active) VALUES (1, 's', 'https://s', 'rss', 1)"))
+        connection.execute(text(
+            "INSERT INTO news_items (id, source_id, title, link, publish_date, category, content) "
+            "VALUES (1, 1, 'Old worker', 'https://s/1', '2026-01-01', 'nft', 'Body from the old version')"
+        ))
+
+    monkeypatch.setattr(config, "NEWS_BODY_DUAL_WRITE", True)
+    assert "011" not in schema_migrations.upgrade(engine)
+    status = {row["version"]: row for row in schema_migrations.status(engine)}
+    assert "NEWS_BODY_DUAL_WRITE" in status["011"]["deferred"]
+    assert {"content", "content_html"} <= columns(engine, "news_items")
+
+    monkeypatch.setattr(config, "NEWS_BODY_DUAL_WRITE", False)
+    assert schema_migrations.upgrade(engine) == ["011"]
+    assert not {"content", "content_html"} & columns(engine, "news_items")
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT content FROM news_bodies WHERE news_id = 1")).scalar() == \
+            "Body from the old version"
+        assert connection.execute(text("SELECT summary FROM news_items WHERE id = 1")).scalar()
@@ -0,0 +1,91 @@
+"""
+Тесты ручной публикации и снятия публикации через API (асинхронная сессия
+маршрута, публикация в потоке со своей сессией)
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from api.news import router as news_router
+from api.telegram import router as telegram_router
+from services.auto_publisher import AutoPublisher
+
+app = FastAPI()
+app.include_router(news_router, prefix="/api")
+app.include_router(telegram_router)
+
+
+def request(method, url):
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.request(method, url)
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def sent_posts(monkeypatch):
+    posts = []
+
+    def send_post(self, content, media_list):
+        posts.append((self.channel_id, content))
+        return [100 + len(posts)]
+
+    monkeypatch.setattr(AutoPublisher, "_send_post", send_post)
+    return posts
+
+
+def load(database, news_id):
+    session = database.SessionLocal()
+    try:
+        return session.get(database.NewsItem, news_id)
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("url", ["/telegram/publish-specific/{id}", "/api/news/{id}/publish"])
+def test_publish_specific_news(database, make_news, sent_posts, url):
+    news_id = make_news(title="Fresh", content="Body of the news")
+
+    response = request("POST", url.format(id=news_id))
+
+    assert response.status_code == 200
+    assert response.json()["telegram_message_id"] == 101
+    assert sent_posts[0][0] == "@test_channel"
+    assert "Fresh" in sent_posts[0][1]
+    news = load(database, news_id)
+    assert news.is_published_to_channel
+    assert news.telegram_message_ids == [101]
+    assert news.post_text
+
+    # Повторная публикация ничего не отправляет
+    response = request("POST", url.format(id=news_id))
+    assert response.status_code == 200
+    assert response.json()["telegram_message_id"] == 101
+    assert len(sent_posts) == 1
+
+
+@pytest.mark.parametrize("url", ["/telegram/publish-specific/{id}", "/api/news/{id}/publish"])
+def test_publish_missing_news(database, url):
+    assert request("POST", url.format(id=999)).status_code == 404
+
+
+def test_unpublish_news(database, make_news, sent_posts, monkeypatch):
+    news_id = make_news(title="Fresh")
+    request("POST", f"/telegram/publish-specific/{news_id}")
+    deleted = []
+    monkeypatch.setattr(
+        AutoPublisher, "delete_channel_messages",
+        lambda self, message_ids, chat_id=None: deleted.extend(message_ids) or []
+    )
+
+    response = request("DELETE", f"/telegram/unpublish/{news_id}")
+
+    assert response.status_code == 200
+    assert response.json()["unpublished_news_ids"] == [news_id]
+    assert deleted == [101]
+    assert not load(database, news_id).is_published_to_channel
+
+    assert request("DELETE", f"/telegram/unpublish/{news_id}").status_code == 400
+    assert request("DELETE", "/telegram/unpublish/999").status_code == 404
@@ -0,0 +1,110 @@
+"""
+Тесты массового снятия с публикации (services.unpublisher): выбор по фильтрам,
+дайджесты целиком, пачки deleteMessages и частичные ошибки удаления
+"""
+from datetime import datetime
+
+import pytest
+
+from services import unpublisher
+from services.unpublisher import bulk_unpublish
+
+
+def publish(database, news_ids, message_ids, chat_id="@test_channel"):
+    """Помечает новости опубликованными одним постом"""
+    session = database.SessionLocal()
+    try:
+        session.query(database.NewsItem).filter(database.NewsItem.id.in_(news_ids)).update({
+            database.NewsItem.is_published_to_channel: True,
+            database.NewsItem.published_to_channel_at: datetime.utcnow(),
+            database.NewsItem.telegram_message_id: message_ids[0],
+            database.NewsItem.telegram_message_ids: message_ids,
+            database.NewsItem.telegram_chat_id: chat_id
+        }, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+
+def published_ids(database):
+    session = database.SessionLocal()
+    try:
+        rows = session.query(database.NewsItem.id).filter(database.NewsItem.is_published_to_channel == True)
+        return sorted(row[0] for row in rows)
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def deletions(monkeypatch):
+    """Вызовы deleteMessages; сообщения из failing удалить не удается"""
+    calls = []
+    failing = set()
+
+    def delete_channel_messages(message_ids, chat_id=None):
+        calls.append((chat_id, list(message_ids)))
+        return [message_id for message_id in message_ids if message_id in failing]
+
+    monkeypatch.setattr(unpublisher.auto_publisher, "delete_channel_messages", delete_channel_messages)
+    return calls, failing
+
+
+def test_digest_is_unpublished_with_all_its_news(make_news, database, deletions):
+    calls, _ = deletions
+    first, second, other = make_news(title="a"), make_news(title="b"), make_news(title="c")
+    publish(database, [first, second], [10])
+    publish(database, [other], [11])
+
+    report = bulk_unpublish(news_ids=[first])
+
+    assert sorted(report["unpublished_news_ids"]) == [first, second]
+    assert calls == [("@test_channel", [10])]
+    assert published_ids(database) == [other]
+
+
+def test_albums_are_not_split_between_chunks(make_news, database, deletions):
+    calls, _ = deletions
+    news_ids = [make_news(title=f"album {index}", category="crypto") for index in range(3)]
+    for index, news_id in enumerate(news_ids):
+        publish(database, [news_id], list(range(index * 100, index * 100 + 40)))
+    progress = []
+
+    report = bulk_unpublish(category="crypto", progress=lambda report: progress.append(report["processed_posts"]))
+
+    # 40 + 40 помещаются в пачку из 100 сообщений, третий альбом - в следующую
+    assert [len(message_ids) for chat_id, message_ids in calls] == [80, 40]
+    assert (report["total_posts"], report["chunks"], report["deleted_messages"]) == (3, 2, 120)
+    assert progress == [2, 3]
+    assert published_ids(database) == []
+
+
+def test_failed_post_stays_published(make_news, database, deletions):
+    _, failing = deletions
+    kept, removed = make_news(title="kept"), make_news(title="removed")
+    publish(database, [kept], [20, 21])
+    publish(database, [removed], [22])
+    failing.add(21)
+
+    report = bulk_unpublish(news_ids=[kept, removed])
+
+    assert report["unpublished_news_ids"] == [removed]
+    assert report["failed_message_ids"] == [21]
+    assert report["deleted_messages"] == 2
+    assert published_ids(database) == [kept]
+
+
+def test_posts_grouped_by_channel(make_news, database, deletions):
+    calls, _ = deletions
+    first, second = make_news(title="a", category="tech"), make_news(title="b", category="tech")
+    publish(database, [first], [1], chat_id="@one")
+    publish(database, [second], [1], chat_id="@two")
+
+    report = bulk_unpublish(category="tech")
+
+    assert sorted(calls) == [("@one", [1]), ("@two", [1])]
+    assert sorted(report["unpublished_news_ids"]) == [first, second]
+
+
+def test_filter_is_required(database):
+    with pytest.raises(ValueError):
+        bulk_unpublish()
@@ -0,0 +1,96 @@
+"""
+Тесты очереди обновлений Telegram (services.update_queue) и webhook:
+дедупликация по update_id, отказ при переполнении и ответ 503
+"""
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from api import telegram as telegram_api
+from services.update_queue import UpdateQueue, QUEUED, DUPLICATE, QUEUE_FULL
+
+
+def test_duplicate_updates_are_processed_once():
+    handled = []
+
+    async def handler(update):
+        handled.append(update["update_id"])
+
+    async def main():
+        queue = UpdateQueue(handler, maxsize=10, workers=2, dedup_window=3)
+        await queue.start()
+        statuses = [queue.enqueue({"update_id": update_id}) for update_id in (1, 2, 1, 3, 2)]
+        await queue.stop()
+        return queue, statuses
+
+    queue, statuses = asyncio.run(main())
+
+    assert statuses == [QUEUED, QUEUED, DUPLICATE, QUEUED, DUPLICATE]
+    assert sorted(handled) == [1, 2, 3]
+    assert (queue.duplicates, queue.processed) == (2, 3)
+
+
+def test_dedup_window_forgets_old_ids():
+    async def main():
+        queue = UpdateQueue(lambda update: asyncio.sleep(0), maxsize=10, workers=1, dedup_window=2)
+        await queue.start()
+        statuses = [queue.enqueue({"update_id": update_id}) for update_id in (1, 2, 3, 1)]
+        await queue.stop()
+        return statuses
+
+    # Окно из двух последних ID: 1 уже вытеснен
+    assert asyncio.run(main()) == [QUEUED] * 4
+
+
+def test_full_queue_rejects_without_remembering_id():
+    release = asyncio.Event()
+
+    async def handler(update):
+        await release.wait()
+
+    async def main():
+        queue = UpdateQueue(handler, maxsize=1, workers=1)
+        await queue.start()
+        first = queue.enqueue({"update_id": 1})
+        await asyncio.sleep(0)  # воркер забрал первое обновление и ждет
+        second = queue.enqueue({"update_id": 2})
+        rejected = queue.enqueue({"update_id": 3})
+        release.set()
+        await asyncio.sleep(0.01)
+        # Отклоненное обновление принимается при повторной доставке
+        retried = queue.enqueue({"update_id": 3})
+        await queue.stop()
+        return queue, [first, second, rejected, retried]
+
+    queue, statuses = asyncio.run(main())
+
+    assert statuses == [QUEUED, QUEUED, QUEUE_FULL, QUEUED]
+    assert (queue.rejected, queue.processed) == (1, 3)
+
+
+def test_webhook_answers_503_when_queue_is_full(monkeypatch):
+    release = asyncio.Event()
+
+    async def handler(update):
+        await release.wait()
+
+    queue = UpdateQueue(handler, maxsize=1, workers=1)
+    monkeypatch.setattr(telegram_api, "update_queue", queue)
+    app = FastAPI()
+    app.include_router(telegram_api.router)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            responses = []
+            for update_id in (1, 2, 3):
+                responses.append(await client.post("/telegram/webhook", json={"update_id": update_id}))
+                await asyncio.sleep(0)
+            release.set()
+            await queue.stop()
+            return responses
+
+    responses = asyncio.run(main())
+
+    assert [response.status_code for response in responses] == [200, 200, 503]
+    assert responses[2].json() == {"status": "busy"}
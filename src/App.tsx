@@ -7,6 +7,7 @@ import NewsModal from './components/NewsModal';
 import { useNews } from './hooks/useNews';
 import { CATEGORIES } from './constants';
 import { NewsItem } from './types';
+import { fetchNewsById } from './api/news';
 import TelegramWebApp from './telegram/TelegramWebApp';
 
 const AppContainer = styled.div`
@@ -119,6 +120,13 @@ const App: React.FC = () => {
   const handleNewsClick = (newsItem: NewsItem) => {
     setSelectedNews(newsItem);
     TelegramWebApp.triggerHapticFeedback('impact');
+
+    // В ленте приходит только анонс - полный текст и HTML загружаем для карточки
+    fetchNewsById(newsItem.id)
+      .then(fullNews => setSelectedNews(current =>
+        current && current.id === fullNews.id ? { ...current, ...fullNews } : current
+      ))
+      .catch(error => console.error('Не удалось загрузить полный текст новости:', error));
     
     // Логируем API запрос для получения данных новости
     console.log('=== API ЗАПРОС ДЛЯ НОВОСТИ ===');